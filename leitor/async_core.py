@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Núcleo asyncio do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Um único event loop para leitura do leitor, fila e banco.
+A leitura usa o leitor assíncrono do evdev, os trabalhos passam por uma
+asyncio.Queue e o acesso ao banco roda em um executor limitado.
+
+Dispositivo e banco são injetáveis, o que permite testar com falsos:
+
+- dispositivo: objeto com async_read_loop() que produz eventos com
+  os atributos type, code e value (como evdev.InputEvent)
+- banco: objeto com connect() -> bool e process_job(job) -> bool
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from input_decoder import EV_KEY, KeyDecoder
+from journal import new_job_id
+from retry import ERROR_UNEXPECTED
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceDatabase:
+    """Adaptador de banco que delega ao StockflowQRService (MySQL)"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def connect(self):
+        return self.service.setup_database_pool()
+
+    def process_job(self, job):
+        return self.service.process_job(job)
+
+    def check_health(self, idle_after):
+        return self.service.check_database_health(idle_after)
+
+
+class AsyncServiceCore:
+    """Executa leitura, fila e banco em um único event loop"""
+
+    def __init__(self, service, device=None, db=None):
+        self.service = service
+        self.device = device
+        self.db = db or ServiceDatabase(service)
+        self.db_workers = service.settings.get('async_db_workers', 1)
+
+        self.loop = None
+        self.queue = None
+        self.db_ready = None
+        self.db_lost = None
+        self.stopping = None
+        self.executor = None
+        self.tasks = []
+
+    def run(self):
+        """Executa o núcleo até o serviço ser encerrado"""
+        asyncio.run(self.main())
+
+    async def main(self):
+        """Cria as tarefas de entrada, processamento e reconexão"""
+        loop = self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.db_ready = asyncio.Event()
+        self.db_lost = asyncio.Event()
+        self.stopping = asyncio.Event()
+        # Executor limitado: no máximo db_workers chamadas bloqueantes ao banco
+        self.executor = ThreadPoolExecutor(max_workers=self.db_workers, thread_name_prefix='stockflow-db')
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        # Backlog carregado por load_pending_jobs: no outbox apenas a primeira página; o restante
+        # vem por refill() à medida que os consumidores esvaziam a fila
+        with self.service.queue_condition:
+            while self.service.job_queue:
+                self.queue.put_nowait(self.service.job_queue.popleft())
+            # Novas tentativas agendadas antes do reinício mantêm o horário
+            self.schedule_jobs(self.service.retry_scheduler.pop_all())
+            # Novos trabalhos (leitor e API de ingestão) passam a ir para a fila do event loop
+            self.service.job_sink = self
+
+        if self.service.db_connected:
+            self.db_ready.set()
+        else:
+            self.db_lost.set()
+
+        self.tasks = [asyncio.create_task(self.reconnect_worker()), asyncio.create_task(self.health_worker())]
+        self.tasks += [asyncio.create_task(self.consumer()) for _ in range(self.db_workers)]
+        self.tasks.append(asyncio.create_task(self.input_reader()))
+
+        logger.info("Núcleo asyncio iniciado. Aguardando leituras de QR Code...")
+        await self.stopping.wait()
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.service.job_sink = None
+        self.executor.shutdown(wait=True)
+        logger.info("Núcleo asyncio encerrado")
+
+    def stop(self):
+        """Solicita o encerramento do event loop"""
+        self.service.running = False
+        if self.stopping:
+            self.stopping.set()
+
+    async def enqueue(self, product_id, store_key=None):
+        """Registra o trabalho no journal e o entrega aos consumidores"""
+        if not self.service.claim_scan(product_id):
+            logger.info(f"Leitura duplicada de '{product_id}' descartada")
+            return
+        job = {
+            'job_id': new_job_id(),
+            'product_id': product_id,
+            'timestamp': datetime.now().isoformat(),
+            'attempts': 0,
+            'store_key': store_key or self.service.store_key
+        }
+        if self.service.persist_job('enqueue', job):
+            self.queue.put_nowait(job)
+        else:
+            # Fila em memória cheia: o trabalho aguarda no outbox até refill()
+            self.service.track_active_product(product_id, -1)
+        logger.info(f"Produto '{product_id}' adicionado à fila")
+
+    def queued_count(self):
+        """Trabalhos na fila do event loop (usado pelo outbox para limitar a memória)"""
+        return self.queue.qsize()
+
+    def deliver(self, jobs):
+        """Entrega aos consumidores trabalhos já gravados no journal (chamado de outra thread)"""
+        self.loop.call_soon_threadsafe(self.put_jobs, jobs)
+
+    def put_jobs(self, jobs):
+        for job in jobs:
+            self.queue.put_nowait(job)
+
+    def schedule_jobs(self, jobs):
+        """Coloca na fila os trabalhos vencidos e agenda os demais para o horário da nova tentativa"""
+        loop_now, wall_now = self.loop.time(), time.time()
+        for job in jobs:
+            next_attempt = job.get('next_attempt', 0)
+            if next_attempt > wall_now:
+                self.loop.call_at(loop_now + next_attempt - wall_now, self.queue.put_nowait, job)
+            else:
+                self.queue.put_nowait(job)
+
+    def refill(self):
+        """Traz do outbox a próxima página quando a fila cai abaixo da metade de outbox_memory_jobs"""
+        limit = self.service.settings['outbox_memory_jobs']
+        if self.service.journal is None or self.queue.qsize() > limit // 2:
+            return
+        with self.service.queue_condition:
+            jobs = self.service.journal.load_more(limit - self.queue.qsize())
+            for job in jobs:
+                self.service.track_active_product(job['product_id'], 1)
+        self.schedule_jobs(jobs)
+
+    async def input_reader(self):
+        """Lê o leitor de forma assíncrona e monta os códigos até o ENTER"""
+        loop = asyncio.get_running_loop()
+        while not self.stopping.is_set():
+            device = self.device
+            if device is None:
+                device = await loop.run_in_executor(None, self.service.find_qr_device)
+                if device is None:
+                    logger.warning("Dispositivo de entrada não encontrado. Tentando novamente em 10s...")
+                    await asyncio.sleep(10)
+                    continue
+                logger.info(f"Dispositivo conectado com sucesso: {device.name}")
+
+            decoder = KeyDecoder()
+            try:
+                async for event in device.async_read_loop():
+                    if event.type != EV_KEY:
+                        continue
+                    code = decoder.feed_key(event.code, event.value)
+                    if code is None:
+                        continue
+                    product_id = code.strip()
+                    if not product_id:
+                        continue
+                    logger.info(f"QR Code lido: {product_id}")
+                    with self.service.stage_timers.stage('enqueue'):
+                        if not self.service.validate_product_id(product_id):
+                            logger.error(f"QR Code inválido: {product_id}")
+                        else:
+                            store_key = self.service.store_for_device(device)
+                            if self.service.is_known_product(product_id, store_key):
+                                await self.enqueue(product_id, store_key)
+                # Fim do fluxo (dispositivo falso esgotado)
+                if self.device is not None:
+                    return
+            except OSError as e:
+                logger.error(f"Dispositivo de entrada desconectado: {e}")
+                self.device = None
+                await asyncio.sleep(5)
+
+    async def consumer(self):
+        """Consome trabalhos da fila executando o banco no executor limitado"""
+        loop = asyncio.get_running_loop()
+        while True:
+            self.refill()
+            job = await self.queue.get()
+            try:
+                await self.db_ready.wait()
+                logger.info(f"Processando job: {job['product_id']}")
+                success = await loop.run_in_executor(self.executor, self.db.process_job, job)
+                if not self.service.db_connected:
+                    self.mark_db_lost()
+                self.handle_result(job, success)
+            finally:
+                self.queue.task_done()
+
+    def handle_result(self, job, success):
+        """Confirma o trabalho ou agenda nova tentativa (backoff por classe de erro) sem bloquear o loop"""
+        if success:
+            self.service.persist_job('ack', job)
+            self.service.record_job_result(job, 'committed')
+            return
+
+        error = job.pop('error', None) or ERROR_UNEXPECTED
+        detail = job.pop('error_detail', None)
+        delay, max_attempts = self.service.next_retry_delay(job, error)
+        if delay is not None:
+            self.service.persist_job('retry', job)
+            self.service.record_job_result(job, 'retried')
+            asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, job)
+            logger.warning(f"Nova tentativa de {job['product_id']} em {delay:.1f}s "
+                           f"({error}, tentativa {job['attempts']}/{max_attempts})")
+        else:
+            self.service.discard_job(job, error, detail)
+
+    def mark_db_lost(self):
+        """Pausa os consumidores e acorda a tarefa de reconexão"""
+        self.db_ready.clear()
+        self.db_lost.set()
+
+    async def reconnect_worker(self):
+        """Reconecta ao banco com backoff curto, que volta ao mínimo na primeira reconexão"""
+        loop = asyncio.get_running_loop()
+        max_backoff = self.service.settings.get('db_reconnect_max_backoff', 1.0)
+        min_backoff = min(0.1, max_backoff)
+        backoff_time = min_backoff
+        while True:
+            await self.db_lost.wait()
+            await asyncio.sleep(backoff_time)
+
+            if await loop.run_in_executor(self.executor, self.db.connect):
+                logger.info("Reconexão com banco bem-sucedida")
+                backoff_time = min_backoff
+                self.db_lost.clear()
+                self.db_ready.set()
+            else:
+                backoff_time = min(backoff_time * 2, max_backoff)
+
+    async def health_worker(self):
+        """Pinga o servidor e as conexões ociosas enquanto conectado, detectando quedas antes da próxima leitura"""
+        loop = asyncio.get_running_loop()
+        interval = self.service.settings.get('db_health_interval', 1.0)
+        if not interval or not hasattr(self.db, 'check_health'):
+            return
+        while True:
+            await asyncio.sleep(interval)
+            if self.db_lost.is_set():
+                continue
+            if not await loop.run_in_executor(self.executor, self.db.check_health, interval):
+                self.mark_db_lost()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark do decodificador de eventos do leitor QR Code
+Compara o caminho por evento (InputEvent do python-evdev + KeyDecoder) com o
+decodificador bruto em bloco (struct.iter_unpack + tabela pré-calculada)
+
+Uso: python3 benchmarks/bench_decoder.py [--codes 20000] [--length 32]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_decoder import INPUT_EVENT, EV_KEY, KEY_CHARS, KEY_ENTER, KeyDecoder, RawKeyDecoder
+
+# Eventos de sincronização emitidos pelo kernel entre as teclas
+EV_SYN = 0x00
+EV_MSC = 0x04
+
+
+def build_stream(codes, length):
+    """Gera o fluxo bruto de input_events de vários códigos lidos"""
+    key_codes = list(KEY_CHARS)
+    chunks = []
+    expected = []
+    for i in range(codes):
+        code = [key_codes[(i * 7 + j) % len(key_codes)] for j in range(length)]
+        expected.append(''.join(KEY_CHARS[c] for c in code))
+        for key in code + [KEY_ENTER]:
+            for value in (1, 0):
+                chunks.append(INPUT_EVENT.pack(0, 0, EV_MSC, 4, 0x70000 + key))
+                chunks.append(INPUT_EVENT.pack(0, 0, EV_KEY, key, value))
+                chunks.append(INPUT_EVENT.pack(0, 0, EV_SYN, 0, 0))
+    return b''.join(chunks), expected
+
+
+def bench_raw(data):
+    """Decodificador bruto, lendo em blocos de 256 eventos como em os.read"""
+    decoder = RawKeyDecoder()
+    block = INPUT_EVENT.size * 256
+    result = []
+    started = time.perf_counter()
+    for offset in range(0, len(data), block):
+        result.extend(decoder.feed(data[offset:offset + block]))
+    return time.perf_counter() - started, result
+
+
+def bench_evdev(data):
+    """Caminho por evento de monitor_input_events: objetos do python-evdev e KeyDecoder"""
+    from evdev import InputEvent, ecodes
+
+    # python-evdev cria um InputEvent por evento lido; a conversão entra na medição
+    raw_events = list(INPUT_EVENT.iter_unpack(data))
+    decoder = KeyDecoder()
+    result = []
+    started = time.perf_counter()
+    for sec, usec, ev_type, code, value in raw_events:
+        event = InputEvent(sec, usec, ev_type, code, value)
+        if event.type == ecodes.EV_KEY:
+            completed = decoder.feed_key(event.code, event.value)
+            if completed:
+                result.append(completed)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=20000, help='quantidade de códigos lidos')
+    parser.add_argument('--length', type=int, default=32, help='caracteres por código')
+    args = parser.parse_args()
+
+    data, expected = build_stream(args.codes, args.length)
+    events = len(data) // INPUT_EVENT.size
+    print(f"{args.codes} códigos de {args.length} caracteres ({events} eventos)")
+
+    elapsed, result = bench_raw(data)
+    assert result == expected, "decodificador bruto divergiu do esperado"
+    print(f"  bruto (struct.iter_unpack): {elapsed * 1000:8.1f} ms  {events / elapsed:12.0f} eventos/s")
+
+    try:
+        legacy_elapsed, legacy_result = bench_evdev(data)
+    except ImportError:
+        print("  evdev (KeyDecoder):         indisponível (pip install evdev)")
+        return
+    assert legacy_result == expected, "caminho evdev divergiu do esperado"
+    print(f"  evdev (KeyDecoder):         {legacy_elapsed * 1000:8.1f} ms  {events / legacy_elapsed:12.0f} eventos/s")
+    print(f"  ganho: {legacy_elapsed / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
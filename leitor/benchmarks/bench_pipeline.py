@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark do pipeline completo do Stockflow QR Reader
+Leitores sintéticos entregam códigos a handle_scanned_code (validação,
+duplicatas, journal, fila) e os workers reais os processam contra o banco
+simulado de benchmarks/fakedb.py, com latência e falhas injetáveis, ou
+contra um banco SQLite real (--backend sqlite) povoado com os produtos.
+
+Formatos de carga (--shape):
+- steady: leituras espaçadas igualmente a --rate por segundo
+- burst: rajadas de --burst leituras seguidas, na mesma taxa média
+- ramp: taxa crescendo linearmente de 0 a 2x --rate
+
+Relata vazão, latência leitura-commit (p50/p99), fsyncs do journal e bytes
+escritos pelo processo por leitura (com --backend sqlite inclui o banco) e
+crescimento de memória. Com --json a saída é um objeto JSON, e --output
+acrescenta o resultado (uma linha JSON) a um arquivo para comparar versões.
+
+Uso: python3 benchmarks/bench_pipeline.py [--scans 2000] [--rate 200]
+     [--shape steady|burst|ramp] [--scanners 2] [--latency 2] [--failure-rate 0]
+     [--workers 1] [--batch-size 1] [--backend fake|sqlite] [--queue-store journal|outbox]
+     [--json] [--output resultados.jsonl]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import journal
+from leitor import StockflowQRService
+
+
+class SyntheticScanner:
+    """Leitor falso: apenas nome e caminho, como evdev.InputDevice"""
+
+    def __init__(self, index):
+        self.name = f"Synthetic Scanner {index}"
+        self.path = f"/dev/input/synthetic{index}"
+
+
+class BenchService(StockflowQRService):
+    """Serviço real que guarda a latência exata de cada commit"""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies = []
+
+    def record_job_result(self, job, outcome):
+        super().record_job_result(job, outcome)
+        if outcome == 'committed':
+            latency = (datetime.now() - datetime.fromisoformat(job['timestamp'])).total_seconds()
+            with self.metrics_lock:
+                self.latencies.append(latency)
+
+
+def schedule(scans, rate, shape, burst):
+    """Instantes (s, relativos ao início) de cada leitura"""
+    if shape == 'steady':
+        return [i / rate for i in range(scans)]
+    if shape == 'burst':
+        return [(i // burst) * burst / rate for i in range(scans)]
+    if shape == 'ramp':
+        # Taxa r(t) = 2 * rate * t / T; a i-ésima leitura ocorre em T * sqrt(i / scans)
+        duration = scans / rate
+        return [duration * (i / scans) ** 0.5 for i in range(scans)]
+    raise ValueError(f"formato desconhecido: {shape}")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def process_io():
+    """Bytes escritos por chamadas de sistema (Linux), ou None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def seed_sqlite(service, scans):
+    """Cria o banco SQLite do benchmark com os produtos 1..scans"""
+    storage = service.storage
+    storage.connect()
+    connection = sqlite3.connect(storage.path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO tb_produto (id_produto, store_key, nome) VALUES (?, ?, ?)",
+            [(i, service.store_key, f"Produto {i}") for i in range(1, scans + 1)]
+        )
+    connection.close()
+
+
+def run(args):
+    db = None
+    if args.backend == 'fake':
+        # Importação tardia: só o banco simulado exige o mysql-connector
+        from fakedb import FakeDatabase
+        db = FakeDatabase(latency=args.latency / 1000, failure_rate=args.failure_rate, seed=args.seed).install()
+
+    fsyncs = [0]
+    real_fsync = journal.os.fsync
+
+    def counting_fsync(fd):
+        fsyncs[0] += 1
+        real_fsync(fd)
+
+    journal.os.fsync = counting_fsync
+
+    service = BenchService()
+    service.store_key = 'BENCH'
+    workdir = tempfile.mkdtemp(prefix='stockflow-bench-')
+    service.job_file = os.path.join(workdir, 'jobs.json')
+    service.settings.update({
+        'queue_workers': args.workers,
+        'batch_size': args.batch_size,
+        'dedup_ttl': 0,
+        'storage_backend': 'mysql' if args.backend == 'fake' else 'sqlite',
+        'sqlite_path': os.path.join(workdir, 'stockflow.db'),
+        'queue_store': args.queue_store,
+        'outbox_path': os.path.join(workdir, 'outbox.db'),
+    })
+    service.storage = service.create_storage()
+    if args.backend == 'sqlite':
+        seed_sqlite(service, args.scans)
+    service.storage.set_removal_columns(['store_key', 'nome'])
+    service.load_pending_jobs()
+    service.running = True
+    service.set_db_connected(True)
+    service.start_queue_workers()
+
+    scanners = [SyntheticScanner(i) for i in range(args.scanners)]
+    times = schedule(args.scans, args.rate, args.shape, args.burst)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    io_before = process_io()
+
+    def generate(offset):
+        # Cada leitor entrega as leituras de índice offset, offset + scanners, ...
+        scanner = scanners[offset]
+        for i in range(offset, args.scans, args.scanners):
+            delay = started + times[i] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Ids numéricos: são a chave INTEGER de tb_produto no SQLite
+            service.handle_scanned_code(str(i + 1), scanner)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=generate, args=(i,)) for i in range(args.scanners)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ingest_elapsed = time.perf_counter() - started
+
+    with service.queue_condition:
+        drained = service.queue_condition.wait_for(lambda: not service.active_products, timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+
+    io_after = process_io()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    service.stop()
+    journal.os.fsync = real_fsync
+
+    metrics = service.metrics
+    latencies = service.latencies
+    result = {
+        'benchmark': 'pipeline',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': {
+            'scans': args.scans, 'rate': args.rate, 'shape': args.shape, 'burst': args.burst,
+            'scanners': args.scanners, 'latency_ms': args.latency, 'failure_rate': args.failure_rate,
+            'workers': args.workers, 'batch_size': args.batch_size, 'backend': args.backend,
+            'queue_store': args.queue_store,
+        },
+        'drained': drained,
+        'elapsed_s': round(elapsed, 3),
+        'ingest_rate': round(args.scans / ingest_elapsed, 1),
+        'throughput': round(metrics['jobs_committed'] / elapsed, 1),
+        'committed': metrics['jobs_committed'],
+        'retried': metrics['jobs_retried'],
+        'discarded': metrics['jobs_discarded'],
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        # wchar de todo o processo: journal/outbox e, no backend sqlite, o próprio banco
+        'process_write_bytes_per_scan': (
+            round((io_after - io_before) / args.scans, 1) if io_before is not None else None
+        ),
+        'journal_fsyncs_per_scan': round(fsyncs[0] / args.scans, 3),
+        'db_round_trips_per_scan': round(db.stats['round_trips'] / args.scans, 2) if db else None,
+        # prepares de statements (inclui as idas de round_trips); devem ficar
+        # constantes por conexão, não crescer com as leituras
+        'db_prepares': db.stats['prepares'] if db else None,
+        'max_rss_growth_kb': rss_after - rss_before,
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scans', type=int, default=2000, help='total de leituras')
+    parser.add_argument('--rate', type=float, default=200, help='leituras por segundo (média)')
+    parser.add_argument('--shape', choices=('steady', 'burst', 'ramp'), default='steady', help='formato da carga')
+    parser.add_argument('--burst', type=int, default=50, help='leituras por rajada (--shape burst)')
+    parser.add_argument('--scanners', type=int, default=2, help='leitores sintéticos simultâneos')
+    parser.add_argument('--latency', type=float, default=2, help='latência por ida ao banco (ms)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probabilidade de falha por ida ao banco')
+    parser.add_argument('--workers', type=int, default=1, help='queue_workers')
+    parser.add_argument('--batch-size', type=int, default=1, help='batch_size')
+    parser.add_argument('--backend', choices=('fake', 'sqlite'), default='fake',
+                        help='banco simulado (fakedb) ou SQLite real')
+    parser.add_argument('--queue-store', choices=('journal', 'outbox'), default='journal',
+                        help='persistência da fila')
+    parser.add_argument('--seed', type=int, default=1, help='semente das falhas simuladas')
+    parser.add_argument('--timeout', type=float, default=600, help='tempo máximo (s) para drenar a fila')
+    parser.add_argument('--json', action='store_true', help='saída em JSON')
+    parser.add_argument('--output', help='acrescenta o resultado (JSON) a este arquivo')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    result = run(args)
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result) + '\n')
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    params = result['params']
+    print(f"{params['scans']} leituras ({params['shape']}, {params['rate']:g}/s, {params['scanners']} leitores), "
+          + (f"banco {params['latency_ms']:g} ms, falhas {params['failure_rate']:g}, "
+             if params['backend'] == 'fake' else "banco SQLite, ") +
+          f"{params['workers']} worker(s), lote {params['batch_size']}")
+    print(f"  vazão:             {result['throughput']:10.1f} commits/s ({result['committed']} em {result['elapsed_s']:.2f}s)")
+    print(f"  ingestão:          {result['ingest_rate']:10.1f} leituras/s")
+    print(f"  latência p50/p99:  {result['latency_p50_ms']} / {result['latency_p99_ms']} ms")
+    print(f"  novas tentativas:  {result['retried']}  descartes: {result['discarded']}")
+    print(f"  escrita/leitura:   {result['process_write_bytes_per_scan']} bytes (processo), "
+          f"{result['journal_fsyncs_per_scan']} fsync do journal")
+    if result['db_round_trips_per_scan'] is not None:
+        print(f"  banco/leitura:     {result['db_round_trips_per_scan']} idas "
+              f"({result['db_prepares']} prepares no total)")
+    print(f"  memória (maxrss):  +{result['max_rss_growth_kb']} KB")
+    if not result['drained']:
+        print("  AVISO: a fila não foi drenada dentro do tempo limite")
+
+
+if __name__ == '__main__':
+    main()
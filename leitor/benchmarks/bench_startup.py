@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de inicialização do Stockflow QR Reader
+Mede, nos dispositivos reais da máquina, o tempo de detecção do leitor:
+
+- frio: sem impressão digital salva (teste simultâneo dos candidatos)
+- quente: leitor reconhecido pela impressão digital (sem teste)
+- diagnóstico: log_hardware_info, que agora roda em segundo plano
+
+Não altera config/device_config.json: usa um arquivo temporário.
+
+Uso: python3 benchmarks/bench_startup.py [--runs 5] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leitor import StockflowQRService
+
+
+def timed(func):
+    """Executa func e retorna (resultado, milissegundos)"""
+    started = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='repetições de cada medição')
+    parser.add_argument('--json', action='store_true', help='saída em JSON')
+    args = parser.parse_args()
+
+    service = StockflowQRService()
+    logging.getLogger().setLevel(logging.WARNING)
+    config_dir = tempfile.mkdtemp(prefix='stockflow-bench-')
+    service.device_config_file = os.path.join(config_dir, 'device_config.json')
+
+    cold = []
+    warm = []
+    device_name = None
+    for _ in range(args.runs):
+        # Frio: esquece o dispositivo preferido e as impressões digitais
+        if os.path.exists(service.device_config_file):
+            os.remove(service.device_config_file)
+        service.preferred_device = None
+        service.known_fingerprints = []
+        device, elapsed = timed(service.find_qr_device)
+        cold.append(elapsed)
+        if device is None:
+            print("Nenhum leitor encontrado nesta máquina", file=sys.stderr)
+            return 1
+        device_name = device.name
+        device.close()
+
+        # Quente: impressão digital salva pela detecção anterior
+        service.load_device_config()
+        device, elapsed = timed(service.find_qr_device)
+        warm.append(elapsed)
+        device.close()
+
+    _, diagnostics = timed(service.log_hardware_info)
+
+    result = {
+        'device': device_name,
+        'runs': args.runs,
+        'cold_ms': round(statistics.median(cold), 2),
+        'warm_ms': round(statistics.median(warm), 2),
+        'hardware_info_ms': round(diagnostics, 2),
+        'probe_timeout_s': service.settings['device_probe_timeout'],
+    }
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"Leitor: {result['device']} ({args.runs} execuções, mediana)")
+        print(f"  detecção fria (teste simultâneo): {result['cold_ms']:8.1f} ms")
+        print(f"  detecção quente (impressão digital): {result['warm_ms']:5.1f} ms")
+        print(f"  diagnóstico de hardware (em segundo plano): {result['hardware_info_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
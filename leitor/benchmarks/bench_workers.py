@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos workers de processamento da fila
+Simula a recuperação após uma queda: um backlog de trabalhos aguarda na fila
+e o banco volta. Mede o tempo até todos serem confirmados com 1..N workers.
+
+O banco é substituído por benchmarks/fakedb.py, que apenas espera --latency
+ms a cada ida ao servidor (execute, commit), como um MySQL remoto ocioso. O
+restante do caminho (fila, journal, process_job, novas tentativas) é o real.
+
+Uso: python3 benchmarks/bench_workers.py [--jobs 500] [--latency 5] [--workers 1,2,3,5]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakedb import FakeDatabase
+from leitor import StockflowQRService
+
+
+def run(workers, jobs, latency):
+    """Enfileira o backlog com o banco fora, reconecta e mede a drenagem"""
+    service = StockflowQRService()
+    service.store_key = 'BENCH'
+    service.job_file = os.path.join(tempfile.mkdtemp(prefix='stockflow-bench-'), 'jobs.json')
+    service.settings['queue_workers'] = workers
+    service.settings['dedup_ttl'] = 0
+    service.storage = service.create_storage()
+    service.storage.set_removal_columns(['store_key', 'nome'])
+    service.load_pending_jobs()
+
+    for i in range(jobs):
+        service.add_job_to_queue(f"P{i}")
+
+    service.running = True
+    service.db_config['pool_size'] = max(service.db_config['pool_size'], workers)
+    service.start_queue_workers()
+
+    started = time.perf_counter()
+    service.set_db_connected(True)
+    with service.queue_condition:
+        service.queue_condition.wait_for(lambda: not service.active_products, timeout=600)
+    elapsed = time.perf_counter() - started
+
+    service.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=500, help='trabalhos no backlog')
+    parser.add_argument('--latency', type=float, default=5, help='latência por ida ao banco (ms)')
+    parser.add_argument('--workers', default='1,2,3,5', help='quantidades de workers a medir')
+    args = parser.parse_args()
+
+    latency = args.latency / 1000
+    FakeDatabase(latency=latency).install()
+    logging.disable(logging.CRITICAL)
+
+    print(f"{args.jobs} trabalhos no backlog, {args.latency:g} ms por ida ao banco")
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(',')]:
+        elapsed = run(workers, args.jobs, latency)
+        baseline = baseline or elapsed
+        print(f"  {workers} worker(s): {elapsed * 1000:8.1f} ms  {args.jobs / elapsed:8.0f} jobs/s  {baseline / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Banco MySQL simulado para os benchmarks do Stockflow QR Reader
+Cada ida ao servidor (execute, start_transaction, commit, rollback, ping) espera uma latência
+fixa, como um MySQL remoto ocioso, e pode falhar com a probabilidade
+informada. Todo produto existe: cada statement afeta uma linha.
+
+Cursores preparados seguem o mysql-connector: o statement é preparado de
+novo (uma ida a mais) sempre que o objeto SQL recebido não é o mesmo da
+execução anterior, e fechar o cursor desaloca o statement no servidor.
+
+install() troca mysql.connector.connect de worker_connection por esta conexão.
+"""
+
+import random
+import threading
+import time
+
+from mysql.connector import Error as MySQLError
+
+import worker_connection
+
+
+class FakeCursor:
+    """Cursor que espera a latência de rede e afeta uma linha por produto"""
+
+    def __init__(self, db, prepared=False):
+        self.db = db
+        self.prepared = prepared
+        self.executed = None
+        self.rowcount = 0
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        if self.prepared and sql is not self.executed:
+            # Mesmo teste por identidade do MySQLCursorPrepared
+            if self.executed is not None:
+                self.db.round_trip(fail=False)
+                self.db.count('deallocates')
+            self.db.round_trip()
+            self.db.count('prepares')
+            self.executed = sql
+        self.db.round_trip()
+        statement = sql.lstrip().upper()
+        self.rows = []
+        if statement.startswith('SELECT'):
+            # SELECT id_produto ... IN (ids) AND store_key = %s: todos existem
+            self.rows = [(product_id,) for product_id in params[:-1]]
+            self.rowcount = len(self.rows)
+        elif statement.startswith('INSERT'):
+            # data_retirada, responsavel_retirada, ids..., store_key
+            self.rowcount = len(params) - 3
+        else:
+            # DELETE: ids..., store_key
+            self.rowcount = len(params) - 1
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        if self.prepared and self.executed is not None:
+            self.db.round_trip(fail=False)
+            self.db.count('deallocates')
+            self.executed = None
+
+
+class FakeConnection:
+    """Conexão simulada ligada a um FakeDatabase"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, prepared=False):
+        return FakeCursor(self.db, prepared)
+
+    def start_transaction(self):
+        self.db.round_trip()
+
+    def commit(self):
+        self.db.round_trip()
+        self.db.count('commits')
+
+    def rollback(self):
+        self.db.round_trip(fail=False)
+
+    def ping(self, reconnect=False):
+        self.db.round_trip()
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Latência e falhas injetáveis, com contadores de uso"""
+
+    def __init__(self, latency=0.002, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'round_trips': 0, 'commits': 0, 'failures': 0, 'prepares': 0, 'deallocates': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def round_trip(self, fail=True):
+        if self.latency:
+            time.sleep(self.latency)
+        self.count('round_trips')
+        if fail and self.failure_rate and self.random.random() < self.failure_rate:
+            self.count('failures')
+            raise MySQLError("falha simulada")
+
+    def connect(self, **kwargs):
+        return FakeConnection(self)
+
+    def install(self):
+        """Faz as conexões de worker usarem este banco"""
+        worker_connection.mysql.connector.connect = self.connect
+        return self
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dead-letter dos trabalhos do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Guarda em um banco SQLite local os trabalhos descartados após
+esgotar as novas tentativas, com a última classe e mensagem de erro, para
+consulta e reprocessamento em massa (replay.py)
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+DEAD_LETTER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL UNIQUE,
+    product_id TEXT NOT NULL,
+    store_key TEXT,
+    payload TEXT NOT NULL,
+    error_class TEXT NOT NULL,
+    error_message TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    scanned_at TEXT,
+    discarded_at REAL NOT NULL,
+    replayed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_dead_letter_pending ON dead_letter (replayed_at, error_class);
+CREATE INDEX IF NOT EXISTS idx_dead_letter_product ON dead_letter (product_id);
+"""
+
+
+class DeadLetterStore:
+    """Trabalhos descartados, pendentes de reprocessamento até replayed_at ser preenchido"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def open(self):
+        """Abre o banco, criando a tabela se não existir"""
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(DEAD_LETTER_SCHEMA)
+        return self
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def add(self, job, store_key, error_class, error_message=None):
+        """Registra um trabalho descartado (um job_id já registrado é atualizado)"""
+        payload = json.dumps(job, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.open()
+            self.connection.execute(
+                "INSERT INTO dead_letter (job_id, product_id, store_key, payload, error_class, error_message, "
+                "attempts, scanned_at, discarded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET error_class = excluded.error_class, "
+                "error_message = excluded.error_message, attempts = excluded.attempts, "
+                "discarded_at = excluded.discarded_at, replayed_at = NULL",
+                (job['job_id'], job['product_id'], store_key, payload, error_class, error_message,
+                 job.get('attempts', 0), job.get('timestamp'), time.time())
+            )
+
+    def query(self, error_class=None, product_id=None, since=None, store_key=None,
+              include_replayed=False, limit=None):
+        """Lista os registros como dicionários, do mais antigo ao mais recente
+
+        since filtra por discarded_at (time.time()); store_key aceita uma
+        loja ou uma lista de lojas.
+        """
+        conditions = []
+        params = []
+        if not include_replayed:
+            conditions.append("replayed_at IS NULL")
+        if error_class:
+            conditions.append("error_class = ?")
+            params.append(error_class)
+        if product_id:
+            conditions.append("product_id = ?")
+            params.append(product_id)
+        if since is not None:
+            conditions.append("discarded_at >= ?")
+            params.append(since)
+        if isinstance(store_key, (list, tuple)):
+            conditions.append(f"store_key IN ({', '.join('?' * len(store_key))})")
+            params.extend(store_key)
+        elif store_key:
+            conditions.append("store_key = ?")
+            params.append(store_key)
+
+        sql = ("SELECT id, job_id, product_id, store_key, error_class, error_message, attempts, "
+               "scanned_at, discarded_at, replayed_at FROM dead_letter")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self.lock:
+            self.open()
+            cursor = self.connection.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def mark_replayed(self, ids):
+        """Marca os registros como reprocessados"""
+        ids = list(ids)
+        if not ids:
+            return
+        now = time.time()
+        self.update_many("UPDATE dead_letter SET replayed_at = ? WHERE id = ?", [(now, record_id) for record_id in ids])
+
+    def update_errors(self, errors):
+        """Atualiza o último erro de registros cujo reprocessamento falhou: [(id, classe, mensagem)]"""
+        rows = [(error_class, error_message, record_id) for record_id, error_class, error_message in errors]
+        if not rows:
+            return
+        self.update_many(
+            "UPDATE dead_letter SET error_class = ?, error_message = ?, attempts = attempts + 1 WHERE id = ?",
+            rows
+        )
+
+    def update_many(self, sql, rows):
+        """Executa as atualizações em uma única transação"""
+        with self.lock:
+            self.open()
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(sql, rows)
+                self.connection.execute("COMMIT")
+            except sqlite3.Error:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def pending_count(self):
+        """Quantidade de registros ainda não reprocessados"""
+        with self.lock:
+            self.open()
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM dead_letter WHERE replayed_at IS NULL"
+            ).fetchone()[0]
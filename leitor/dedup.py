@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Janela de leituras duplicadas do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Lembra por alguns segundos os produtos lidos recentemente, para
+descartar o segundo disparo do leitor sobre a mesma etiqueta antes de gravar
+no journal ou abrir uma transação no banco
+"""
+
+import time
+from collections import OrderedDict
+
+
+class ScanDeduplicator:
+    """Janela TTL limitada de product_ids lidos recentemente
+
+    As entradas ficam em ordem de expiração (a TTL é a mesma para todas),
+    então a limpeza só olha o início do OrderedDict. Acima de max_entries
+    as leituras mais antigas são esquecidas.
+    """
+
+    def __init__(self, ttl=5.0, max_entries=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def seen(self, product_id):
+        """Registra a leitura e retorna True se o produto já estava na janela"""
+        if self.ttl <= 0:
+            return False
+
+        now = self.clock()
+        self.expire(now)
+
+        duplicate = product_id in self.entries
+        # Leituras repetidas renovam a janela do produto
+        self.entries[product_id] = now + self.ttl
+        self.entries.move_to_end(product_id)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return duplicate
+
+    def forget(self, product_id):
+        """Esquece a leitura do produto (ex.: trabalho que não pôde ser gravado)"""
+        self.entries.pop(product_id, None)
+
+    def expire(self, now):
+        """Remove as entradas vencidas"""
+        entries = self.entries
+        while entries:
+            product_id, expires = next(iter(entries.items()))
+            if expires > now:
+                break
+            del entries[product_id]
+
+    def __len__(self):
+        return len(self.entries)
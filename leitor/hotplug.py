@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detecção de conexão de dispositivos do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Observa /dev/input com inotify (via ctypes, sem dependências)
+para anexar leitores novos ou reconectados em milissegundos, sem varrer
+periodicamente todos os dispositivos
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+# Constantes de linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class HotplugWatcher:
+    """Observa a criação e remoção de nós eventN em /dev/input
+
+    O udev ajusta as permissões logo após criar o nó; por isso IN_ATTRIB
+    também é reportado como 'add', permitindo nova tentativa de abertura.
+    """
+
+    def __init__(self, directory='/dev/input'):
+        self.directory = directory
+        self.fd = None
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+
+    def start(self):
+        """Cria a instância inotify; levanta OSError se não for suportado"""
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        wd = self.libc.inotify_add_watch(
+            fd, os.fsencode(self.directory), IN_CREATE | IN_ATTRIB | IN_DELETE
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"{os.strerror(err)}: {self.directory}")
+
+        self.fd = fd
+        return self
+
+    def fileno(self):
+        """Descritor para uso com select/epoll"""
+        return self.fd
+
+    def read_events(self):
+        """Retorna a lista de (ação, caminho) pendentes: 'add', 'remove' ou 'rescan'"""
+        try:
+            data = os.read(self.fd, 4096)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Eventos perdidos: quem consome deve varrer os dispositivos
+                events.append(('rescan', self.directory))
+                continue
+            if not name.startswith('event'):
+                continue
+
+            path = os.path.join(self.directory, name)
+            if mask & IN_DELETE:
+                events.append(('remove', path))
+            elif mask & (IN_CREATE | IN_ATTRIB):
+                events.append(('add', path))
+        return events
+
+    def close(self):
+        """Encerra a instância inotify"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API local de ingestão do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Socket Unix que recebe lotes de product_ids de outros produtores
+locais (aplicação web, pontes de coletores) e os coloca na mesma fila
+persistida das leituras, com uma gravação no journal por lote, recusa com
+a fila cheia e confirmação por produto
+
+Protocolo (uma requisição e uma resposta JSON por linha):
+
+- lote JSON: {"product_ids": ["123", "456"], "store_key": "LOJA2", "source": "web"}
+  (store_key e source opcionais) ou simplesmente ["123", "456"]
+- texto: um product_id por linha; o lote termina em uma linha vazia, no fim
+  da conexão ou ao atingir max_batch ids
+
+Resposta: {"queued": 1, "busy": 0, "results": [{"product_id": "123",
+"status": "queued"}, ...]}, com status queued, duplicate, invalid, unknown
+ou busy (reenviar mais tarde), ou {"error": "..."} para requisições inválidas.
+"""
+
+import json
+import logging
+import os
+import socketserver
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Maior linha aceita (bytes); protege o serviço de requisições sem fim de linha
+MAX_LINE_BYTES = 1 << 20
+
+
+class IngestServer:
+    """Servidor do socket Unix de ingestão, uma thread por conexão"""
+
+    def __init__(self, service, path, mode=0o660, max_batch=1000):
+        self.service = service
+        self.path = path
+        self.mode = mode
+        self.max_batch = max_batch
+        self.server = None
+
+    def start(self):
+        ingest = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                pending = []
+                while True:
+                    line = self.rfile.readline(MAX_LINE_BYTES)
+                    if not line:
+                        break
+                    if not line.endswith(b'\n') and len(line) >= MAX_LINE_BYTES:
+                        self.reply({'error': 'linha maior que o limite'})
+                        return
+                    text = line.decode('utf-8', errors='replace').strip()
+                    if text.startswith(('{', '[')):
+                        self.reply(ingest.handle_json(text))
+                    elif text:
+                        pending.append(text)
+                        if len(pending) >= ingest.max_batch:
+                            self.reply(ingest.submit(pending))
+                            pending = []
+                    elif pending:
+                        self.reply(ingest.submit(pending))
+                        pending = []
+                if pending:
+                    self.reply(ingest.submit(pending))
+
+            def reply(self, response):
+                try:
+                    self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+                except OSError:
+                    pass
+
+        # Socket de uma execução anterior (o serviço é o único dono do caminho)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        os.chmod(self.path, self.mode)
+        threading.Thread(target=self.server.serve_forever, name='stockflow-ingest', daemon=True).start()
+        logger.info(f"API de ingestão disponível em {self.path}")
+        return self
+
+    def handle_json(self, text):
+        """Interpreta um lote JSON e o submete"""
+        try:
+            request = json.loads(text)
+        except ValueError as e:
+            return {'error': f"JSON inválido: {e}"}
+        if isinstance(request, list):
+            request = {'product_ids': request}
+        product_ids = request.get('product_ids') if isinstance(request, dict) else None
+        if not isinstance(product_ids, list):
+            return {'error': 'product_ids ausente'}
+        if len(product_ids) > self.max_batch:
+            return {'error': f"lote com {len(product_ids)} ids excede o máximo de {self.max_batch}"}
+        store_key = request.get('store_key')
+        if store_key and store_key not in self.service.store_keys():
+            return {'error': f"loja {store_key} não atendida por este serviço"}
+        product_ids = [str(product_id) if isinstance(product_id, int) else product_id for product_id in product_ids]
+        return self.submit(product_ids, store_key, request.get('source'))
+
+    def submit(self, product_ids, store_key=None, source=None):
+        """Enfileira o lote e monta a confirmação por produto"""
+        source = f"ingest:{source}" if source else 'ingest'
+        try:
+            statuses = self.service.add_jobs_to_queue(product_ids, source=source, store_key=store_key)
+        except Exception as e:
+            logger.error(f"Erro ao enfileirar lote da API de ingestão: {e}")
+            return {'error': str(e)}
+        return {
+            'queued': statuses.count('queued'),
+            'busy': statuses.count('busy'),
+            'results': [
+                {'product_id': product_id, 'status': status}
+                for product_id, status in zip(product_ids, statuses)
+            ],
+        }
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
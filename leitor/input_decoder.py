@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Decodificador rápido de eventos do leitor QR Code
+Autor: Sistema Stockflow
+Descrição: Lê structs input_event diretamente do descritor do dispositivo,
+em bloco, e converte códigos de tecla em caracteres por tabela pré-calculada,
+sem criar objetos de evento do python-evdev. KeyDecoder aplica o mesmo
+mapeamento (Shift, ENTER e ENTER do teclado numérico) aos eventos já lidos
+pelo evdev, para que todos os modos de leitura produzam o mesmo código
+"""
+
+import os
+import struct
+
+# struct input_event { struct timeval time; __u16 type; __u16 code; __s32 value; }
+INPUT_EVENT = struct.Struct('llHHi')
+
+# Eventos lidos por chamada a os.read
+READ_EVENTS = 256
+READ_SIZE = INPUT_EVENT.size * READ_EVENTS
+
+# Códigos do kernel (linux/input-event-codes.h)
+EV_KEY = 0x01
+KEY_RELEASED = 0
+KEY_DOWN = 1
+KEY_ENTER = 28
+KEY_KPENTER = 96
+KEY_LEFTSHIFT = 42
+KEY_RIGHTSHIFT = 54
+
+# Código de tecla -> caractere sem Shift
+KEY_CHARS = {
+    2: '1', 3: '2', 4: '3', 5: '4', 6: '5', 7: '6', 8: '7', 9: '8', 10: '9', 11: '0',
+    12: '-', 13: '=',
+    16: 'q', 17: 'w', 18: 'e', 19: 'r', 20: 't', 21: 'y', 22: 'u', 23: 'i', 24: 'o', 25: 'p',
+    30: 'a', 31: 's', 32: 'd', 33: 'f', 34: 'g', 35: 'h', 36: 'j', 37: 'k', 38: 'l',
+    44: 'z', 45: 'x', 46: 'c', 47: 'v', 48: 'b', 49: 'n', 50: 'm',
+}
+
+# Código de tecla -> caractere com Shift (layout US)
+SHIFT_KEY_CHARS = {
+    2: '!', 3: '@', 4: '#', 5: '$', 6: '%', 7: '^', 8: '&', 9: '*', 10: '(', 11: ')',
+    12: '_', 13: '+',
+}
+SHIFT_KEY_CHARS.update({code: char.upper() for code, char in KEY_CHARS.items() if char.isalpha()})
+
+
+def build_table(chars):
+    """Tabela indexada pelo código de tecla com o byte ASCII (0 = ignorar)"""
+    table = [0] * 256
+    for code, char in chars.items():
+        table[code] = ord(char)
+    return table
+
+
+PLAIN_TABLE = build_table(KEY_CHARS)
+SHIFT_TABLE = build_table(SHIFT_KEY_CHARS)
+
+
+class KeyDecoder:
+    """Monta os códigos de um leitor evento a evento (eventos do python-evdev)
+
+    Mesmo mapeamento de RawKeyDecoder: estado do Shift, KEY_ENTER e
+    KEY_KPENTER encerram o código.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.shift = False
+
+    def feed_key(self, code, value):
+        """Processa um evento EV_KEY; retorna o código finalizado por ENTER ou None"""
+        if code == KEY_LEFTSHIFT or code == KEY_RIGHTSHIFT:
+            self.shift = value != KEY_RELEASED
+            return None
+        if value != KEY_DOWN:
+            return None
+        if code == KEY_ENTER or code == KEY_KPENTER:
+            completed = ''.join(self.buffer)
+            self.buffer.clear()
+            return completed
+        char = (SHIFT_KEY_CHARS if self.shift else KEY_CHARS).get(code)
+        if char:
+            self.buffer.append(char)
+        return None
+
+
+class RawKeyDecoder:
+    """Decodifica input_events brutos de um dispositivo em códigos lidos
+
+    Mantém o estado do Shift, o buffer do código em leitura (bytearray
+    reutilizado) e os bytes de um evento parcial entre leituras.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pending = b''
+        self.shift = False
+
+    def feed(self, data):
+        """Processa bytes brutos e retorna a lista de códigos finalizados por ENTER"""
+        if self.pending:
+            data = self.pending + data
+        usable = len(data) - len(data) % INPUT_EVENT.size
+        self.pending = data[usable:]
+
+        completed = []
+        buffer = self.buffer
+        table = SHIFT_TABLE if self.shift else PLAIN_TABLE
+        for _sec, _usec, ev_type, code, value in INPUT_EVENT.iter_unpack(memoryview(data)[:usable]):
+            if ev_type != EV_KEY:
+                continue
+            if code == KEY_LEFTSHIFT or code == KEY_RIGHTSHIFT:
+                self.shift = value != KEY_RELEASED
+                table = SHIFT_TABLE if self.shift else PLAIN_TABLE
+                continue
+            if value != KEY_DOWN:
+                continue
+            if code == KEY_ENTER or code == KEY_KPENTER:
+                if buffer:
+                    completed.append(buffer.decode('ascii'))
+                    buffer.clear()
+                continue
+            if code < 256:
+                char = table[code]
+                if char:
+                    buffer.append(char)
+        return completed
+
+    def read(self, fd):
+        """Lê em bloco todos os eventos disponíveis no descritor (não bloqueante)"""
+        data = os.read(fd, READ_SIZE)
+        if not data:
+            raise OSError("Dispositivo de entrada fechado")
+        return self.feed(data)
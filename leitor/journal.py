@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Journal append-only da fila de trabalhos do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Persiste enfileiramentos, confirmações e novas tentativas em
+segmentos de log, com fsync em lote e compactação em segundo plano
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class JobJournal:
+    """Journal de trabalhos: snapshot compactado + segmentos append-only
+
+    O snapshot (jobs.json) registra o número do primeiro segmento que ainda
+    precisa ser reaplicado. Cada segmento contém um registro JSON por linha:
+
+        {"op": "enqueue", "job": {...}}
+        {"op": "ack", "job_id": "..."}
+        {"op": "retry", "job_id": "...", "attempts": 1, "next_attempt": 1700000000.0}
+
+    Gravar um registro custa O(1), independente do tamanho da fila.
+    """
+
+    def __init__(self, snapshot_file, fsync_interval=0.05, compact_threshold=1000):
+        self.snapshot_file = snapshot_file
+        self.segment_prefix = os.path.splitext(snapshot_file)[0] + '.journal.'
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+
+        self.lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+        self.pending = {}
+        self.segment_seq = 0
+        self.segment = None
+        self.records_in_segment = 0
+        self.dirty = False
+        self.running = False
+
+        self.flush_event = threading.Event()
+        self.compact_event = threading.Event()
+        self.flusher_thread = None
+        self.compactor_thread = None
+
+    def segment_path(self, seq):
+        """Retorna o caminho do segmento de número seq"""
+        return f"{self.segment_prefix}{seq:06d}"
+
+    def list_segments(self):
+        """Lista (seq, caminho) dos segmentos existentes em ordem"""
+        segments = []
+        for path in glob.glob(self.segment_prefix + '*'):
+            suffix = path[len(self.segment_prefix):]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def load(self):
+        """Reconstrói os trabalhos pendentes a partir do snapshot e dos segmentos"""
+        first_seq = 0
+        jobs = []
+
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Formato antigo: lista simples de trabalhos
+            if isinstance(data, list):
+                jobs = data
+            else:
+                jobs = data.get('jobs', [])
+                first_seq = data.get('segment', 0)
+
+        pending = {}
+        for job in jobs:
+            job.setdefault('job_id', new_job_id())
+            pending[job['job_id']] = job
+
+        replayed = 0
+        last_seq = first_seq
+        for seq, path in self.list_segments():
+            last_seq = max(last_seq, seq)
+            if seq < first_seq:
+                continue
+            replayed += self.replay_segment(path, pending)
+
+        with self.lock:
+            self.pending = pending
+            self.segment_seq = last_seq + 1
+
+        if replayed:
+            logger.info(f"Journal reaplicado: {replayed} registros, {len(pending)} trabalhos pendentes")
+
+        return list(pending.values())
+
+    def replay_segment(self, path, pending):
+        """Aplica os registros de um segmento sobre o dicionário de pendentes"""
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Última linha truncada por queda de energia
+                    logger.warning(f"Registro corrompido ignorado em {path}")
+                    continue
+
+                op = record.get('op')
+                if op == 'enqueue':
+                    job = record['job']
+                    pending[job['job_id']] = job
+                elif op == 'ack':
+                    pending.pop(record['job_id'], None)
+                elif op == 'retry':
+                    job = pending.get(record['job_id'])
+                    if job:
+                        job['attempts'] = record['attempts']
+                        job['next_attempt'] = record.get('next_attempt', 0)
+                count += 1
+        return count
+
+    def start(self):
+        """Abre um novo segmento e inicia as threads de fsync e compactação"""
+        with self.lock:
+            self.segment = open(self.segment_path(self.segment_seq), 'a', encoding='utf-8')
+            self.records_in_segment = 0
+        self.running = True
+
+        self.flusher_thread = threading.Thread(target=self.flusher, daemon=True)
+        self.flusher_thread.start()
+        self.compactor_thread = threading.Thread(target=self.compactor, daemon=True)
+        self.compactor_thread.start()
+
+        # Incorpora o que foi reaplicado no snapshot logo na inicialização
+        self.compact_event.set()
+
+    def close(self):
+        """Compacta o journal e encerra as threads"""
+        self.running = False
+        self.flush_event.set()
+        self.compact_event.set()
+        self.compact()
+        with self.lock:
+            if self.segment:
+                self.sync_locked()
+                self.segment.close()
+                self.segment = None
+
+    def append(self, record):
+        """Grava um registro no segmento atual (fsync feito em lote)"""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Grava vários registros com uma única escrita no segmento atual"""
+        data = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+        with self.lock:
+            for record in records:
+                op = record['op']
+                if op == 'enqueue':
+                    self.pending[record['job']['job_id']] = record['job']
+                elif op == 'ack':
+                    self.pending.pop(record['job_id'], None)
+                elif op == 'retry' and record['job_id'] in self.pending:
+                    self.pending[record['job_id']]['attempts'] = record['attempts']
+                    self.pending[record['job_id']]['next_attempt'] = record['next_attempt']
+
+            if self.segment is None:
+                # Journal não iniciado ou já fechado: os registros não chegam ao disco
+                logger.warning(f"Journal fechado: {len(records)} registros não gravados em disco")
+                return
+            self.segment.write(data)
+            self.records_in_segment += len(records)
+            self.dirty = True
+
+            if self.fsync_interval <= 0:
+                self.sync_locked()
+
+            if self.records_in_segment >= self.compact_threshold + len(self.pending):
+                self.compact_event.set()
+
+        if self.fsync_interval > 0:
+            self.flush_event.set()
+
+    def append_enqueue(self, job, queue_length=0):
+        """Registra a entrada de um trabalho na fila (sempre mantido em memória)"""
+        self.append({'op': 'enqueue', 'job': dict(job)})
+        return True
+
+    def append_enqueue_batch(self, jobs, queue_length=0):
+        """Registra a entrada de vários trabalhos com uma única escrita (todos mantidos em memória)"""
+        self.append_many([{'op': 'enqueue', 'job': dict(job)} for job in jobs])
+        return [True] * len(jobs)
+
+    def append_ack(self, job):
+        """Registra a conclusão (ou descarte) de um trabalho"""
+        self.append({'op': 'ack', 'job_id': job['job_id']})
+
+    def append_retry(self, job):
+        """Registra uma nova tentativa de um trabalho e o horário agendado"""
+        self.append({
+            'op': 'retry',
+            'job_id': job['job_id'],
+            'attempts': job['attempts'],
+            'next_attempt': job.get('next_attempt', 0)
+        })
+
+    def sync_locked(self):
+        """Descarrega o buffer e faz fsync do segmento atual (lock já obtido)"""
+        if self.segment and self.dirty:
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            self.dirty = False
+
+    def flusher(self):
+        """Thread que agrupa vários registros em um único fsync"""
+        while self.running:
+            self.flush_event.wait()
+            self.flush_event.clear()
+            # Janela para acumular outros registros no mesmo fsync
+            time.sleep(self.fsync_interval)
+            try:
+                with self.lock:
+                    self.sync_locked()
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar journal: {e}")
+
+    def compactor(self):
+        """Thread de compactação em segundo plano"""
+        while self.running:
+            self.compact_event.wait()
+            self.compact_event.clear()
+            if not self.running:
+                break
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Erro ao compactar journal: {e}")
+
+    def compact(self):
+        """Grava um novo snapshot e remove os segmentos já incorporados
+
+        Sob o lock apenas troca o segmento ativo e copia os pendentes; a escrita
+        do snapshot acontece fora do lock, sem bloquear novos registros.
+        """
+        with self.compact_lock:
+            self.compact_locked()
+
+    def compact_locked(self):
+        """Executa a compactação (compact_lock já obtido)"""
+        with self.lock:
+            if self.segment is None:
+                return
+            self.sync_locked()
+            self.segment.close()
+            self.segment_seq += 1
+            new_seq = self.segment_seq
+            self.segment = open(self.segment_path(new_seq), 'a', encoding='utf-8')
+            self.records_in_segment = 0
+            jobs = [dict(job) for job in self.pending.values()]
+
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'segment': new_seq, 'jobs': jobs}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+
+        for seq, path in self.list_segments():
+            if seq < new_seq:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Não foi possível remover segmento {path}: {e}")
+
+        logger.debug(f"Journal compactado: {len(jobs)} trabalhos pendentes")
+
+    def load_more(self, limit):
+        """O journal carrega todos os pendentes em load(): nada fica só no disco"""
+        return []
+
+    def has_pending_product(self, product_id):
+        """Nenhum trabalho aguarda apenas no disco: todos os pendentes estão em memória"""
+        return False
+
+    def pending_count(self):
+        """Quantidade de trabalhos pendentes segundo o journal"""
+        with self.lock:
+            return len(self.pending)
+
+    def disk_bytes(self):
+        """Tamanho dos segmentos do journal em disco"""
+        total = 0
+        for _seq, path in self.list_segments():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+
+def new_job_id():
+    """Gera um identificador único para um trabalho"""
+    return uuid.uuid4().hex
@@ -6,84 +6,317 @@ Autor: Sistema Stockflow
 Descrição: Serviço independente e resiliente para processamento de produtos
 """
 
-import mysql.connector
-from mysql.connector import pooling, Error as MySQLError
 import json
 import os
 import time
 import logging
 import threading
 from queue import Queue, Empty
-from collections import deque
 import signal
 import sys
 from datetime import datetime
 import re
 
+from journal import JobJournal, new_job_id
+from outbox import SQLiteOutbox
+from deadletter import DeadLetterStore
+from stores import ShardedJournal, StoreQueues, device_matches, store_path, tag_store
+from storage import MySQLStorage, SQLiteStorage, StorageError, StorageUnavailable
+from input_decoder import KeyDecoder, RawKeyDecoder
+from hotplug import HotplugWatcher
+from dedup import ScanDeduplicator
+from product_index import ProductIndex
+from metrics import COUNTERS, Histogram, MetricsServer
+from ingest import IngestServer
+from logpipeline import LogPipeline
+from profiling import SamplingProfiler, StageTimers
+from retry import (
+    ERROR_CONNECTION, ERROR_DATABASE, ERROR_INVALID, ERROR_NOT_FOUND, ERROR_UNEXPECTED,
+    RetryScheduler, backoff_delay, classify_error, retry_policy
+)
+
 # Importações para monitoramento de eventos de teclado
 try:
     import evdev
-    from evdev import InputDevice, categorize, ecodes
+    from evdev import InputDevice, ecodes
     EVDEV_AVAILABLE = True
 except ImportError:
     EVDEV_AVAILABLE = False
     print("AVISO: evdev não está disponível. Instale com: pip install evdev")
 
+# Parâmetros ajustáveis via seção "leitor_settings" do printers.json
+DEFAULT_SETTINGS = {
+    # Arquivo de log, rotacionado ao atingir log_max_bytes (log_backup_count arquivos antigos)
+    "log_file": "/home/stockflow/Stockflow/leitor/leitor.log",
+    "log_max_bytes": 10 * 1024 * 1024,
+    "log_backup_count": 5,
+    # Uma linha JSON compacta por registro em vez do texto
+    "log_json": False,
+    # Registros aguardando a thread de escrita; acima disso são descartados (sem bloquear a leitura)
+    "log_queue_size": 10000,
+    # Cronômetros por etapa ligados na inicialização (alternados em execução com SIGUSR2)
+    "stage_timers": False,
+    # Intervalo (s) do resumo de latência por etapa no log, com os cronômetros ligados (0 = só ao desligar)
+    "stage_summary_interval": 60,
+    # Janela (s) do profiler por amostragem disparado com SIGUSR1 e intervalo (s) entre amostras
+    "profile_duration": 30,
+    "profile_interval": 0.005,
+    # Intervalo (s) para agrupar registros do journal em um único fsync (0 = fsync imediato)
+    "journal_fsync_interval": 0.05,
+    # Registros extras no segmento atual que disparam a compactação em segundo plano
+    "journal_compact_threshold": 1000,
+    # Persistência da fila: "journal" (jobs.json + segmentos) ou "outbox" (SQLite)
+    "queue_store": "journal",
+    # Arquivo do outbox SQLite (queue_store "outbox")
+    "outbox_path": "/home/stockflow/Stockflow/leitor/outbox.db",
+    # Máximo de trabalhos do outbox mantidos em memória; o excedente aguarda no disco
+    "outbox_memory_jobs": 5000,
+    # Máximo de produtos movidos por transação (1 = um produto por transação)
+    "batch_size": 1,
+    # Política de novas tentativas por classe de erro (default, invalid, not_found,
+    # connection, database, error): max_attempts, base_delay, multiplier, max_delay, jitter
+    "retry_policy": {},
+    # Banco SQLite dos trabalhos descartados após esgotar as tentativas (replay.py)
+    "dead_letter_path": "/home/stockflow/Stockflow/leitor/dead_letter.db",
+    # Com ao menos esta quantidade na fila (ex.: após queda do banco), drena em lotes deste tamanho (0 = desativa)
+    "drain_batch_size": 100,
+    # Tempo máximo (s) aguardando o lote encher antes de processá-lo
+    "batch_max_linger": 0.2,
+    # Backend de armazenamento: "mysql" (produção) ou "sqlite" (modo local)
+    "storage_backend": "mysql",
+    # Arquivo do banco no modo "sqlite" (criado com o schema se não existir)
+    "sqlite_path": "/home/stockflow/Stockflow/leitor/stockflow.db",
+    # Move o produto via procedure instalada no banco (uma chamada por produto; apenas MySQL)
+    "use_stored_procedure": False,
+    # Inatividade (s) após a qual a conexão do worker é verificada com ping
+    "worker_liveness_interval": 30,
+    # Intervalo (s) da verificação de saúde: ping do servidor e das conexões ociosas (0 = desativa)
+    "db_health_interval": 1.0,
+    # Espera máxima (s) entre tentativas de reconexão (o backoff volta ao mínimo no primeiro ping bem-sucedido)
+    "db_reconnect_max_backoff": 1.0,
+    # Timeout (s) dos sockets do banco: conexão e, no conector puro-Python, leitura e escrita
+    "db_connect_timeout": 2,
+    # Ociosidade (s) antes das sondas TCP keepalive nas conexões de worker (0 = padrão do sistema)
+    "db_keepalive_idle": 10,
+    # Inicia fila e verificação de saúde antes de conectar ao banco: o backlog começa a ser
+    # drenado assim que a conexão (feita em segundo plano) fica pronta
+    "fast_start": False,
+    # Relatório de hardware no log após a inicialização (sob demanda: leitor.py --hardware-report)
+    "hardware_report": True,
+    # Atraso (s) do relatório de hardware no modo fast_start, para não disputar a drenagem do backlog
+    "hardware_report_delay": 30,
+    # Executa leitura, fila e banco em um único event loop asyncio
+    "async_mode": False,
+    # Chamadas simultâneas ao banco no modo asyncio (tamanho do executor)
+    "async_db_workers": 1,
+    # Mantém todos os leitores compatíveis abertos ao mesmo tempo (epoll)
+    "multi_scanner": False,
+    # Lê input_events brutos em bloco do descritor (decodificador por tabela)
+    "raw_input_decoder": False,
+    # Detecta leitores conectados via inotify em /dev/input (sem varredura periódica)
+    "hotplug": True,
+    # Prazo único (s) compartilhado pelo teste simultâneo dos dispositivos
+    "device_probe_timeout": 0.2,
+    # Janela (s) em que uma nova leitura do mesmo produto é descartada (0 = desativa)
+    "dedup_ttl": 5.0,
+    # Máximo de produtos lembrados pela janela de duplicatas
+    "dedup_max_entries": 1024,
+    # Mantém em memória os id_produto da loja e rejeita leituras desconhecidas
+    "product_index": False,
+    # Intervalo (s) da atualização incremental do índice de produtos
+    "product_index_refresh": 60,
+    # Intervalo (s) da recarga completa do índice (captura remoções externas)
+    "product_index_full_refresh": 900,
+    # Threads consumidoras da fila (limitado a pool_size); um produto por vez
+    "queue_workers": 1,
+    # Porta do endpoint HTTP de métricas no formato Prometheus (0 = desativado)
+    "metrics_port": 0,
+    # Endereço do endpoint de métricas (apenas local por padrão)
+    "metrics_host": "127.0.0.1",
+    # Lojas adicionais atendidas pelo mesmo processo: store_key -> padrões dos leitores da loja
+    # (caminho em /dev/input, vendor:product ou parte do nome). Leitores sem padrão usam store_key
+    "stores": {},
+    # Socket Unix da API local de ingestão em lote (ingest.py; vazio = desativada)
+    "ingest_socket": "",
+    # Permissões do socket de ingestão (octal)
+    "ingest_socket_mode": "0660",
+    # Máximo de product_ids por lote recebido pelo socket
+    "ingest_max_batch": 1000,
+    # Trabalhos pendentes (memória e disco) acima dos quais o socket responde "busy"
+    "ingest_max_pending": 50000,
+}
+
+# Quantidade máxima de impressões digitais de leitores lembradas
+MAX_KNOWN_FINGERPRINTS = 10
+
+# Lista de critérios de prioridade para identificar leitores QR Code
+QR_DEVICE_CRITERIA = [
+    # Prioridade 1: Dispositivos conhecidos de QR Code
+    ['arm cm0', 'cm0'],
+    # Prioridade 2: Termos específicos de leitores
+    ['barcode', 'scanner', 'qr', 'code reader', 'honeywell', 'datalogic', 'symbol'],
+    # Prioridade 3: Dispositivos USB HID genéricos que podem ser leitores
+    ['usb hid', 'hid keyboard'],
+    # Prioridade 4: Teclados USB (fallback)
+    ['usb keyboard', 'keyboard']
+]
+
+# Responsável gravado nas baixas do leitor
+REMOVED_BY = 'Leitor QRCODE'
+
+# Configuração padrão do banco de dados
+DEFAULT_DB_CONFIG = {
+    "host": "localhost",
+    "port": 3306,
+    "user": "root",
+    "password": "",
+    "database": "flow",
+    "charset": "utf8mb4",
+    "autocommit": False,
+    "pool_name": "stockflow_pool",
+    "pool_size": 5,
+    "pool_reset_session": True
+}
+
+def create_storage(settings, store_key, db_config=DEFAULT_DB_CONFIG):
+    """Cria o backend de armazenamento configurado em storage_backend
+    
+    Usada pelo serviço e pelas ferramentas (replay.py), que não precisam dele.
+    """
+    backend = settings['storage_backend']
+    if backend == 'sqlite':
+        return SQLiteStorage(settings['sqlite_path'], store_key)
+    if backend != 'mysql':
+        logging.getLogger(__name__).warning(f"storage_backend desconhecido: {backend}. Usando MySQL")
+    db_config = dict(db_config)
+    db_config.setdefault('connection_timeout', settings['db_connect_timeout'])
+    return MySQLStorage(
+        db_config,
+        store_key,
+        use_procedure=settings['use_stored_procedure'],
+        liveness_interval=settings['worker_liveness_interval'],
+        keepalive_idle=settings['db_keepalive_idle']
+    )
+
+def sao_paulo_now():
+    """Retorna o horário atual de São Paulo"""
+    from datetime import timezone, timedelta
+    sao_paulo_tz = timezone(timedelta(hours=-3))
+    return datetime.now(sao_paulo_tz)
+
+def valid_product_id(product_id):
+    """Valida o formato do product_id"""
+    if not product_id or not isinstance(product_id, str):
+        return False
+    
+    # Remove espaços em branco
+    product_id = product_id.strip()
+    
+    # Verifica se é numérico ou alfanumérico válido
+    if re.match(r'^[a-zA-Z0-9-_]+$', product_id):
+        return True
+    
+    return False
+
 class StockflowQRService:
     def __init__(self):
         self.running = False
         self.store_key = None
-        self.db_pool = None
-        self.job_queue = deque()
+        # Backend de armazenamento (storage.py), criado após carregar a configuração
+        self.storage = None
+        # Schema descoberto e procedure instalada (na primeira conexão bem-sucedida)
+        self.storage_prepared = False
+        # Fila em memória por loja, retirada em rodízio (stores.py)
+        self.job_queue = StoreQueues()
+        # Loja de cada leitor ((caminho, nome) -> store_key), resolvida na primeira leitura
+        self.device_stores = {}
+        # Trabalhos com falha aguardando o horário da próxima tentativa
+        self.retry_scheduler = RetryScheduler()
+        # Trabalhos descartados (aberto na primeira gravação)
+        self.dead_letters = None
+        # Produtos sendo processados agora (nenhum outro job do mesmo produto é retirado)
+        self.in_flight_products = set()
         self.job_file = '/home/stockflow/Stockflow/leitor/jobs.json'
+        self.journal = None
+        self.settings = dict(DEFAULT_SETTINGS)
+        # Leituras recentes e produtos com trabalho pendente ou em andamento
+        self.scan_dedup = None
+        self.active_products = {}
+        # Contadores de operação (nomes em metrics.COUNTERS). Os da leitura são
+        # incrementados só pela thread de entrada; os do processamento, sob metrics_lock
+        self.metrics = dict.fromkeys(COUNTERS, 0)
+        self.metrics_lock = threading.Lock()
+        self.scan_latency = Histogram()
+        self.metrics_server = None
+        # API local de ingestão em lote e destino alternativo dos trabalhos aceitos: o núcleo
+        # asyncio, com deliver(jobs) e queued_count() sobre a sua própria fila (None = job_queue)
+        self.ingest_server = None
+        self.job_sink = None
+        # Início de start() e segundos até o primeiro commit (time-to-first-commit)
+        self.started_at = None
+        self.first_commit_seconds = None
+        # Latência por etapa (decodificação, fila, journal, banco) e profiler sob demanda
+        self.stage_timers = StageTimers()
+        self.profiler = None
+        # Índice local de id_produto (None = validação apenas no banco)
+        self.product_index = None
+        self.product_index_thread = None
         self.config_file = '/home/stockflow/Stockflow/config/printers.json'
         self.input_device = None
-        self.current_input = ""
+        # Leitores abertos no modo multi_scanner (fd -> dispositivo)
+        self.input_devices = {}
+        # Código em leitura de cada leitor (caminho -> KeyDecoder)
+        self.key_decoders = {}
+        # Decodificadores brutos por leitor (caminho -> RawKeyDecoder)
+        self.raw_decoders = {}
+        # Observador inotify de /dev/input (None = varredura periódica)
+        self.hotplug = None
         self.device_config_file = "/home/stockflow/Stockflow/config/device_config.json"
         self.preferred_device = None
+        # Impressões digitais de leitores já validados (reconhecidos sem teste)
+        self.known_fingerprints = []
         
         # Configuração de logging
         self.setup_logging()
         
         # Configuração do banco de dados
-        self.db_config = {
-            "host": "localhost",
-            "port": 3306,
-            "user": "root",
-            "password": "",
-            "database": "flow",
-            "charset": "utf8mb4",
-            "autocommit": False,
-            "pool_name": "stockflow_pool",
-            "pool_size": 5,
-            "pool_reset_session": True
-        }
+        self.db_config = dict(DEFAULT_DB_CONFIG)
         
-        # Thread para processamento da fila
-        self.queue_processor_thread = None
-        self.db_reconnect_thread = None
+        # Threads para processamento da fila
+        self.queue_processor_threads = []
+        self.db_health_thread = None
+        # Acorda a verificação de saúde na perda de conexão ou no encerramento (fora de
+        # queue_condition, para não consumir o notify destinado aos processadores)
+        self.db_health_wakeup = threading.Event()
         self.db_connected = False
+        # Sinaliza novos trabalhos, mudança de conexão e encerramento
+        self.queue_condition = threading.Condition()
         self.last_device_scan = 0
         self.device_scan_interval = 30  # Escaneia dispositivos a cada 30 segundos
         
         # Configuração de sinais para encerramento gracioso
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        # Diagnóstico sem reinício: SIGUSR1 alterna o profiler, SIGUSR2 os cronômetros por etapa
+        signal.signal(signal.SIGUSR1, self.profile_signal_handler)
+        signal.signal(signal.SIGUSR2, self.profile_signal_handler)
     
     def setup_logging(self):
-        """Configura o sistema de logging estruturado"""
-        log_format = '[%(asctime)s] %(levelname)s: %(message)s'
-        logging.basicConfig(
-            level=logging.INFO,
-            format=log_format,
-            handlers=[
-                logging.FileHandler('/home/stockflow/Stockflow/leitor/leitor.log'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
+        """Configura o logging assíncrono: as threads só enfileiram os registros"""
+        self.log_pipeline = LogPipeline.install(self.settings['log_queue_size'])
+        self.configure_logging()
         self.logger = logging.getLogger(__name__)
         self.logger.info("Sistema de logging inicializado")
     
+    def configure_logging(self):
+        """Aplica arquivo, rotação e formato de leitor_settings à thread de escrita do log"""
+        self.log_pipeline.configure(
+            self.settings['log_file'],
+            max_bytes=self.settings['log_max_bytes'],
+            backup_count=self.settings['log_backup_count'],
+            json_format=self.settings['log_json']
+        )
+    
     def load_configuration(self):
         """Carrega a configuração do arquivo printers.json"""
         try:
@@ -103,6 +336,7 @@ class StockflowQRService:
                 return False
             
             self.store_key = config['store_key']
+            self.settings.update(config.get('leitor_settings', {}))
             self.logger.info(f"Configuração carregada. Store Key: {self.store_key}")
             
             # Carrega configuração do dispositivo preferido
@@ -124,6 +358,7 @@ class StockflowQRService:
                 with open(self.device_config_file, 'r', encoding='utf-8') as file:
                     device_config = json.load(file)
                     self.preferred_device = device_config.get('preferred_device')
+                    self.known_fingerprints = device_config.get('known_fingerprints', [])
                     if self.preferred_device:
                         self.logger.info(f"Dispositivo preferido carregado: {self.preferred_device['name']} ({self.preferred_device['path']})")
         except Exception as e:
@@ -133,14 +368,18 @@ class StockflowQRService:
     def save_device_config(self, device):
         """Salva configuração do dispositivo que funcionou"""
         try:
+            fingerprint = self.device_fingerprint(device)
+            known = [f for f in self.known_fingerprints if f != fingerprint]
             device_config = {
                 'preferred_device': {
                     'name': device.name,
                     'path': device.path,
                     'vendor_id': getattr(device.info, 'vendor', None),
                     'product_id': getattr(device.info, 'product', None),
-                    'last_used': datetime.now().isoformat()
-                }
+                    'last_used': datetime.now().isoformat(),
+                    'fingerprint': fingerprint
+                },
+                'known_fingerprints': ([fingerprint] + known)[:MAX_KNOWN_FINGERPRINTS]
             }
             
             # Cria o diretório se não existir
@@ -150,84 +389,394 @@ class StockflowQRService:
                 json.dump(device_config, file, indent=2, ensure_ascii=False)
             
             self.preferred_device = device_config['preferred_device']
+            self.known_fingerprints = device_config['known_fingerprints']
             self.logger.info(f"Configuração do dispositivo salva: {device.name}")
             
         except Exception as e:
             self.logger.warning(f"Erro ao salvar configuração do dispositivo: {e}")
     
+    def create_storage(self):
+        """Cria o backend de armazenamento configurado em storage_backend"""
+        return create_storage(self.settings, self.store_key, self.db_config)
+    
     def setup_database_pool(self):
-        """Configura o pool de conexões com o banco de dados"""
+        """Conecta ao banco do backend configurado (pool MySQL ou arquivo SQLite)"""
         try:
-            self.db_pool = pooling.MySQLConnectionPool(**self.db_config)
-            self.db_connected = True
-            self.logger.info("Pool de conexões MySQL criado com sucesso")
+            self.connect_storage()
+            self.logger.info(f"Conexão com o banco {self.storage.name} estabelecida com sucesso")
             return True
-        except MySQLError as e:
-            self.logger.error(f"Erro ao criar pool de conexões MySQL: {e}")
-            self.db_connected = False
+        except StorageUnavailable as e:
+            self.logger.error(f"Erro ao conectar ao banco {self.storage.name}: {e}")
+            self.set_db_connected(False)
             return False
     
-    def get_db_connection(self):
-        """Obtém uma conexão do pool"""
+    def connect_storage(self):
+        """Conecta (ou pinga) o servidor e reabre as conexões de worker quebradas antes de liberar o tráfego
+        
+        Na primeira conexão bem-sucedida também prepara a baixa (schema e procedure).
+        """
+        if self.storage is None:
+            self.storage = self.create_storage()
+            self.storage.stage_timers = self.stage_timers
+        self.storage.connect()
+        self.prepare_storage()
+        reopened = self.storage.refresh_workers()
+        if reopened:
+            self.logger.info(f"{reopened} conexões de worker reabertas")
+        self.set_db_connected(True)
+    
+    def check_database_health(self, idle_after):
+        """Pinga o servidor e as conexões ociosas, reabrindo só as quebradas; False se o banco caiu"""
         try:
-            if self.db_pool:
-                return self.db_pool.get_connection()
-            return None
-        except MySQLError as e:
-            self.logger.error(f"Erro ao obter conexão do pool: {e}")
-            self.db_connected = False
-            return None
+            reopened = self.storage.check_health(idle_after)
+        except StorageUnavailable as e:
+            self.logger.error(f"Banco {self.storage.name} não respondeu à verificação de saúde: {e}")
+            self.set_db_connected(False)
+            return False
+        if reopened:
+            self.logger.warning(f"{reopened} conexões quebradas reabertas pela verificação de saúde")
+        return True
+    
+    def set_db_connected(self, connected):
+        """Atualiza o estado da conexão e acorda o processador e o reconector"""
+        with self.queue_condition:
+            self.db_connected = connected
+            self.queue_condition.notify_all()
+        if not connected:
+            self.db_health_wakeup.set()
+    
+    def store_keys(self):
+        """store_key principal seguida das lojas adicionais de stores"""
+        return [self.store_key] + [key for key in self.settings['stores'] if key != self.store_key]
     
     def load_pending_jobs(self):
-        """Carrega trabalhos pendentes do arquivo de persistência"""
+        """Reconstrói os trabalhos pendentes a partir do journal ou do outbox de cada loja"""
+        self.job_queue.default_store = self.store_key
+        journals = {store_key: self.load_store_journal(store_key) for store_key in self.store_keys()}
+        if len(journals) == 1:
+            self.journal = journals[self.store_key]
+        else:
+            self.journal = ShardedJournal(journals, self.store_key)
+            self.logger.info(f"Modo multi-loja: {len(journals)} lojas ({', '.join(map(str, journals))})")
+    
+    def load_store_journal(self, store_key):
+        """Abre o journal ou outbox da loja e enfileira seus pendentes
+        
+        A loja principal usa os arquivos configurados; as demais, cópias com
+        a loja no nome (stores.store_path).
+        """
+        job_file = store_path(self.job_file, store_key, self.store_key)
+        journal = JobJournal(
+            job_file,
+            fsync_interval=self.settings['journal_fsync_interval'],
+            compact_threshold=self.settings['journal_compact_threshold']
+        )
+        if self.settings['queue_store'] == 'outbox':
+            outbox = SQLiteOutbox(
+                store_path(self.settings['outbox_path'], store_key, self.store_key),
+                memory_jobs=self.settings['outbox_memory_jobs']
+            )
+            try:
+                self.import_journal(journal, outbox)
+                jobs = tag_store(outbox.load(), store_key)
+                self.enqueue_loaded_jobs(jobs)
+                self.logger.info(f"Carregados {len(jobs)} de {outbox.pending_count()} trabalhos pendentes do outbox"
+                                 f" (loja {store_key})")
+            except Exception as e:
+                self.logger.error(f"Erro ao carregar trabalhos pendentes: {e}")
+            outbox.start()
+            return outbox
+        
         try:
-            if os.path.exists(self.job_file):
-                with open(self.job_file, 'r', encoding='utf-8') as f:
-                    jobs = json.load(f)
-                
-                for job in jobs:
-                    self.job_queue.append(job)
-                
-                self.logger.info(f"Carregados {len(jobs)} trabalhos pendentes")
+            if os.path.exists(job_file) or journal.list_segments():
+                jobs = tag_store(journal.load(), store_key)
+                self.enqueue_loaded_jobs(jobs)
+                self.logger.info(f"Carregados {len(jobs)} trabalhos pendentes (loja {store_key})")
             else:
-                self.logger.info("Nenhum arquivo de trabalhos pendentes encontrado")
+                self.logger.info(f"Nenhum arquivo de trabalhos pendentes encontrado (loja {store_key})")
         except Exception as e:
             self.logger.error(f"Erro ao carregar trabalhos pendentes: {e}")
+        
+        journal.start()
+        return journal
+    
+    def import_journal(self, journal, outbox):
+        """Migra para o outbox os pendentes de um journal existente e remove seus arquivos"""
+        segments = journal.list_segments()
+        if not os.path.exists(journal.snapshot_file) and not segments:
+            return
+        jobs = journal.load()
+        outbox.import_jobs(jobs)
+        for path in [journal.snapshot_file] + [path for _seq, path in segments]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning(f"Não foi possível remover {path}: {e}")
+        self.logger.info(f"{len(jobs)} trabalhos pendentes migrados do journal para o outbox")
+    
+    def enqueue_loaded_jobs(self, jobs):
+        """Coloca na fila em memória trabalhos lidos do disco (ou no agendador, se ainda não venceram)"""
+        now = time.time()
+        with self.queue_condition:
+            for job in jobs:
+                if job.get('next_attempt', 0) > now:
+                    self.retry_scheduler.schedule(job)
+                else:
+                    self.job_queue.append(job)
+                self.track_active_product(job['product_id'], 1)
+    
+    def refill_queue_locked(self):
+        """Traz do outbox a próxima página quando a fila em memória esvazia (lock já obtido)"""
+        limit = self.settings['outbox_memory_jobs']
+        if self.journal is None or len(self.job_queue) > limit // 2:
+            return 0
+        jobs = self.journal.load_more(limit - len(self.job_queue))
+        self.enqueue_loaded_jobs(jobs)
+        return len(jobs)
     
     def save_pending_jobs(self):
-        """Salva trabalhos pendentes no arquivo de persistência"""
+        """Compacta o journal, gravando o snapshot completo dos pendentes"""
         try:
-            jobs = list(self.job_queue)
-            with open(self.job_file, 'w', encoding='utf-8') as f:
-                json.dump(jobs, f, ensure_ascii=False, indent=2)
+            if self.journal:
+                self.journal.close()
         except Exception as e:
             self.logger.error(f"Erro ao salvar trabalhos pendentes: {e}")
     
-    def add_job_to_queue(self, product_id):
-        """Adiciona um trabalho à fila e persiste"""
+    def track_active_product(self, product_id, delta):
+        """Conta os trabalhos pendentes ou em andamento de cada produto"""
+        with self.queue_condition:
+            count = self.active_products.get(product_id, 0) + delta
+            if count > 0:
+                self.active_products[product_id] = count
+            else:
+                self.active_products.pop(product_id, None)
+    
+    def claim_scan(self, product_id):
+        """Reserva o produto para um novo trabalho; False se a leitura é duplicada"""
+        with self.queue_condition:
+            self.metrics['scans_total'] += 1
+            if self.scan_dedup is None:
+                self.scan_dedup = ScanDeduplicator(
+                    ttl=self.settings['dedup_ttl'],
+                    max_entries=self.settings['dedup_max_entries']
+                )
+            recent = self.scan_dedup.seen(product_id)
+            if recent or product_id in self.active_products or (
+                self.journal is not None and self.journal.has_pending_product(product_id)
+            ):
+                self.metrics['duplicate_scans_dropped'] += 1
+                return False
+            self.active_products[product_id] = 1
+            return True
+    
+    def release_scan(self, product_id):
+        """Desfaz claim_scan de um trabalho que não chegou a ser gravado"""
+        with self.queue_condition:
+            self.active_products.pop(product_id, None)
+            if self.scan_dedup is not None:
+                self.scan_dedup.forget(product_id)
+    
+    def add_job_to_queue(self, product_id, source=None, store_key=None):
+        """Adiciona um trabalho à fila da loja (padrão: store_key) e registra no journal"""
+        if not self.claim_scan(product_id):
+            self.logger.info(f"Leitura duplicada de '{product_id}' descartada "
+                             f"({self.metrics['duplicate_scans_dropped']} descartadas)")
+            return False
+        
         job = {
+            'job_id': new_job_id(),
             'product_id': product_id,
             'timestamp': datetime.now().isoformat(),
-            'attempts': 0
+            'attempts': 0,
+            'store_key': store_key or self.store_key
         }
+        if source:
+            # Leitor de origem da leitura
+            job['source'] = source
         
-        self.job_queue.append(job)
-        self.save_pending_jobs()
+        # Grava no journal antes de tornar o trabalho visível ao processador,
+        # para que o ack nunca preceda o enqueue
+        with self.queue_condition:
+            if self.persist_job('enqueue', job):
+                self.job_queue.append(job)
+                self.queue_condition.notify()
+            else:
+                # Fila em memória cheia: o trabalho aguarda no outbox até refill_queue_locked
+                self.track_active_product(product_id, -1)
         self.logger.info(f"Produto '{product_id}' adicionado à fila")
+        return True
+    
+    def add_jobs_to_queue(self, product_ids, source=None, store_key=None):
+        """Adiciona um lote de trabalhos com uma única gravação no journal
+        
+        Cada id recebe um status, na ordem recebida: queued, duplicate,
+        invalid, unknown ou busy (acima de ingest_max_pending ou com falha ao
+        gravar o journal; o produtor deve reenviar mais tarde).
+        """
+        store_key = store_key or self.store_key
+        capacity = self.settings['ingest_max_pending'] - self.pending_job_count()
+        statuses = []
+        jobs = []
+        for product_id in product_ids:
+            product_id = product_id.strip() if isinstance(product_id, str) else product_id
+            if not self.validate_product_id(product_id):
+                statuses.append('invalid')
+            elif len(jobs) >= capacity:
+                statuses.append('busy')
+            elif not self.is_known_product(product_id, store_key):
+                statuses.append('unknown')
+            elif not self.claim_scan(product_id):
+                statuses.append('duplicate')
+            else:
+                job = {
+                    'job_id': new_job_id(),
+                    'product_id': product_id,
+                    'timestamp': datetime.now().isoformat(),
+                    'attempts': 0,
+                    'store_key': store_key
+                }
+                if source:
+                    job['source'] = source
+                jobs.append(job)
+                statuses.append('queued')
+        
+        busy = statuses.count('busy')
+        if jobs:
+            with self.queue_condition:
+                try:
+                    with self.stage_timers.stage('journal'):
+                        in_memory = self.journal.append_enqueue_batch(jobs, self.memory_queue_length())
+                except Exception as e:
+                    # Nada foi persistido: o lote não é enfileirado nem confirmado
+                    self.logger.error(f"Erro ao gravar journal (enqueue em lote): {e}")
+                    for job in jobs:
+                        self.release_scan(job['product_id'])
+                    statuses = ['busy' if status == 'queued' else status for status in statuses]
+                    self.count_metric('ingest_batches')
+                    self.count_metric('ingest_busy', len(jobs) + busy)
+                    return statuses
+                kept = []
+                for job, flag in zip(jobs, in_memory):
+                    if flag:
+                        kept.append(job)
+                    else:
+                        # Fila em memória cheia: o trabalho aguarda no outbox até a próxima página
+                        self.track_active_product(job['product_id'], -1)
+                if self.job_sink is not None:
+                    self.job_sink.deliver(kept)
+                else:
+                    self.job_queue.extend(kept)
+                    self.queue_condition.notify_all()
+            self.logger.info(f"Lote de {len(jobs)} produtos adicionado à fila ({source or 'ingestão'})")
+        
+        self.count_metric('ingest_batches')
+        if busy:
+            self.count_metric('ingest_busy', busy)
+            self.logger.warning(f"Fila cheia: {busy} produtos recusados (ingest_max_pending "
+                                f"{self.settings['ingest_max_pending']})")
+        return statuses
+    
+    def memory_queue_length(self):
+        """Trabalhos na fila em memória (a do núcleo asyncio, quando ativo)"""
+        if self.job_sink is not None:
+            return self.job_sink.queued_count()
+        return len(self.job_queue)
+    
+    def pending_job_count(self):
+        """Trabalhos pendentes no journal ou outbox (inclui os que aguardam só no disco)"""
+        if self.journal is None:
+            return len(self.job_queue)
+        return self.journal.pending_count()
+    
+    def persist_job(self, op, job):
+        """Grava um registro de enqueue/ack/retry no journal
+        
+        No enqueue retorna False se o trabalho ficou apenas no disco (outbox
+        com a fila em memória cheia).
+        """
+        in_memory = True
+        try:
+            with self.stage_timers.stage('journal'):
+                in_memory = self.append_journal(op, job)
+        except Exception as e:
+            self.logger.error(f"Erro ao gravar journal ({op}): {e}")
+        
+        if op == 'ack':
+            # Trabalho concluído ou descartado: o produto pode ser lido de novo
+            self.track_active_product(job['product_id'], -1)
+        return in_memory
+    
+    def append_journal(self, op, job):
+        """Grava o registro da operação no journal ou outbox"""
+        if op == 'enqueue':
+            return self.journal.append_enqueue(job, self.memory_queue_length())
+        if op == 'ack':
+            self.journal.append_ack(job)
+        elif op == 'retry':
+            self.journal.append_retry(job)
+        return True
     
     def validate_product_id(self, product_id):
         """Valida o formato do product_id"""
-        if not product_id or not isinstance(product_id, str):
-            return False
+        return valid_product_id(product_id)
+    
+    def is_known_product(self, product_id, store_key=None):
+        """Consulta o índice local; ids ausentes são confirmados no banco quando possível
         
-        # Remove espaços em branco
-        product_id = product_id.strip()
+        O índice cobre apenas a loja principal; nas demais a existência é
+        verificada no processamento. Sem banco para confirmar, o id ausente é
+        aceito: o índice pode estar desatualizado e o journal guarda a leitura
+        até a reconexão, quando o processamento verifica a existência.
+        """
+        if self.product_index is None or (store_key or self.store_key) != self.store_key:
+            return True
         
-        # Verifica se é numérico ou alfanumérico válido
-        if re.match(r'^[a-zA-Z0-9-_]+$', product_id):
+        known = self.product_index.contains(product_id)
+        if known is None:
+            # Índice ainda não carregado: a existência é verificada no processamento
+            return True
+        if known:
+            return True
+        if not self.db_connected:
+            self.logger.warning(f"Produto {product_id} ausente do índice aceito sem banco para confirmar")
+            return True
+        try:
+            known = self.product_index.lookup(self.storage, product_id)
+        except StorageError as e:
+            self.logger.warning(f"Erro ao confirmar produto {product_id} no banco, leitura aceita: {e}")
             return True
         
-        return False
+        if not known:
+            self.count_metric('unknown_scans_rejected')
+            self.logger.error(f"Produto desconhecido: ID={product_id}, Store={self.store_key}")
+        return known
+    
+    def product_index_worker(self):
+        """Thread que carrega o índice de produtos e o atualiza periodicamente"""
+        index = self.product_index
+        while self.running:
+            if self.db_connected:
+                try:
+                    was_loaded = index.loaded
+                    started = time.perf_counter()
+                    added = index.refresh(self.storage)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    if not was_loaded:
+                        self.logger.info(f"Índice de produtos carregado: {len(index)} produtos ({elapsed_ms:.1f} ms)")
+                    elif added:
+                        self.logger.debug(f"Índice de produtos atualizado: {added} novos ({len(index)} no total)")
+                except StorageError as e:
+                    self.logger.warning(f"Erro ao atualizar índice de produtos: {e}")
+            self.wait_while_running(self.settings['product_index_refresh'])
+    
+    def start_product_index(self):
+        """Cria o índice de produtos e inicia a thread de carga e atualização"""
+        self.product_index = ProductIndex(
+            self.store_key,
+            full_refresh_interval=self.settings['product_index_full_refresh']
+        )
+        self.product_index_thread = threading.Thread(target=self.product_index_worker, daemon=True)
+        self.product_index_thread.start()
     
     def process_job(self, job):
         """Processa um trabalho da fila"""
@@ -235,139 +784,368 @@ class StockflowQRService:
         
         if not self.validate_product_id(product_id):
             self.logger.error(f"Product ID inválido: {product_id}")
+            job['error'], job['error_detail'] = ERROR_INVALID, "Product ID inválido"
             return False
         
-        connection = self.get_db_connection()
-        if not connection:
-            self.logger.error("Não foi possível obter conexão com o banco")
-            return False
-        
+        store_key = job.get('store_key') or self.store_key
+        db_started = time.perf_counter()
         try:
-            cursor = connection.cursor(dictionary=True)
-            
-            # Inicia transação
-            connection.start_transaction()
-            
-            # Verifica se o produto existe
-            check_query = "SELECT * FROM tb_produto WHERE id_produto = %s AND store_key = %s"
-            cursor.execute(check_query, (product_id, self.store_key))
-            produto = cursor.fetchone()
-            
-            if not produto:
-                self.logger.warning(f"Produto não encontrado: ID={product_id}, Store={self.store_key}")
-                connection.rollback()
-                return False
-            
-            # Prepara dados para tb_produto_removido com horário de São Paulo
-            from datetime import timezone, timedelta
-            sao_paulo_tz = timezone(timedelta(hours=-3))
-            data_retirada_sp = datetime.now(sao_paulo_tz)
-            
-            # Monta dados para inserção na tabela tb_produto_removido
-            # Não incluímos id_removido pois será gerado automaticamente (AUTO_INCREMENT)
-            produto_removido = {
-                'store_key': produto['store_key'],
-                'nome': produto['nome'],
-                'peso': produto['peso'],
-                'grupo': produto['grupo'],
-                'quantidade': produto['quantidade'],
-                'conservacao': produto['conservacao'],
-                'data_entrada': produto['data_entrada'],
-                'data_retirada': data_retirada_sp,
-                'validade': produto['validade'],
-                'responsavel_entrada': produto['responsavel_entrada'],
-                'responsavel_retirada': 'Leitor QRCODE',
-                'preco': produto['preco'],
-                'unidade_medida': produto['unidade_medida'],
-                'etiquetas': produto['etiquetas'],
-                'status': produto['status'],
-                'fornecedor': produto['fornecedor'],
-                'sif_lote': produto['sif_lote'],
-                'val_fornecedor': produto['val_fornecedor'],
-                'fab_fornecedor': produto['fab_fornecedor'],
-                'status_impressao': produto['status_impressao']
-            }
-            
-            # Insere na tabela tb_produto_removido
-            columns = ', '.join(produto_removido.keys())
-            placeholders = ', '.join(['%s'] * len(produto_removido))
-            insert_query = f"INSERT INTO tb_produto_removido ({columns}) VALUES ({placeholders})"
-            
-            cursor.execute(insert_query, list(produto_removido.values()))
-            
-            # Remove da tabela original
-            delete_query = "DELETE FROM tb_produto WHERE id_produto = %s AND store_key = %s"
-            cursor.execute(delete_query, (product_id, self.store_key))
-            
-            # Confirma transação
-            connection.commit()
-            
-            self.logger.info(f"Produto processado com sucesso: {product_id}")
-            return True
-            
-        except MySQLError as e:
-            self.logger.error(f"Erro MySQL ao processar produto {product_id}: {e}")
-            connection.rollback()
+            with self.stage_timers.stage('db_job'):
+                moved = self.storage.move(product_id, self.sao_paulo_now(), REMOVED_BY, store_key)
+        except StorageUnavailable as e:
+            self.logger.error(f"Não foi possível obter conexão com o banco: {e}")
+            self.set_db_connected(False)
+            job['error'], job['error_detail'] = ERROR_CONNECTION, str(e)
+            return False
+        except StorageError as e:
+            self.logger.error(f"Erro {self.storage.name} ao processar produto {product_id}: {e}")
+            job['error'], job['error_detail'] = ERROR_DATABASE, str(e)
             return False
         except Exception as e:
             self.logger.error(f"Erro geral ao processar produto {product_id}: {e}")
-            connection.rollback()
+            job['error'], job['error_detail'] = ERROR_UNEXPECTED, str(e)
             return False
+        
+        if self.product_index is not None:
+            self.product_index.discard([product_id])
+        
+        if not moved:
+            self.logger.warning(f"Produto não encontrado: ID={product_id}, Store={store_key}")
+            self.count_metric('jobs_not_found')
+            job['error'], job['error_detail'] = ERROR_NOT_FOUND, "Produto não encontrado"
+            return False
+        
+        db_ms = (time.perf_counter() - db_started) * 1000
+        self.logger.info(f"Produto processado com sucesso: {product_id} ({db_ms:.1f} ms no banco)")
+        return True
+    
+    def sao_paulo_now(self):
+        """Retorna o horário atual de São Paulo"""
+        return sao_paulo_now()
+    
+    def prepare_storage(self):
+        """Prepara a baixa uma única vez; sem conexão, StorageUnavailable é propagada"""
+        if self.storage_prepared:
+            return
+        try:
+            self.storage.prepare()
+            self.storage_prepared = True
+        except StorageUnavailable:
+            raise
+        except StorageError as e:
+            self.logger.warning(f"Erro ao preparar a baixa no banco {self.storage.name}: {e}")
+    
+    def process_batch(self, product_ids, store_key=None):
+        """Move vários produtos de uma loja (padrão: store_key) para tb_produto_removido em uma única transação
+        
+        Usa INSERT ... SELECT e DELETE ... IN, sem trazer as linhas ao cliente.
+        
+        Retorna (sucesso, falha): lista de product_ids e dicionário
+        product_id -> (classe de erro de retry.py, mensagem). Sem conexão
+        todos os ids restantes são reportados como falha; em outro erro de
+        banco o lote é dividido ao meio até isolar os ids que de fato falham.
+        """
+        valid_ids = []
+        failed = {}
+        for product_id in dict.fromkeys(product_ids):
+            if self.validate_product_id(product_id):
+                valid_ids.append(product_id)
+            else:
+                self.logger.error(f"Product ID inválido: {product_id}")
+                failed[product_id] = (ERROR_INVALID, "Product ID inválido")
+        
+        if not valid_ids:
+            return [], failed
+        
+        store_key = store_key or self.store_key
+        # Todos constam no índice (apenas da loja principal): o backend dispensa o SELECT de existência
+        assume_existing = self.product_index is not None and store_key == self.store_key and all(
+            self.product_index.contains(product_id) for product_id in valid_ids
+        )
+        
+        db_started = time.perf_counter()
+        with self.stage_timers.stage('db_batch'):
+            found, missing, errors = self.storage.move_batch_isolating(
+                valid_ids, self.sao_paulo_now(), REMOVED_BY,
+                assume_existing=assume_existing, store_key=store_key
+            )
+        for product_id, error in errors.items():
+            failed[product_id] = (classify_error(error), str(error))
+        unavailable = next((error for error in errors.values() if isinstance(error, StorageUnavailable)), None)
+        if unavailable is not None:
+            self.logger.error(f"Não foi possível obter conexão com o banco: {unavailable}")
+            self.set_db_connected(False)
+        
+        for product_id in missing:
+            self.logger.warning(f"Produto não encontrado: ID={product_id}, Store={store_key}")
+            failed[product_id] = (ERROR_NOT_FOUND, "Produto não encontrado")
+        if missing:
+            self.count_metric('jobs_not_found', len(missing))
+        if self.product_index is not None:
+            self.product_index.discard(found + missing)
+        
+        db_ms = (time.perf_counter() - db_started) * 1000
+        if found:
+            self.logger.info(f"Lote processado: {len(found)} produtos removidos, {len(failed)} falhas ({db_ms:.1f} ms no banco)")
+        return found, failed
+    
+    def take_ready_job_locked(self):
+        """Retira o primeiro job cujo produto não está em processamento (lock já obtido)"""
+        self.promote_due_retries_locked()
+        self.refill_queue_locked()
+        job = self.job_queue.take_ready(lambda job: job['product_id'] not in self.in_flight_products)
+        if job is not None:
+            self.in_flight_products.add(job['product_id'])
+        return job
+    
+    def has_ready_job_locked(self):
+        """Indica se algum job pode ser retirado agora (lock já obtido)"""
+        return any(job['product_id'] not in self.in_flight_products for job in self.job_queue)
+    
+    def take_job(self):
+        """Retira um job pronto da fila, ou None se outro worker o levou antes"""
+        with self.queue_condition:
+            return self.take_ready_job_locked()
+    
+    def release_jobs(self, jobs):
+        """Libera os produtos processados para os demais workers"""
+        with self.queue_condition:
+            for job in jobs:
+                self.in_flight_products.discard(job['product_id'])
+            self.queue_condition.notify_all()
+    
+    def current_batch_size(self):
+        """batch_size, ou drain_batch_size enquanto houver acúmulo na fila"""
+        batch_size = self.settings['batch_size']
+        drain_batch_size = self.settings['drain_batch_size']
+        if drain_batch_size > batch_size and len(self.job_queue) >= drain_batch_size:
+            return drain_batch_size
+        return batch_size
+    
+    def take_batch(self, batch_size):
+        """Retira até batch_size trabalhos da fila, aguardando no máximo batch_max_linger"""
+        deadline = time.monotonic() + self.settings['batch_max_linger']
+        batch = []
+        with self.queue_condition:
+            while len(batch) < batch_size:
+                job = self.take_ready_job_locked()
+                if job:
+                    batch.append(job)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    break
+                self.queue_condition.wait(remaining)
+        return batch
+    
+    def promote_due_retries_locked(self):
+        """Devolve à fila os trabalhos cuja próxima tentativa já venceu (lock já obtido)"""
+        self.job_queue.extend(self.retry_scheduler.pop_due())
+    
+    def next_retry_delay(self, job, error):
+        """Conta a falha e agenda job['next_attempt'] pela política da classe de erro
+        
+        Retorna (espera em segundos, máximo de tentativas); a espera é None
+        quando as tentativas da classe se esgotaram.
+        """
+        policy = retry_policy(error, self.settings['retry_policy'])
+        job['attempts'] += 1
+        if job['attempts'] >= policy['max_attempts']:
+            return None, policy['max_attempts']
+        delay = backoff_delay(policy, job['attempts'])
+        job['next_attempt'] = time.time() + delay
+        return delay, policy['max_attempts']
+    
+    def handle_job_result(self, job, success):
+        """Confirma o trabalho ou agenda nova tentativa com backoff"""
+        if success:
+            # Sucesso - confirma no journal
+            self.persist_job('ack', job)
+            self.record_job_result(job, 'committed')
+            return
+        
+        # Falha - aguarda no agendador sem bloquear os demais trabalhos da fila
+        error = job.pop('error', None) or ERROR_UNEXPECTED
+        detail = job.pop('error_detail', None)
+        delay, max_attempts = self.next_retry_delay(job, error)
+        if delay is not None:
+            self.persist_job('retry', job)
+            self.record_job_result(job, 'retried')
+            with self.queue_condition:
+                self.retry_scheduler.schedule(job)
+                self.queue_condition.notify_all()
+            self.logger.warning(f"Nova tentativa de {job['product_id']} em {delay:.1f}s "
+                                f"({error}, tentativa {job['attempts']}/{max_attempts})")
+        else:
+            self.discard_job(job, error, detail)
+    
+    def discard_job(self, job, error, detail=None):
+        """Grava o trabalho esgotado no dead-letter e o remove da fila persistida"""
+        # Dead-letter antes do ack: uma queda entre os dois repete o trabalho em vez de perdê-lo
+        try:
+            if self.dead_letters is None:
+                self.dead_letters = DeadLetterStore(self.settings['dead_letter_path'])
+            self.dead_letters.add(job, job.get('store_key') or self.store_key, error, detail)
+        except Exception as e:
+            self.logger.error(f"Erro ao gravar dead-letter de {job['product_id']}: {e}")
+        self.persist_job('ack', job)
+        self.record_job_result(job, 'discarded')
+        self.logger.error(f"Job descartado após {job['attempts']} tentativas ({error}): {job['product_id']}. "
+                          f"Reprocesse com replay.py")
+    
+    def record_job_result(self, job, outcome):
+        """Contabiliza o resultado ('committed', 'retried', 'discarded') e a latência leitura-commit"""
+        self.count_metric(f"jobs_{outcome}")
+        if outcome != 'committed':
+            return
+        if self.first_commit_seconds is None and self.started_at is not None:
+            self.record_first_commit()
+        try:
+            latency = (datetime.now() - datetime.fromisoformat(job['timestamp'])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return
+        self.scan_latency.observe(max(latency, 0.0))
+    
+    def record_first_commit(self):
+        """Registra uma única vez o tempo entre o início do serviço e o primeiro commit"""
+        with self.metrics_lock:
+            if self.first_commit_seconds is not None:
+                return
+            self.first_commit_seconds = time.monotonic() - self.started_at
+        self.logger.info(f"Primeiro commit {self.first_commit_seconds * 1000:.0f} ms após o início do serviço "
+                         f"({len(self.job_queue)} trabalhos ainda na fila)")
+    
+    def count_metric(self, key, amount=1):
+        """Incrementa um contador compartilhado entre threads de processamento"""
+        with self.metrics_lock:
+            self.metrics[key] += amount
+    
+    def process_queue_batch(self, batch_size):
+        """Processa um lote de trabalhos da fila em uma única transação"""
+        batch = self.take_batch(batch_size)
+        if not batch:
+            # Fila esvaziada por outro worker
+            return
+        
+        self.logger.info(f"Processando lote de {len(batch)} jobs")
+        # Uma transação por loja; o rodízio de take_batch intercala as lojas no lote
+        by_store = {}
+        for job in batch:
+            by_store.setdefault(job.get('store_key') or self.store_key, []).append(job)
+        try:
+            for store_key, jobs in by_store.items():
+                self.process_store_batch(jobs, store_key)
         finally:
-            cursor.close()
-            connection.close()
+            self.release_jobs(batch)
+    
+    def process_store_batch(self, batch, store_key):
+        """Baixa em lote dos trabalhos de uma loja e trata o resultado de cada um"""
+        succeeded, failed = self.process_batch([job['product_id'] for job in batch], store_key)
+        succeeded = set(succeeded)
+        for job in batch:
+            success = job['product_id'] in succeeded
+            if not success:
+                job['error'], job['error_detail'] = failed.get(job['product_id'], (ERROR_UNEXPECTED, None))
+            self.handle_job_result(job, success)
+    
+    def wait_for_jobs(self):
+        """Bloqueia até haver trabalhos com banco conectado ou o serviço parar"""
+        with self.queue_condition:
+            if self.job_queue and not self.db_connected:
+                self.logger.warning(f"Fila tem {len(self.job_queue)} itens mas banco não está conectado")
+            while self.running:
+                self.promote_due_retries_locked()
+                self.refill_queue_locked()
+                if self.db_connected and self.has_ready_job_locked():
+                    return True
+                # Dorme até um novo trabalho, a reconexão ou a próxima tentativa agendada
+                self.queue_condition.wait(self.retry_scheduler.time_until_due())
+            return False
+    
+    def wait_while_running(self, timeout):
+        """Aguarda até timeout segundos, retornando antes se o serviço parar"""
+        with self.queue_condition:
+            self.queue_condition.wait_for(lambda: not self.running, timeout=timeout)
     
     def queue_processor(self):
         """Thread para processar a fila de trabalhos"""
         self.logger.info("Thread de processamento da fila iniciada")
         while self.running:
             try:
-                # Log de debug para monitorar o estado
-                if len(self.job_queue) > 0:
-                    self.logger.debug(f"Fila tem {len(self.job_queue)} itens. DB conectado: {self.db_connected}")
+                # Dorme até add_job_to_queue ou a reconexão sinalizarem trabalho
+                if not self.wait_for_jobs():
+                    break
                 
-                if self.job_queue and self.db_connected:
-                    job = self.job_queue.popleft()
-                    self.logger.info(f"Processando job: {job['product_id']}")
-                    
-                    if self.process_job(job):
-                        # Sucesso - remove do arquivo
-                        self.save_pending_jobs()
-                    else:
-                        # Falha - recoloca na fila com incremento de tentativas
-                        job['attempts'] += 1
-                        if job['attempts'] < 3:
-                            self.job_queue.append(job)
-                            self.save_pending_jobs()
-                            self.logger.warning(f"Recolocando job na fila. Tentativa {job['attempts']}/3")
-                        else:
-                            self.logger.error(f"Job descartado após 3 tentativas: {job['product_id']}")
-                elif self.job_queue and not self.db_connected:
-                    self.logger.warning(f"Fila tem {len(self.job_queue)} itens mas banco não está conectado")
+                self.logger.debug(f"Fila tem {len(self.job_queue)} itens. DB conectado: {self.db_connected}")
                 
-                time.sleep(1)  # Evita uso excessivo de CPU
+                # Falhas não pausam o worker: cada job aguarda sua própria
+                # tentativa no agendador (handle_job_result)
+                batch_size = self.current_batch_size()
+                if batch_size > 1:
+                    # Lotes também drenam o acúmulo deixado por uma queda do banco
+                    self.process_queue_batch(batch_size)
+                else:
+                    job = self.take_job()
+                    if job is None:
+                        # Outro worker retirou o job primeiro
+                        continue
+                    self.logger.info(f"Processando job: {job['product_id']}")
+                    try:
+                        success = self.process_job(job)
+                        self.handle_job_result(job, success)
+                    finally:
+                        self.release_jobs([job])
                 
             except Exception as e:
                 self.logger.error(f"Erro no processador de fila: {e}")
-                time.sleep(5)
+                self.count_metric('queue_errors')
+                self.wait_while_running(5)
     
-    def db_reconnect_worker(self):
-        """Thread para reconexão com backoff exponencial"""
-        backoff_time = 1
-        max_backoff = 300  # 5 minutos
+    def db_health_worker(self):
+        """Thread de verificação de saúde e reconexão do banco
+        
+        Conectado, pinga o servidor e as conexões ociosas a cada
+        db_health_interval, reabrindo só as quebradas; assim uma queda é
+        detectada antes da próxima leitura. Desconectado, tenta de novo com
+        backoff curto (até db_reconnect_max_backoff), que volta ao mínimo
+        no primeiro ping bem-sucedido.
+        """
+        interval = self.settings['db_health_interval']
+        max_backoff = self.settings['db_reconnect_max_backoff']
+        min_backoff = min(0.1, max_backoff)
+        backoff_time = min_backoff
+        lost_at = None
+        connected_once = self.db_connected
         
         while self.running:
-            if not self.db_connected:
-                self.logger.info(f"Tentando reconectar ao banco. Aguardando {backoff_time}s...")
-                time.sleep(backoff_time)
-                
-                if self.setup_database_pool():
-                    self.logger.info("Reconexão com banco bem-sucedida")
-                    backoff_time = 1  # Reset backoff
+            if self.db_connected:
+                lost_at = None
+                connected_once = True
+                # Dorme até o intervalo da verificação ou o processamento sinalizar perda de conexão
+                self.db_health_wakeup.wait(interval or None)
+                if self.running and self.db_connected and interval:
+                    self.check_database_health(idle_after=interval)
+                continue
+            
+            if lost_at is None:
+                lost_at = time.monotonic()
+                backoff_time = min_backoff
+                if connected_once:
+                    self.logger.info(f"Tentando reconectar ao banco a cada {max_backoff:g}s no máximo...")
+            self.db_health_wakeup.clear()
+            try:
+                # connect_storage acorda o processador ao restabelecer a conexão
+                self.connect_storage()
+                elapsed = time.monotonic() - lost_at
+                if connected_once:
+                    self.logger.info(f"Reconexão com banco bem-sucedida em {elapsed:.2f}s")
                 else:
-                    backoff_time = min(backoff_time * 2, max_backoff)
-            else:
-                time.sleep(10)  # Verifica a cada 10 segundos
+                    self.logger.info(f"Conexão com o banco {self.storage.name} estabelecida em {elapsed:.2f}s")
+            except StorageUnavailable as e:
+                if not connected_once and backoff_time == min_backoff:
+                    self.logger.error(f"Erro ao conectar ao banco {self.storage.name}: {e}. Tentando novamente...")
+                self.wait_while_running(backoff_time)
+                backoff_time = min(backoff_time * 2, max_backoff)
     
     def find_qr_device(self):
         """Encontra o dispositivo do leitor QR Code com detecção inteligente"""
@@ -389,64 +1167,54 @@ class StockflowQRService:
                 self.logger.error("Nenhum dispositivo de entrada encontrado")
                 return None
             
-            # Lista de critérios de prioridade para identificar leitores QR Code
-            qr_criteria = [
-                # Prioridade 1: Dispositivos conhecidos de QR Code
-                ['arm cm0', 'cm0'],
-                # Prioridade 2: Termos específicos de leitores
-                ['barcode', 'scanner', 'qr', 'code reader', 'honeywell', 'datalogic', 'symbol'],
-                # Prioridade 3: Dispositivos USB HID genéricos que podem ser leitores
-                ['usb hid', 'hid keyboard'],
-                # Prioridade 4: Teclados USB (fallback)
-                ['usb keyboard', 'keyboard']
-            ]
-            
             self.logger.info(f"Dispositivos de entrada encontrados: {len(devices)}")
             for device in devices:
                 self.logger.debug(f"  - {device.name} ({device.path})")
             
-            # Primeiro, tenta usar o dispositivo preferido se disponível
-            if self.preferred_device:
-                for device in devices:
-                    if (device.name == self.preferred_device['name'] and 
-                        device.path == self.preferred_device['path']):
-                        if self.validate_device_capabilities(device):
-                            # Testa a funcionalidade do dispositivo preferido
-                            if self.test_device_functionality(device, timeout=2):
-                                self.logger.info(f"Usando dispositivo preferido validado: {device.name} ({device.path})")
-                                return device
-                            else:
-                                self.logger.warning(f"Dispositivo preferido {device.name} não passou no teste de funcionalidade")
-                                # Limpa o dispositivo preferido se não for mais funcional
-                                self.preferred_device = None
-                                break
-                        else:
-                            self.logger.warning(f"Dispositivo preferido {device.name} não tem capacidades adequadas")
-                            break
+            # Primeiro, reconhece leitores já validados pela impressão digital (sem teste)
+            for device in devices:
+                if self.matches_known_fingerprint(device):
+                    self.logger.info(f"Leitor reconhecido pela impressão digital: {device.name} ({device.path})")
+                    if not self.preferred_device or self.preferred_device.get('path') != device.path:
+                        self.save_device_config(device)
+                    self.close_devices(devices, keep=device)
+                    return device
             
-            # Procura por dispositivos seguindo a ordem de prioridade
-            for priority, keywords in enumerate(qr_criteria, 1):
-                for device in devices:
-                    device_name = device.name.lower()
-                    
-                    # Verifica se alguma palavra-chave corresponde
-                    for keyword in keywords:
-                        if keyword in device_name:
-                            # Valida se o dispositivo tem capacidades de teclado
-                            if self.validate_device_capabilities(device):
-                                # Testa a funcionalidade do dispositivo
-                                if self.test_device_functionality(device, timeout=2):
-                                    self.logger.info(f"Dispositivo selecionado e validado (prioridade {priority}): {device.name} ({device.path})")
-                                    # Salva como dispositivo preferido para próximas execuções
-                                    self.save_device_config(device)
-                                    return device
-                                else:
-                                    self.logger.warning(f"Dispositivo {device.name} não passou no teste de funcionalidade")
-                                    break
-                            else:
-                                self.logger.warning(f"Dispositivo {device.name} não tem capacidades adequadas")
-                                break
+            # Candidatos em ordem: dispositivo preferido, depois a ordem de prioridade
+            candidates = []
+            for device in devices:
+                is_preferred = (self.preferred_device and
+                                device.name == self.preferred_device['name'] and
+                                device.path == self.preferred_device['path'])
+                priority = 0 if is_preferred else self.device_priority(device)
+                if priority is None:
+                    continue
+                if self.validate_device_capabilities(device):
+                    candidates.append((priority, device))
+                else:
+                    self.logger.warning(f"Dispositivo {device.name} não tem capacidades adequadas")
+            candidates.sort(key=lambda item: item[0])
             
+            # Testa todos os candidatos ao mesmo tempo, com um único prazo
+            working = self.probe_devices([device for _, device in candidates], self.settings['device_probe_timeout'])
+            for priority, device in candidates:
+                if device not in working:
+                    self.logger.warning(f"Dispositivo {device.name} não passou no teste de funcionalidade")
+                    if priority == 0:
+                        # Limpa o dispositivo preferido se não for mais funcional
+                        self.preferred_device = None
+                    continue
+                
+                if priority == 0:
+                    self.logger.info(f"Usando dispositivo preferido validado: {device.name} ({device.path})")
+                else:
+                    self.logger.info(f"Dispositivo selecionado e validado (prioridade {priority}): {device.name} ({device.path})")
+                # Salva como dispositivo preferido (e impressão digital) para próximas execuções
+                self.save_device_config(device)
+                self.close_devices(devices, keep=device)
+                return device
+            
+            self.close_devices(devices)
             self.logger.error("Nenhum dispositivo de entrada adequado encontrado")
             return None
             
@@ -454,6 +1222,200 @@ class StockflowQRService:
             self.logger.error(f"Erro ao procurar dispositivos: {e}")
             return None
     
+    def find_qr_devices(self, exclude_paths=()):
+        """Encontra todos os leitores QR Code compatíveis (modo multi_scanner)
+        
+        Dispositivos das prioridades 1 a 3 são todos selecionados; teclados
+        genéricos (prioridade 4) só entram se nenhum outro for encontrado.
+        """
+        if not EVDEV_AVAILABLE:
+            self.logger.error("evdev não está disponível. Instale com: pip install evdev")
+            return []
+        
+        candidates = []
+        for path in evdev.list_devices():
+            if path in exclude_paths:
+                continue
+            try:
+                candidates.append(evdev.InputDevice(path))
+            except (OSError, PermissionError) as e:
+                self.logger.warning(f"Não foi possível acessar dispositivo {path}: {e}")
+        
+        selected = []
+        fallback = []
+        for device in candidates:
+            priority = self.device_priority(device)
+            is_preferred = self.is_preferred_device(device)
+            if priority is None and not is_preferred:
+                continue
+            if not self.validate_device_capabilities(device):
+                continue
+            if priority == len(QR_DEVICE_CRITERIA) and not is_preferred:
+                fallback.append(device)
+            else:
+                selected.append(device)
+        
+        if not selected:
+            selected = fallback
+        
+        # Leitores reconhecidos pela impressão digital dispensam o teste
+        known = [device for device in selected if self.matches_known_fingerprint(device)]
+        working = known + self.probe_devices([device for device in selected if device not in known], timeout=0)
+        qualified = [device for device in selected if device in working]
+        
+        # Fecha os dispositivos que não serão monitorados
+        for device in candidates:
+            if device not in qualified:
+                try:
+                    device.close()
+                except Exception:
+                    pass
+        
+        return qualified
+    
+    def device_fingerprint(self, device):
+        """Identificação estável do leitor: fabricante, produto, nome e teclas suportadas"""
+        key_codes = device.capabilities().get(ecodes.EV_KEY, [])
+        return {
+            'vendor_id': device.info.vendor,
+            'product_id': device.info.product,
+            'name': device.name,
+            'keys': short_hash(','.join(str(code) for code in sorted(key_codes)))
+        }
+    
+    def matches_known_fingerprint(self, device):
+        """Verifica se o dispositivo é um leitor já validado (independe do caminho)"""
+        if not self.known_fingerprints:
+            return False
+        try:
+            return self.device_fingerprint(device) in self.known_fingerprints
+        except (OSError, IOError):
+            return False
+    
+    def probe_devices(self, devices, timeout):
+        """Testa vários dispositivos ao mesmo tempo com um único prazo compartilhado
+        
+        O dispositivo é considerado funcional se estiver acessível e puder ser
+        capturado; o prazo serve apenas para drenar eventos pendentes.
+        """
+        import select
+        
+        grabbed = []
+        for device in devices:
+            try:
+                device.capabilities()
+                device.grab()
+                grabbed.append(device)
+            except Exception as e:
+                self.logger.warning(f"Erro ao testar funcionalidade do dispositivo {device.name}: {e}")
+        
+        try:
+            pending = {device.fd: device for device in grabbed}
+            deadline = time.monotonic() + timeout
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                ready, _, _ = select.select(list(pending), [], [], remaining)
+                for fd in ready:
+                    device = pending.pop(fd)
+                    try:
+                        events = list(device.read())
+                        self.logger.debug(f"Dispositivo {device.name} respondeu com {len(events)} eventos")
+                    except Exception:
+                        pass
+        finally:
+            for device in grabbed:
+                try:
+                    device.ungrab()
+                except Exception:
+                    pass
+        
+        return grabbed
+    
+    def close_devices(self, devices, keep=None):
+        """Fecha os dispositivos abertos durante a busca, exceto o selecionado"""
+        for device in devices:
+            if device is keep:
+                continue
+            try:
+                device.close()
+            except Exception:
+                pass
+    
+    def device_priority(self, device):
+        """Prioridade do dispositivo segundo QR_DEVICE_CRITERIA (None = não é leitor)"""
+        device_name = device.name.lower()
+        for priority, keywords in enumerate(QR_DEVICE_CRITERIA, 1):
+            if any(keyword in device_name for keyword in keywords):
+                return priority
+        return None
+    
+    def is_preferred_device(self, device):
+        """Verifica se é o dispositivo preferido salvo em device_config.json"""
+        return bool(self.preferred_device) and device.path == self.preferred_device['path']
+    
+    def probe_device(self, path, allow_fallback=True):
+        """Abre e valida um único dispositivo recém-conectado"""
+        try:
+            device = evdev.InputDevice(path)
+        except (OSError, PermissionError) as e:
+            # O udev ainda pode estar ajustando as permissões; IN_ATTRIB trará nova tentativa
+            self.logger.debug(f"Dispositivo {path} ainda não acessível: {e}")
+            return None
+        
+        priority = self.device_priority(device)
+        accepted = self.is_preferred_device(device) or self.matches_known_fingerprint(device) or (
+            priority is not None and (allow_fallback or priority < len(QR_DEVICE_CRITERIA))
+        )
+        if accepted and self.validate_device_capabilities(device) and self.probe_devices([device], timeout=0):
+            self.logger.info(f"Leitor conectado via hotplug: {device.name} ({device.path})")
+            return device
+        
+        try:
+            device.close()
+        except Exception:
+            pass
+        return None
+    
+    def start_hotplug(self):
+        """Inicia o observador inotify; sem suporte, mantém a varredura periódica"""
+        if not self.settings['hotplug'] or not EVDEV_AVAILABLE or self.hotplug:
+            return
+        try:
+            self.hotplug = HotplugWatcher().start()
+            self.logger.info("Detecção de leitores via inotify em /dev/input ativada")
+        except OSError as e:
+            self.logger.warning(f"inotify indisponível ({e}). Usando varredura periódica de dispositivos")
+            self.hotplug = None
+    
+    def wait_for_hotplug(self, timeout):
+        """Aguarda até timeout segundos (None = sem prazo) por um leitor conectado e o retorna"""
+        if not self.hotplug:
+            self.wait_while_running(timeout)
+            return None
+        
+        import select
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.running:
+            remaining = 1 if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([self.hotplug], [], [], min(remaining, 1))
+            if not ready:
+                continue
+            for action, path in self.hotplug.read_events():
+                if action == 'add':
+                    device = self.probe_device(path)
+                    if device:
+                        return device
+                elif action == 'rescan':
+                    device = self.find_qr_device()
+                    if device:
+                        return device
+        return None
+    
     def validate_device_capabilities(self, device):
         """Valida se o dispositivo tem capacidades de entrada de teclado"""
         try:
@@ -479,6 +1441,10 @@ class StockflowQRService:
     
     def check_for_new_devices(self):
         """Verifica se novos dispositivos foram conectados"""
+        # Com hotplug os novos dispositivos chegam pelo inotify
+        if self.hotplug:
+            return False
+        
         current_time = time.time()
         
         # Só verifica se passou o intervalo definido
@@ -512,53 +1478,6 @@ class StockflowQRService:
             self.logger.warning(f"Erro ao verificar novos dispositivos: {e}")
             return False
     
-    def test_device_functionality(self, device, timeout=5):
-        """Testa se o dispositivo está funcionando corretamente"""
-        try:
-            if not device:
-                return False
-            
-            # Verifica se o dispositivo ainda está acessível
-            try:
-                device.capabilities()
-            except (OSError, IOError):
-                self.logger.warning(f"Dispositivo {device.name} não está mais acessível")
-                return False
-            
-            # Testa se consegue ler eventos (com timeout)
-            import select
-            
-            # Configura o dispositivo para não bloquear
-            device.grab()
-            
-            try:
-                # Usa select para verificar se há dados disponíveis
-                ready, _, _ = select.select([device.fd], [], [], timeout)
-                
-                if ready:
-                    # Há dados disponíveis, tenta ler um evento
-                    try:
-                        events = list(device.read())
-                        self.logger.debug(f"Dispositivo {device.name} respondeu com {len(events)} eventos")
-                        return True
-                    except Exception:
-                        pass
-                
-                # Se não há eventos, ainda considera funcional
-                # (dispositivo pode estar inativo mas funcionando)
-                self.logger.debug(f"Dispositivo {device.name} está acessível mas sem eventos no momento")
-                return True
-                
-            finally:
-                try:
-                    device.ungrab()
-                except:
-                    pass
-            
-        except Exception as e:
-            self.logger.warning(f"Erro ao testar funcionalidade do dispositivo: {e}")
-            return False
-        
     def log_hardware_info(self):
         """Registra informações detalhadas sobre o hardware para troubleshooting"""
         try:
@@ -620,8 +1539,182 @@ class StockflowQRService:
         except Exception as e:
             self.logger.error(f"Erro ao registrar informações de hardware: {e}")
     
+    def handle_input_event(self, event, device):
+        """Acumula teclas no código em leitura do leitor de origem e enfileira no ENTER"""
+        if event.type != ecodes.EV_KEY:
+            return
+        
+        with self.stage_timers.stage('decode'):
+            decoder = self.key_decoders.get(device.path)
+            if decoder is None:
+                decoder = self.key_decoders[device.path] = KeyDecoder()
+            # Mesmo mapeamento (Shift, ENTER do teclado numérico) do decodificador bruto
+            code = decoder.feed_key(event.code, event.value)
+        if code is not None:
+            self.handle_scanned_code(code, device)
+    
+    def handle_scanned_code(self, code, device):
+        """Valida e enfileira um código completo lido de um leitor"""
+        product_id = code.strip()
+        if not product_id:
+            return
+        
+        self.logger.info(f"QR Code lido: {product_id} ({device.name} {device.path})")
+        
+        # Validação, índice, duplicatas, journal e fila (o journal também é medido à parte)
+        with self.stage_timers.stage('enqueue'):
+            if not self.validate_product_id(product_id):
+                self.logger.error(f"QR Code inválido: {product_id}")
+            else:
+                store_key = self.store_for_device(device)
+                if self.is_known_product(product_id, store_key):
+                    self.add_job_to_queue(product_id, source=device.path, store_key=store_key)
+    
+    def store_for_device(self, device):
+        """Loja do leitor pelos padrões de "stores" (a primeira que corresponder), ou store_key"""
+        if not self.settings['stores']:
+            return self.store_key
+        # O nome entra na chave: um eventN pode ser reaproveitado por outro leitor
+        key = (device.path, device.name)
+        store_key = self.device_stores.get(key)
+        if store_key is None:
+            store_key = next(
+                (candidate for candidate, patterns in self.settings['stores'].items()
+                 if device_matches(device, patterns)),
+                self.store_key
+            )
+            self.device_stores[key] = store_key
+            if store_key != self.store_key:
+                self.logger.info(f"Leitor {device.name} ({device.path}) associado à loja {store_key}")
+        return store_key
+    
+    def read_device_events(self, device):
+        """Lê e trata os eventos disponíveis no leitor (não bloqueante)"""
+        if self.settings['raw_input_decoder']:
+            decoder = self.raw_decoders.setdefault(device.path, RawKeyDecoder())
+            with self.stage_timers.stage('decode'):
+                codes = list(decoder.read(device.fd))
+            for code in codes:
+                self.handle_scanned_code(code, device)
+        else:
+            for event in device.read():
+                self.handle_input_event(event, device)
+    
+    def read_raw_loop(self, device):
+        """Loop de leitura bloqueante do leitor usando o decodificador bruto"""
+        import select
+        
+        while self.running:
+            ready, _, _ = select.select([device.fd], [], [], 1)
+            if ready:
+                try:
+                    self.read_device_events(device)
+                except BlockingIOError:
+                    pass
+    
+    def attach_new_devices(self, epoll):
+        """Registra no epoll os leitores compatíveis ainda não monitorados"""
+        import select
+        
+        open_paths = {device.path for device in self.input_devices.values()}
+        for device in self.find_qr_devices(exclude_paths=open_paths):
+            epoll.register(device.fd, select.EPOLLIN)
+            self.input_devices[device.fd] = device
+            self.record_device_connected()
+            self.logger.info(f"Leitor conectado: {device.name} ({device.path})")
+    
+    def detach_device(self, epoll, fd, reason):
+        """Remove um leitor desconectado do epoll"""
+        device = self.input_devices.pop(fd, None)
+        try:
+            epoll.unregister(fd)
+        except (OSError, ValueError):
+            pass
+        if device:
+            self.key_decoders.pop(device.path, None)
+            self.raw_decoders.pop(device.path, None)
+            self.metrics['device_disconnects'] += 1
+            self.logger.error(f"Leitor desconectado: {device.name} ({device.path}): {reason}")
+            try:
+                device.close()
+            except Exception:
+                pass
+    
+    def handle_hotplug_events(self, epoll):
+        """Anexa ou remove leitores conforme os eventos do inotify"""
+        import select
+        
+        for action, path in self.hotplug.read_events():
+            open_fds = {device.path: fd for fd, device in self.input_devices.items()}
+            if action == 'add' and path not in open_fds:
+                device = self.probe_device(path, allow_fallback=not self.input_devices)
+                if device:
+                    epoll.register(device.fd, select.EPOLLIN)
+                    self.input_devices[device.fd] = device
+                    self.record_device_connected()
+            elif action == 'remove' and path in open_fds:
+                self.detach_device(epoll, open_fds[path], "dispositivo removido")
+            elif action == 'rescan':
+                self.attach_new_devices(epoll)
+    
+    def monitor_multiple_devices(self):
+        """Monitora todos os leitores compatíveis em um único loop epoll"""
+        import select
+        
+        epoll = select.epoll()
+        last_scan = 0
+        if self.hotplug:
+            # Varredura única; depois disso os leitores chegam pelo inotify
+            epoll.register(self.hotplug.fileno(), select.EPOLLIN)
+            self.attach_new_devices(epoll)
+            if not self.input_devices:
+                self.logger.warning("Nenhum leitor encontrado. Aguardando conexão...")
+        try:
+            while self.running:
+                # Sem hotplug, procura leitores novos periodicamente ou quando não há nenhum
+                if not self.hotplug and (not self.input_devices or time.monotonic() - last_scan >= self.device_scan_interval):
+                    last_scan = time.monotonic()
+                    self.attach_new_devices(epoll)
+                    
+                    if not self.input_devices:
+                        self.logger.warning("Nenhum leitor encontrado. Tentando novamente em 10s...")
+                        self.wait_while_running(10)
+                        continue
+                
+                # Timeout curto para perceber o encerramento do serviço
+                for fd, mask in epoll.poll(1):
+                    if self.hotplug and fd == self.hotplug.fileno():
+                        self.handle_hotplug_events(epoll)
+                        continue
+                    device = self.input_devices.get(fd)
+                    if device is None:
+                        continue
+                    try:
+                        self.read_device_events(device)
+                    except BlockingIOError:
+                        pass
+                    except OSError as e:
+                        self.detach_device(epoll, fd, e)
+                        continue
+                    if mask & (select.EPOLLERR | select.EPOLLHUP):
+                        self.detach_device(epoll, fd, "EPOLLHUP")
+        finally:
+            for device in self.input_devices.values():
+                try:
+                    device.close()
+                except Exception:
+                    pass
+            self.input_devices = {}
+            epoll.close()
+    
     def monitor_input_events(self):
         """Monitora eventos de entrada do leitor QR Code com fallback automático"""
+        self.start_hotplug()
+        
+        if self.settings['multi_scanner']:
+            self.monitor_multiple_devices()
+            return
+        
         device_retry_count = 0
         max_device_retries = 3
         
@@ -634,22 +1727,35 @@ class StockflowQRService:
                     else:
                         self.input_device = self.find_qr_device()
                     
+                    if not self.input_device and self.hotplug:
+                        # Sem varredura periódica: o próximo leitor chega pelo inotify
+                        self.logger.warning("Dispositivo de entrada não encontrado. Aguardando conexão de um leitor...")
+                        self.input_device = self.wait_for_hotplug(None)
+                        if self.input_device:
+                            self.record_device_connected()
+                            self.logger.info(f"Dispositivo conectado com sucesso: {self.input_device.name}")
+                        continue
+                    
                     if not self.input_device:
                         device_retry_count += 1
                         if device_retry_count <= max_device_retries:
                             self.logger.warning(f"Dispositivo de entrada não encontrado. Tentativa {device_retry_count}/{max_device_retries}. Tentando novamente em 10s...")
-                            time.sleep(10)
+                            self.input_device = self.wait_for_hotplug(10)
                         else:
                             self.logger.error(f"Falha ao encontrar dispositivo após {max_device_retries} tentativas. Aguardando 30s antes de tentar novamente...")
                             # Log detalhado de hardware quando há falhas persistentes
                             if device_retry_count == max_device_retries:
                                 self.logger.error("Registrando informações de hardware devido a falhas persistentes:")
                                 self.log_hardware_info()
-                            time.sleep(30)
+                            self.input_device = self.wait_for_hotplug(30)
                             device_retry_count = 0  # Reset contador
+                        if self.input_device:
+                            device_retry_count = 0
+                            self.record_device_connected()
                         continue
                     else:
                         device_retry_count = 0  # Reset contador quando dispositivo é encontrado
+                        self.record_device_connected()
                         self.logger.info(f"Dispositivo conectado com sucesso: {self.input_device.name}")
                 
                 # Testa se o dispositivo ainda está acessível
@@ -664,110 +1770,221 @@ class StockflowQRService:
                 self.check_for_new_devices()
                 
                 # Monitora eventos
+                if self.settings['raw_input_decoder']:
+                    self.read_raw_loop(self.input_device)
+                    continue
+                
                 for event in self.input_device.read_loop():
                     if not self.running:
                         break
-                    
-                    if event.type == ecodes.EV_KEY:
-                        key_event = categorize(event)
-                        
-                        if key_event.keystate == key_event.key_down:
-                            if key_event.keycode == 'KEY_ENTER':
-                                # Fim da leitura do QR Code
-                                if self.current_input.strip():
-                                    product_id = self.current_input.strip()
-                                    self.logger.info(f"QR Code lido: {product_id}")
-                                    
-                                    if self.validate_product_id(product_id):
-                                        self.add_job_to_queue(product_id)
-                                    else:
-                                        self.logger.error(f"QR Code inválido: {product_id}")
-                                
-                                self.current_input = ""
-                            
-                            elif hasattr(key_event, 'keycode') and key_event.keycode.startswith('KEY_'):
-                                # Mapeia teclas para caracteres
-                                char = self.keycode_to_char(key_event.keycode)
-                                if char:
-                                    self.current_input += char
+                    self.handle_input_event(event, self.input_device)
             
             except OSError as e:
                 self.logger.error(f"Dispositivo de entrada desconectado: {e}")
+                self.metrics['device_disconnects'] += 1
+                if self.input_device:
+                    self.key_decoders.pop(self.input_device.path, None)
+                    self.raw_decoders.pop(self.input_device.path, None)
                 self.input_device = None
                 # Limpa dispositivo preferido se ele falhou
                 if self.preferred_device and self.input_device and self.input_device.name == self.preferred_device['name']:
                     self.logger.warning("Dispositivo preferido falhou. Será procurado um novo dispositivo.")
-                time.sleep(5)
+                if not self.hotplug:
+                    time.sleep(5)
             except Exception as e:
                 self.logger.error(f"Erro no monitoramento de entrada: {e}")
                 time.sleep(5)
     
-    def keycode_to_char(self, keycode):
-        """Converte keycode para caractere"""
-        key_map = {
-            'KEY_0': '0', 'KEY_1': '1', 'KEY_2': '2', 'KEY_3': '3', 'KEY_4': '4',
-            'KEY_5': '5', 'KEY_6': '6', 'KEY_7': '7', 'KEY_8': '8', 'KEY_9': '9',
-            'KEY_A': 'a', 'KEY_B': 'b', 'KEY_C': 'c', 'KEY_D': 'd', 'KEY_E': 'e',
-            'KEY_F': 'f', 'KEY_G': 'g', 'KEY_H': 'h', 'KEY_I': 'i', 'KEY_J': 'j',
-            'KEY_K': 'k', 'KEY_L': 'l', 'KEY_M': 'm', 'KEY_N': 'n', 'KEY_O': 'o',
-            'KEY_P': 'p', 'KEY_Q': 'q', 'KEY_R': 'r', 'KEY_S': 's', 'KEY_T': 't',
-            'KEY_U': 'u', 'KEY_V': 'v', 'KEY_W': 'w', 'KEY_X': 'x', 'KEY_Y': 'y',
-            'KEY_Z': 'z', 'KEY_MINUS': '-', 'KEY_EQUAL': '='
-        }
-        return key_map.get(keycode, '')
+    def record_device_connected(self):
+        """Contabiliza a conexão de um leitor (as seguintes à primeira são reconexões)"""
+        if self.metrics['device_connects']:
+            self.metrics['device_reconnects'] += 1
+        self.metrics['device_connects'] += 1
     
     def signal_handler(self, signum, frame):
         """Manipula sinais para encerramento gracioso"""
         self.logger.info(f"Sinal {signum} recebido. Encerrando serviço...")
         self.stop()
     
+    def profile_signal_handler(self, signum, frame):
+        """SIGUSR1/SIGUSR2: o tratamento (com log) roda fora do contexto do sinal"""
+        target = self.toggle_profiler if signum == signal.SIGUSR1 else self.toggle_stage_timers
+        threading.Thread(target=target, daemon=True).start()
+    
+    def toggle_profiler(self):
+        """Inicia (ou interrompe) o profiler por amostragem; o perfil é gravado ao lado do leitor.log"""
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(
+                os.path.dirname(self.settings['log_file']) or '.',
+                interval=self.settings['profile_interval'],
+                duration=self.settings['profile_duration']
+            )
+        if not self.profiler.toggle():
+            self.logger.info("Profiler interrompido antes do fim da janela")
+    
+    def toggle_stage_timers(self):
+        """Liga ou desliga os cronômetros por etapa; ao desligar registra o resumo"""
+        if self.stage_timers.enabled:
+            self.log_stage_summary()
+        enabled = self.stage_timers.toggle()
+        self.logger.info(f"Cronômetros por etapa {'ligados' if enabled else 'desligados'}")
+    
+    def log_stage_summary(self):
+        """Registra p50/p95/p99/máximo de cada etapa na janela móvel"""
+        lines = self.stage_timers.format_summary()
+        if not lines:
+            return
+        self.logger.info("Latência por etapa (últimas amostras):")
+        for line in lines:
+            self.logger.info(f"  {line}")
+    
+    def stage_summary_worker(self):
+        """Thread que registra o resumo por etapa a cada stage_summary_interval"""
+        interval = self.settings['stage_summary_interval']
+        while self.running:
+            self.wait_while_running(interval)
+            if self.running and self.stage_timers.enabled:
+                self.log_stage_summary()
+    
     def start(self):
         """Inicia o serviço"""
+        self.started_at = time.monotonic()
         self.logger.info("Iniciando serviço Stockflow QR")
         
         # Carrega configuração
         if not self.load_configuration():
             self.logger.error("Falha ao carregar configuração. Encerrando.")
             return False
+        self.configure_logging()
+        self.stage_timers.enabled = bool(self.settings['stage_timers'])
         
         # Carrega trabalhos pendentes
         self.load_pending_jobs()
         
-        # Configura banco de dados
-        if not self.setup_database_pool():
+        fast_start = self.settings['fast_start']
+        threaded = not self.settings['async_mode']
+        
+        # Configura banco de dados (no fast_start a verificação de saúde conecta em segundo plano)
+        if not fast_start and not self.setup_database_pool():
             self.logger.warning("Falha inicial na conexão com banco. Continuando...")
         
         self.running = True
         
-        # Registra informações de hardware para troubleshooting
-        self.log_hardware_info()
+        if fast_start and threaded:
+            # Consumidores prontos antes de qualquer outra tarefa de inicialização
+            self.start_processing_threads()
         
-        # Inicia threads
-        self.queue_processor_thread = threading.Thread(target=self.queue_processor, daemon=True)
-        self.queue_processor_thread.start()
+        if self.settings['metrics_port']:
+            try:
+                self.metrics_server = MetricsServer(
+                    self, self.settings['metrics_host'], self.settings['metrics_port']
+                ).start()
+            except OSError as e:
+                self.logger.warning(f"Endpoint de métricas indisponível: {e}")
         
-        self.db_reconnect_thread = threading.Thread(target=self.db_reconnect_worker, daemon=True)
-        self.db_reconnect_thread.start()
+        if self.settings['ingest_socket']:
+            try:
+                self.ingest_server = IngestServer(
+                    self, self.settings['ingest_socket'],
+                    mode=int(str(self.settings['ingest_socket_mode']), 8),
+                    max_batch=self.settings['ingest_max_batch']
+                ).start()
+            except OSError as e:
+                self.logger.warning(f"API de ingestão indisponível: {e}")
+        
+        if self.settings['stage_summary_interval'] > 0:
+            threading.Thread(target=self.stage_summary_worker, name='stockflow-stages', daemon=True).start()
+        
+        # Registra informações de hardware para troubleshooting, fora do caminho de inicialização
+        if self.settings['hardware_report']:
+            threading.Thread(target=self.hardware_report_worker, name='stockflow-hardware', daemon=True).start()
+        
+        if self.settings['product_index']:
+            self.start_product_index()
+        
+        if self.settings['async_mode']:
+            # Núcleo asyncio substitui as threads de fila, reconexão e leitura
+            from async_core import AsyncServiceCore
+            AsyncServiceCore(self).run()
+            return True
+        
+        # Inicia threads
+        if not fast_start:
+            self.start_processing_threads()
         
         # Inicia monitoramento de entrada (thread principal)
-        self.logger.info("Serviço iniciado. Aguardando leituras de QR Code...")
+        self.logger.info(f"Serviço iniciado em {(time.monotonic() - self.started_at) * 1000:.0f} ms. "
+                         f"Aguardando leituras de QR Code...")
         self.monitor_input_events()
         
+        if self.hotplug:
+            self.hotplug.close()
+            self.hotplug = None
+        
         return True
     
+    def start_processing_threads(self):
+        """Inicia os processadores da fila e a verificação de saúde do banco"""
+        self.start_queue_workers()
+        self.db_health_thread = threading.Thread(target=self.db_health_worker, name='stockflow-db-health', daemon=True)
+        self.db_health_thread.start()
+    
+    def hardware_report_worker(self):
+        """Gera o relatório de hardware em segundo plano (no fast_start, após hardware_report_delay)"""
+        if self.settings['fast_start']:
+            self.wait_while_running(self.settings['hardware_report_delay'])
+            if not self.running:
+                return
+        self.log_hardware_info()
+    
+    def start_queue_workers(self):
+        """Inicia queue_workers threads de processamento, no máximo pool_size"""
+        workers = max(1, min(self.settings['queue_workers'], self.db_config['pool_size']))
+        for index in range(workers):
+            thread = threading.Thread(target=self.queue_processor, name=f"stockflow-queue-{index}", daemon=True)
+            thread.start()
+            self.queue_processor_threads.append(thread)
+        if workers > 1:
+            self.logger.info(f"{workers} workers de processamento da fila iniciados")
+    
     def stop(self):
         """Para o serviço"""
-        self.running = False
+        with self.queue_condition:
+            self.running = False
+            self.queue_condition.notify_all()
+        self.db_health_wakeup.set()
+        
+        # Para de aceitar lotes antes de fechar o journal
+        if self.ingest_server:
+            self.ingest_server.close()
+            self.ingest_server = None
         
         # Salva trabalhos pendentes
         self.save_pending_jobs()
         
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        
         self.logger.info("Serviço encerrado")
+        # Grava os registros ainda na fila do log
+        self.log_pipeline.stop()
+
+def short_hash(text):
+    """Resumo curto de um texto (impressão digital das teclas de um leitor)"""
+    import hashlib
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:8]
 
 def main():
     """Função principal"""
     service = StockflowQRService()
     
+    if '--hardware-report' in sys.argv[1:]:
+        # Relatório sob demanda, sem iniciar o serviço
+        service.log_hardware_info()
+        service.log_pipeline.stop()
+        return
+    
     try:
         service.start()
     except KeyboardInterrupt:
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline de logging do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: As threads de leitura e de processamento apenas enfileiram os
+registros (QueueHandler); uma thread própria (QueueListener) grava no
+arquivo com rotação por tamanho e na saída padrão (journald), em texto ou
+JSON compacto
+"""
+
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON compacta por registro"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler que nunca bloqueia: com a fila cheia o registro é descartado e contado"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FlushingQueueListener(QueueListener):
+    """QueueListener cujo sentinela de encerramento aguarda espaço na fila cheia"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Fila de registros + thread de escrita, instalada no logger raiz"""
+
+    def __init__(self, queue_size=10000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.listener = None
+
+    @classmethod
+    def install(cls, queue_size=10000):
+        """Instala o pipeline no logger raiz, reaproveitando um já instalado"""
+        root = logging.getLogger()
+        for handler in root.handlers:
+            if isinstance(handler, DroppingQueueHandler) and hasattr(handler, 'pipeline'):
+                return handler.pipeline
+
+        pipeline = cls(queue_size)
+        pipeline.handler.pipeline = pipeline
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(pipeline.handler)
+        root.setLevel(logging.INFO)
+        return pipeline
+
+    def configure(self, log_file, max_bytes=10 * 1024 * 1024, backup_count=5, json_format=False, stdout=True):
+        """(Re)inicia a thread de escrita com os destinos informados"""
+        formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+        handlers = []
+        if log_file:
+            try:
+                handlers.append(RotatingFileHandler(
+                    log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+                ))
+            except OSError as e:
+                print(f"AVISO: não foi possível abrir {log_file}: {e}", file=sys.stderr)
+        if stdout:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        self.stop()
+        self.listener = FlushingQueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    @property
+    def dropped(self):
+        return self.handler.dropped
+
+    def stop(self):
+        """Grava os registros pendentes e encerra a thread de escrita"""
+        if self.listener is None:
+            return
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Endpoint HTTP local no formato texto do Prometheus com tamanho
+da fila e do journal, latência leitura-commit, tempos de banco, contadores
+de novas tentativas e descartes, reconexões de dispositivo e estado do banco
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Limites (s) do histograma de latência entre a leitura e o commit
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800, 3600)
+
+# Contadores de StockflowQRService.metrics: chave -> (nome, ajuda)
+COUNTERS = {
+    'scans_total': ('stockflow_scans_total', 'Leituras válidas recebidas dos leitores'),
+    'duplicate_scans_dropped': ('stockflow_duplicate_scans_dropped_total', 'Leituras duplicadas descartadas'),
+    'unknown_scans_rejected': ('stockflow_unknown_scans_rejected_total', 'Leituras de produtos desconhecidos rejeitadas'),
+    'jobs_committed': ('stockflow_jobs_committed_total', 'Trabalhos confirmados no banco'),
+    'jobs_retried': ('stockflow_jobs_retried_total', 'Trabalhos recolocados na fila'),
+    'jobs_discarded': ('stockflow_jobs_discarded_total', 'Trabalhos descartados após o limite de tentativas'),
+    'jobs_not_found': ('stockflow_jobs_not_found_total', 'Baixas de produtos não encontrados no banco'),
+    'queue_errors': ('stockflow_queue_errors_total', 'Erros inesperados no processador da fila'),
+    'device_connects': ('stockflow_device_connects_total', 'Conexões de leitores'),
+    'device_reconnects': ('stockflow_device_reconnects_total', 'Conexões de leitores após a primeira'),
+    'device_disconnects': ('stockflow_device_disconnects_total', 'Desconexões de leitores'),
+    'ingest_batches': ('stockflow_ingest_batches_total', 'Lotes recebidos pelo socket de ingestão'),
+    'ingest_busy': ('stockflow_ingest_busy_total', 'Produtos recusados pelo socket de ingestão (fila cheia ou falha no journal)'),
+}
+
+
+class Histogram:
+    """Histograma cumulativo simples, com observações protegidas por lock"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, help_text):
+        """Linhas do histograma no formato texto do Prometheus"""
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{name}_sum {total:.6f}")
+        lines.append(f"{name}_count {count}")
+        return lines
+
+
+def gauge(name, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def render_metrics(service):
+    """Monta o texto de métricas a partir do estado do serviço"""
+    lines = []
+    lines += gauge('stockflow_queue_length', 'Trabalhos aguardando na fila', len(service.job_queue))
+    store_lengths = service.job_queue.lengths() if hasattr(service.job_queue, 'lengths') else {}
+    if len(store_lengths) > 1:
+        name = 'stockflow_store_queue_length'
+        lines += [f"# HELP {name} Trabalhos aguardando na fila de cada loja", f"# TYPE {name} gauge"]
+        for store_key, length in sorted(store_lengths.items(), key=lambda item: str(item[0])):
+            lines.append(f'{name}{{store="{store_key}"}} {length}')
+    lines += gauge('stockflow_jobs_in_flight', 'Trabalhos em processamento', len(service.in_flight_products))
+    lines += gauge('stockflow_retries_scheduled', 'Trabalhos aguardando nova tentativa', len(service.retry_scheduler))
+    lines += gauge('stockflow_db_connected', 'Conexão com o banco (1 = conectado)', int(bool(service.db_connected)))
+
+    journal = service.journal
+    if journal is not None:
+        lines += gauge('stockflow_journal_pending', 'Trabalhos pendentes no journal ou outbox', journal.pending_count())
+        lines += gauge('stockflow_journal_segment_bytes', 'Tamanho em disco do journal ou outbox', journal.disk_bytes())
+
+    first_commit = getattr(service, 'first_commit_seconds', None)
+    if first_commit is not None:
+        lines += gauge('stockflow_time_to_first_commit_seconds', 'Tempo entre o início do serviço e o primeiro commit',
+                       f"{first_commit:.6f}")
+
+    lines += service.scan_latency.render(
+        'stockflow_scan_to_commit_seconds', 'Tempo entre a leitura e o commit no banco'
+    )
+
+    counters = dict(service.metrics)
+    for key, (name, help_text) in COUNTERS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {counters.get(key, 0)}"]
+
+    log_pipeline = getattr(service, 'log_pipeline', None)
+    if log_pipeline is not None:
+        name = 'stockflow_log_records_dropped_total'
+        lines += [f"# HELP {name} Registros de log descartados com a fila do log cheia", f"# TYPE {name} counter",
+                  f"{name} {log_pipeline.dropped}"]
+
+    # Tempos por statement, somados entre as conexões dos workers
+    storage = service.storage
+    statements = storage.statement_stats() if storage is not None else {}
+    name = 'stockflow_db_statement_seconds'
+    lines += [f"# HELP {name} Tempo de banco por statement", f"# TYPE {name} summary"]
+    for statement, (count, seconds) in sorted(statements.items()):
+        lines.append(f'{name}_sum{{statement="{statement}"}} {seconds:.6f}')
+        lines.append(f'{name}_count{{statement="{statement}"}} {count}')
+
+    count, seconds = storage.acquire_stats if storage is not None else (0, 0.0)
+    name = 'stockflow_db_acquire_seconds'
+    lines += [f"# HELP {name} Espera para obter conexão com o banco", f"# TYPE {name} summary"]
+    lines.append(f"{name}_sum {seconds:.6f}")
+    lines.append(f"{name}_count {count}")
+
+    # Percentis móveis por etapa, com os cronômetros ligados (SIGUSR2 ou stage_timers)
+    stage_timers = getattr(service, 'stage_timers', None)
+    stages = stage_timers.summary() if stage_timers is not None else {}
+    if stages:
+        name = 'stockflow_stage_seconds'
+        lines += [f"# HELP {name} Latência por etapa nas últimas amostras", f"# TYPE {name} summary"]
+        for stage, stats in sorted(stages.items()):
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {stats[key]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Servidor HTTP local que responde GET /metrics em uma thread própria"""
+
+    def __init__(self, service, host='127.0.0.1', port=9464):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        service = self.service
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = render_metrics(service).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, name='stockflow-metrics', daemon=True).start()
+        logger.info(f"Métricas disponíveis em http://{self.host}:{self.httpd.server_port}/metrics")
+        return self
+
+    def close(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
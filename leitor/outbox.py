@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Outbox SQLite da fila de trabalhos do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Armazena os trabalhos pendentes em uma tabela SQLite indexada
+(uma linha por trabalho) e os entrega à memória em páginas, mantendo a fila
+em memória limitada durante quedas longas do banco
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL UNIQUE,
+    product_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, next_attempt);
+CREATE INDEX IF NOT EXISTS idx_outbox_product ON outbox (product_id);
+"""
+
+
+class SQLiteOutbox:
+    """Outbox de trabalhos com a interface de JobJournal
+
+    Cada enfileiramento é um INSERT de uma linha, cada confirmação um DELETE
+    e cada nova tentativa um UPDATE de status, attempts e next_attempt.
+
+    Apenas memory_jobs trabalhos ficam em memória. Com a fila em memória
+    cheia, os novos trabalhos aguardam só no disco ("transbordados") e
+    voltam em ordem (seq) por load_more quando a fila esvazia. memory_seq é
+    o maior seq já entregue à memória: enquanto houver transbordo, toda
+    linha acima dele está apenas no disco.
+    """
+
+    def __init__(self, path, memory_jobs=5000):
+        self.path = path
+        self.memory_jobs = memory_jobs
+        self.lock = threading.Lock()
+        self.connection = None
+        self.count = 0
+        self.memory_seq = 0
+        self.spilled = False
+
+    def open(self):
+        """Abre o banco do outbox, criando a tabela se não existir"""
+        if self.connection is not None:
+            return
+        # Conexão compartilhada entre leitores e workers, protegida por self.lock
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        # Páginas pequenas: cada commit grava no WAL apenas as poucas páginas alteradas
+        # (só tem efeito na criação do banco)
+        self.connection.execute("PRAGMA page_size=1024")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commit sem fsync, banco íntegro mesmo após queda de energia
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(OUTBOX_SCHEMA)
+
+    def load(self):
+        """Abre o outbox e retorna apenas a primeira página de pendentes
+
+        O restante é carregado sob demanda por load_more, sem ler todo o
+        backlog na inicialização.
+        """
+        self.open()
+        with self.lock:
+            self.count = self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            self.memory_seq = 0
+            self.spilled = self.count > 0
+        jobs = self.load_more(self.memory_jobs)
+        if self.count > len(jobs):
+            logger.info(f"Outbox: {self.count} trabalhos pendentes, {len(jobs)} carregados em memória")
+        return jobs
+
+    def load_more(self, limit):
+        """Próxima página de trabalhos que estão apenas no disco, em ordem de chegada"""
+        with self.lock:
+            if not self.spilled or limit <= 0:
+                return []
+            rows = self.connection.execute(
+                "SELECT seq, payload, attempts, next_attempt FROM outbox WHERE seq > ? ORDER BY seq LIMIT ?",
+                (self.memory_seq, limit)
+            ).fetchall()
+            if rows:
+                self.memory_seq = rows[-1][0]
+            if len(rows) < limit:
+                self.spilled = False
+
+        jobs = []
+        for _seq, payload, attempts, next_attempt in rows:
+            job = json.loads(payload)
+            job['attempts'] = attempts
+            if next_attempt:
+                job['next_attempt'] = next_attempt
+            jobs.append(job)
+        return jobs
+
+    def start(self):
+        """Sem threads auxiliares: cada registro é gravado na própria chamada"""
+        self.open()
+
+    def close(self):
+        """Fecha o banco do outbox (os pendentes já estão gravados)"""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def append_enqueue(self, job, queue_length=0):
+        """Grava um trabalho novo; retorna False se ele deve aguardar apenas no disco"""
+        payload = json.dumps(job, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO outbox (job_id, product_id, payload, attempts, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job['job_id'], job['product_id'], payload, job.get('attempts', 0), time.time())
+            )
+            self.count += 1
+            if self.spilled or queue_length >= self.memory_jobs:
+                self.spilled = True
+                return False
+            self.memory_seq = cursor.lastrowid
+            return True
+
+    def append_enqueue_batch(self, jobs, queue_length=0):
+        """Grava vários trabalhos novos em uma única transação
+
+        Retorna, para cada trabalho, se ele entra na fila em memória (False:
+        aguarda apenas no disco), como append_enqueue.
+        """
+        rows = [
+            (job['job_id'], job['product_id'], json.dumps(job, ensure_ascii=False, separators=(',', ':')),
+             job.get('attempts', 0), time.time())
+            for job in jobs
+        ]
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                seqs = [
+                    self.connection.execute(
+                        "INSERT INTO outbox (job_id, product_id, payload, attempts, created_at) VALUES (?, ?, ?, ?, ?)",
+                        row
+                    ).lastrowid
+                    for row in rows
+                ]
+                self.connection.execute("COMMIT")
+            except sqlite3.Error:
+                self.connection.execute("ROLLBACK")
+                raise
+
+            self.count += len(seqs)
+            in_memory = []
+            for seq in seqs:
+                if self.spilled or queue_length >= self.memory_jobs:
+                    self.spilled = True
+                    in_memory.append(False)
+                else:
+                    self.memory_seq = seq
+                    queue_length += 1
+                    in_memory.append(True)
+            return in_memory
+
+    def append_ack(self, job):
+        """Remove o trabalho concluído (ou descartado)"""
+        with self.lock:
+            cursor = self.connection.execute("DELETE FROM outbox WHERE job_id = ?", (job['job_id'],))
+            self.count -= max(cursor.rowcount, 0)
+
+    def append_retry(self, job):
+        """Registra a nova tentativa: status, tentativas e próxima tentativa"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE outbox SET status = 'retry', attempts = ?, next_attempt = ? WHERE job_id = ?",
+                (job['attempts'], job.get('next_attempt', 0), job['job_id'])
+            )
+
+    def import_jobs(self, jobs):
+        """Grava trabalhos vindos do journal em uma única transação (ids repetidos são ignorados)"""
+        self.open()
+        rows = [
+            (job['job_id'], job['product_id'], json.dumps(job, ensure_ascii=False, separators=(',', ':')),
+             job.get('attempts', 0), time.time())
+            for job in jobs
+        ]
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO outbox (job_id, product_id, payload, attempts, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.connection.execute("COMMIT")
+            except sqlite3.Error:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def has_pending_product(self, product_id):
+        """Indica se o produto tem trabalho aguardando apenas no disco"""
+        with self.lock:
+            if not self.spilled:
+                return False
+            row = self.connection.execute(
+                "SELECT 1 FROM outbox WHERE product_id = ? AND seq > ? LIMIT 1",
+                (product_id, self.memory_seq)
+            ).fetchone()
+            return row is not None
+
+    def pending_count(self):
+        """Quantidade de trabalhos pendentes no outbox"""
+        with self.lock:
+            return self.count
+
+    def disk_bytes(self):
+        """Tamanho do outbox em disco, incluindo o WAL"""
+        total = 0
+        for path in (self.path, self.path + '-wal'):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice local de produtos do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Mantém em memória os id_produto da loja configurada, carregados
+em bloco na inicialização e atualizados de forma incremental, para validar
+leituras sem consultar o banco
+"""
+
+import threading
+import time
+
+from storage import StorageError, StorageUnavailable, product_key
+
+
+class ProductIndex:
+    """Conjunto de id_produto existentes em tb_produto para uma loja
+
+    - load: carga completa (ids e maior data_entrada)
+    - refresh: traz apenas os produtos com data_entrada >= marca d'água;
+      sem a coluna, ou a cada full_refresh_interval segundos, recarrega a
+      lista completa e substitui o conjunto (captura remoções externas)
+    - discard: remove os ids baixados pelo próprio serviço
+
+    Os métodos de banco recebem o backend de armazenamento (storage.py).
+    """
+
+    def __init__(self, store_key, full_refresh_interval=900):
+        self.store_key = store_key
+        self.full_refresh_interval = full_refresh_interval
+        self.ids = set()
+        self.watermark = None
+        self.incremental = True
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def contains(self, product_id):
+        """True/False se o índice está carregado; None se ainda não há dados"""
+        if not self.loaded:
+            return None
+        return product_key(product_id) in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self, storage):
+        """Carga completa dos ids da loja"""
+        try:
+            rows = storage.product_rows()
+            watermark = max((row[1] for row in rows if row[1] is not None), default=None)
+        except StorageUnavailable:
+            raise
+        except StorageError:
+            # Sem a coluna de marca d'água: apenas recargas completas
+            self.incremental = False
+            rows = [(product_id,) for product_id in storage.product_ids()]
+            watermark = None
+
+        ids = {product_key(row[0]) for row in rows}
+        with self.lock:
+            self.ids = ids
+            self.watermark = watermark
+            self.loaded_at = time.monotonic()
+        return len(ids)
+
+    def refresh(self, storage):
+        """Atualiza o índice; retorna a quantidade de ids novos"""
+        if (not self.loaded or not self.incremental or self.watermark is None
+                or time.monotonic() - self.loaded_at >= self.full_refresh_interval):
+            before = self.ids
+            self.load(storage)
+            return len(self.ids - before)
+
+        rows = storage.product_rows(since=self.watermark)
+        new_ids = {product_key(row[0]) for row in rows} - self.ids
+        with self.lock:
+            self.ids.update(new_ids)
+            self.watermark = max([self.watermark] + [row[1] for row in rows if row[1] is not None])
+        return len(new_ids)
+
+    def lookup(self, storage, product_id):
+        """Confirma no banco um id ausente do índice, incluindo-o se existir"""
+        found = product_key(product_id) in storage.lookup([product_id])
+        if found:
+            with self.lock:
+                self.ids.add(product_key(product_id))
+        return found
+
+    def discard(self, product_ids):
+        """Remove do índice os produtos baixados"""
+        with self.lock:
+            self.ids.difference_update(product_key(product_id) for product_id in product_ids)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentação de desempenho do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Cronômetros por etapa (decodificação, enfileiramento, journal,
+conexão e statements do banco) com resumo móvel de latência, ligáveis em
+tempo de execução, e um profiler por amostragem de todas as threads
+acionado por sinal, sem reiniciar o serviço
+"""
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _NullStage:
+    """Contexto vazio usado com os cronômetros desligados"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Stage:
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timers.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class StageTimers:
+    """Últimas window durações de cada etapa, para percentis móveis
+
+    Desligados, stage() devolve um contexto vazio compartilhado e record()
+    retorna antes de qualquer lock: o custo no caminho da leitura é uma
+    verificação de atributo.
+    """
+
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        """Contexto que mede a duração do bloco como a etapa name"""
+        if not self.enabled:
+            return NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def toggle(self):
+        """Liga ou desliga os cronômetros (os dados são zerados ao ligar)"""
+        with self.lock:
+            self.enabled = not self.enabled
+            if self.enabled:
+                self.samples = {}
+        return self.enabled
+
+    def summary(self):
+        """etapa -> {count, p50, p95, p99, max} em segundos, sobre a janela móvel"""
+        with self.lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items() if samples}
+        result = {}
+        for name, values in snapshot.items():
+            count = len(values)
+            result[name] = {
+                'count': count,
+                'p50': values[int(0.50 * (count - 1))],
+                'p95': values[int(0.95 * (count - 1))],
+                'p99': values[int(0.99 * (count - 1))],
+                'max': values[-1],
+            }
+        return result
+
+    def format_summary(self):
+        """Linhas do resumo em ms, da etapa mais lenta (p99) para a mais rápida"""
+        summary = self.summary()
+        lines = []
+        for name, stats in sorted(summary.items(), key=lambda item: item[1]['p99'], reverse=True):
+            lines.append(
+                f"{name:<16} n={stats['count']:<5} p50={stats['p50'] * 1000:8.2f} ms  "
+                f"p95={stats['p95'] * 1000:8.2f} ms  p99={stats['p99'] * 1000:8.2f} ms  "
+                f"max={stats['max'] * 1000:8.2f} ms"
+            )
+        return lines
+
+
+class SamplingProfiler:
+    """Profiler por amostragem de todas as threads (sys._current_frames)
+
+    A cada interval segundos registra a pilha de cada thread; ao fim da
+    janela grava as pilhas agregadas no formato "folded" (uma pilha por
+    linha com a contagem de amostras), aceito por flamegraph.pl e
+    speedscope, e registra no log as funções com mais amostras.
+    """
+
+    def __init__(self, output_dir, interval=0.005, duration=30):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def toggle(self):
+        """Inicia uma janela de amostragem ou encerra a atual antes do prazo"""
+        with self.lock:
+            if self.running:
+                self.stop_event.set()
+                return False
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='stockflow-profiler', daemon=True)
+            self.thread.start()
+            return True
+
+    def run(self):
+        logger.info(f"Profiler iniciado: amostragem a cada {self.interval * 1000:.0f} ms por até {self.duration}s")
+        own_id = threading.get_ident()
+        names = {}
+        stacks = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + self.duration
+
+        while not self.stop_event.is_set() and time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+            self.stop_event.wait(self.interval)
+
+        path = self.write(stacks)
+        logger.info(f"Profiler encerrado: {samples} amostras gravadas em {path}")
+        for line in self.top_functions(stacks):
+            logger.info(f"  {line}")
+
+    def write(self, stacks):
+        """Grava as pilhas agregadas ao lado do leitor.log"""
+        path = os.path.join(self.output_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Erro ao gravar perfil em {path}: {e}")
+        return path
+
+    @staticmethod
+    def top_functions(stacks, limit=10):
+        """Funções no topo da pilha (tempo próprio) com mais amostras, ignorando esperas"""
+        own = collections.Counter()
+        total = 0
+        for stack, count in stacks.items():
+            frame = stack.rsplit(';', 1)[-1]
+            # Threads bloqueadas em wait/select/sleep não consomem CPU
+            if frame.split(' ', 1)[0] in ('wait', 'select', 'poll', 'sleep', 'read_loop', '_wait_for_tstate_lock'):
+                continue
+            own[frame] += count
+            total += count
+        return [f"{count * 100 / total:5.1f}%  {frame}" for frame, count in own.most_common(limit)] if total else []
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reprocessamento do dead-letter do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Lista, filtra e reprocessa em massa os trabalhos descartados
+pelo serviço, usando a baixa em lote do backend de armazenamento com a
+configuração e o banco do próprio serviço, e relata a vazão ao final. Não
+instancia o serviço: o log vai para stderr, sem tocar no leitor.log
+
+Uso:
+  python3 replay.py list [--error not_found] [--product 123] [--since 2026-10-01] [--all] [--limit 50]
+  python3 replay.py replay [--error connection] [--since 2026-10-01] [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from deadletter import DeadLetterStore
+from leitor import DEFAULT_SETTINGS, REMOVED_BY, create_storage, sao_paulo_now, valid_product_id
+from retry import ERROR_CONNECTION, ERROR_INVALID, ERROR_NOT_FOUND, classify_error
+from storage import StorageError, StorageUnavailable
+
+CONFIG_FILE = '/home/stockflow/Stockflow/config/printers.json'
+
+logger = logging.getLogger('replay')
+
+
+def load_config():
+    """(store_key, leitor_settings com os padrões) de printers.json; store_key None se ausente"""
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Não foi possível ler {CONFIG_FILE}: {e}")
+        config = {}
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.get('leitor_settings', {}))
+    return config.get('store_key'), settings
+
+
+def parse_since(value):
+    """Data (AAAA-MM-DD) ou data e hora ISO -> timestamp"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida: {value}")
+
+
+def format_time(timestamp):
+    if timestamp is None:
+        return '-'
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def select_records(store, args, store_key=None):
+    return store.query(
+        error_class=args.error,
+        product_id=args.product,
+        since=args.since,
+        store_key=store_key,
+        include_replayed=getattr(args, 'all', False),
+        limit=args.limit
+    )
+
+
+def list_records(store, args):
+    """Lista os registros filtrados e um resumo por classe de erro"""
+    records = select_records(store, args)
+    for record in records:
+        message = (record['error_message'] or '')[:60]
+        replayed = f"  reprocessado {format_time(record['replayed_at'])}" if record['replayed_at'] else ''
+        print(f"{record['id']:>7}  {record['product_id']:<20} {record['error_class']:<11} "
+              f"{record['attempts']:>2}x  {format_time(record['discarded_at'])}  {message}{replayed}")
+
+    by_class = Counter(record['error_class'] for record in records)
+    summary = ', '.join(f"{error_class}: {count}" for error_class, count in by_class.most_common())
+    print(f"{len(records)} registros" + (f" ({summary})" if summary else ''))
+    return 0
+
+
+def connect_storage(store_key, settings):
+    """Backend de armazenamento do serviço, conectado e preparado; None sem conexão"""
+    storage = create_storage(settings, store_key)
+    try:
+        storage.connect()
+        storage.prepare()
+    except StorageUnavailable as e:
+        logger.error(f"Erro ao conectar ao banco {storage.name}: {e}")
+        storage.close()
+        return None
+    except StorageError as e:
+        # O schema é descoberto de novo na primeira baixa
+        logger.warning(f"Erro ao preparar a baixa no banco {storage.name}: {e}")
+    return storage
+
+
+def move_chunk(storage, product_ids, store_key):
+    """Baixa um lote de uma loja; (movidos, falhas) como em StockflowQRService.process_batch"""
+    valid_ids, failed = [], {}
+    for product_id in product_ids:
+        if valid_product_id(product_id):
+            valid_ids.append(product_id)
+        else:
+            failed[product_id] = (ERROR_INVALID, "Product ID inválido")
+    if not valid_ids:
+        return [], failed
+    found, missing, errors = storage.move_batch_isolating(valid_ids, sao_paulo_now(), REMOVED_BY, store_key=store_key)
+    failed.update((product_id, (ERROR_NOT_FOUND, "Produto não encontrado")) for product_id in missing)
+    failed.update((product_id, (classify_error(error), str(error))) for product_id, error in errors.items())
+    return found, failed
+
+
+def replay_records(store, args):
+    """Reprocessa os registros em lotes pela baixa em lote do backend"""
+    main_store, settings = load_config()
+    if not main_store:
+        print(f"store_key não encontrado em {CONFIG_FILE}", file=sys.stderr)
+        return 1
+
+    # Lojas atendidas por esta configuração (store_key e as de "stores")
+    store_keys = [main_store] + [key for key in settings['stores'] if key != main_store]
+    records = select_records(store, args, store_key=store_keys)
+    # Um produto descartado mais de uma vez é baixado uma única vez; cada lote é de uma loja
+    by_store = {}
+    for record in records:
+        store_key = record['store_key'] or main_store
+        by_store.setdefault(store_key, {}).setdefault(record['product_id'], []).append(record['id'])
+    chunks = [
+        (store_key, product_ids[start:start + args.batch_size])
+        for store_key, by_product in by_store.items()
+        for product_ids in [list(by_product)]
+        for start in range(0, len(product_ids), args.batch_size)
+    ]
+    total_products = sum(len(by_product) for by_product in by_store.values())
+
+    if args.dry_run:
+        print(f"{len(records)} registros, {total_products} produtos seriam reprocessados "
+              f"em {len(chunks)} lotes de até {args.batch_size}")
+        return 0
+
+    storage = connect_storage(main_store, settings)
+    if storage is None:
+        print("Não foi possível conectar ao banco", file=sys.stderr)
+        return 1
+    try:
+        return replay_chunks(store, storage, by_store, chunks, total_products)
+    finally:
+        storage.close()
+
+
+def replay_chunks(store, storage, by_store, chunks, total_products):
+    """Move os lotes, registra o resultado no dead-letter e relata a vazão"""
+    moved = 0
+    failures = Counter()
+    started = time.perf_counter()
+    for store_key, chunk in chunks:
+        by_product = by_store[store_key]
+        found, failed = move_chunk(storage, chunk, store_key)
+
+        store.mark_replayed(record_id for product_id in found for record_id in by_product[product_id])
+        store.update_errors(
+            (record_id, error_class, message)
+            for product_id, (error_class, message) in failed.items()
+            for record_id in by_product[product_id]
+        )
+        moved += len(found)
+        failures.update(error_class for error_class, _message in failed.values())
+
+        if any(error_class == ERROR_CONNECTION for error_class, _message in failed.values()):
+            print("Conexão com o banco perdida. Reprocessamento interrompido", file=sys.stderr)
+            break
+    elapsed = time.perf_counter() - started
+
+    processed = moved + sum(failures.values())
+    rate = processed / elapsed if elapsed > 0 else 0
+    summary = ', '.join(f"{error_class}: {count}" for error_class, count in failures.most_common())
+    print(f"{processed} de {total_products} produtos em {elapsed:.2f}s ({rate:.0f} produtos/s)")
+    print(f"  reprocessados: {moved}")
+    print(f"  falhas:        {sum(failures.values())}" + (f" ({summary})" if summary else ''))
+    return 0 if not failures else 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dead-letter', help='banco SQLite do dead-letter (padrão: dead_letter_path)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='exibe o log da baixa (stderr)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument('--error', help='classe de erro (invalid, not_found, connection, database, error)')
+    filters.add_argument('--product', help='product_id')
+    filters.add_argument('--since', type=parse_since, help='descartados a partir de (AAAA-MM-DD[THH:MM])')
+    filters.add_argument('--limit', type=int, help='máximo de registros')
+
+    list_parser = commands.add_parser('list', parents=[filters], help='lista os trabalhos descartados')
+    list_parser.add_argument('--all', action='store_true', help='inclui os já reprocessados')
+
+    replay_parser = commands.add_parser('replay', parents=[filters], help='reprocessa os trabalhos descartados')
+    replay_parser.add_argument('--batch-size', type=int, default=500, help='produtos por transação')
+    replay_parser.add_argument('--dry-run', action='store_true', help='apenas mostra o que seria reprocessado')
+
+    args = parser.parse_args()
+    # Sem -v, no terminal basta o resumo final (e erros)
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO if args.verbose else logging.ERROR,
+        format='[%(asctime)s] %(levelname)s: %(message)s'
+    )
+    store = DeadLetterStore(args.dead_letter or load_config()[1]['dead_letter_path'])
+    try:
+        if args.command == 'list':
+            return list_records(store, args)
+        return replay_records(store, args)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
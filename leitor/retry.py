@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agendador de novas tentativas do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Trabalhos com falha aguardam em um heap ordenado pelo horário da
+próxima tentativa, com backoff exponencial e jitter por trabalho e política
+configurável por classe de erro
+"""
+
+import heapq
+import itertools
+import random
+import time
+
+from storage import StorageError, StorageUnavailable
+
+# Classes de erro de um trabalho com falha
+ERROR_INVALID = 'invalid'          # product_id fora do formato
+ERROR_NOT_FOUND = 'not_found'      # produto não está em tb_produto
+ERROR_CONNECTION = 'connection'    # sem conexão com o banco
+ERROR_DATABASE = 'database'        # erro do banco na transação
+ERROR_UNEXPECTED = 'error'         # qualquer outra exceção
+
+# Política padrão; cada classe sobrescreve apenas o que difere. Pode ser
+# ajustada por classe em "retry_policy" (leitor_settings)
+DEFAULT_RETRY_POLICIES = {
+    'default': {'max_attempts': 3, 'base_delay': 1.0, 'multiplier': 2.0, 'max_delay': 60.0, 'jitter': 0.2},
+    # Id inválido não passa a ser válido com o tempo
+    ERROR_INVALID: {'max_attempts': 1},
+    # O produto pode ainda não ter sido sincronizado com o banco
+    ERROR_NOT_FOUND: {'max_attempts': 3, 'base_delay': 30.0, 'max_delay': 300.0},
+    # Quedas do banco duram minutos: mais tentativas, mais espaçadas
+    ERROR_CONNECTION: {'max_attempts': 10, 'base_delay': 5.0, 'max_delay': 300.0},
+}
+
+
+def classify_error(error):
+    """Classe de erro de uma exceção da baixa no banco"""
+    if isinstance(error, StorageUnavailable):
+        return ERROR_CONNECTION
+    if isinstance(error, StorageError):
+        return ERROR_DATABASE
+    return ERROR_UNEXPECTED
+
+
+def retry_policy(error_class, overrides=None):
+    """Política efetiva de uma classe de erro: padrão, classe e overrides da configuração"""
+    overrides = overrides or {}
+    policy = dict(DEFAULT_RETRY_POLICIES['default'])
+    policy.update(overrides.get('default', {}))
+    policy.update(DEFAULT_RETRY_POLICIES.get(error_class, {}))
+    policy.update(overrides.get(error_class, {}))
+    return policy
+
+
+def backoff_delay(policy, attempts, rng=random):
+    """Espera (s) antes da tentativa seguinte à falha número attempts
+
+    base_delay * multiplier^(attempts - 1), limitado a max_delay, com jitter
+    de ±jitter para que trabalhos que falharam juntos não voltem juntos.
+    """
+    delay = min(policy['max_delay'], policy['base_delay'] * policy['multiplier'] ** max(attempts - 1, 0))
+    jitter = policy['jitter']
+    if jitter:
+        delay *= rng.uniform(1 - jitter, 1 + jitter)
+    return max(0.0, min(delay, policy['max_delay']))
+
+
+class RetryScheduler:
+    """Min-heap de trabalhos aguardando nova tentativa, por job['next_attempt']
+
+    next_attempt é o horário (time.time()) da próxima tentativa, persistido
+    no journal/outbox para sobreviver a reinícios. Não é thread-safe: o
+    serviço usa o heap sob queue_condition.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.heap = []
+        # Desempate estável entre trabalhos com o mesmo horário
+        self.counter = itertools.count()
+
+    def schedule(self, job):
+        """Agenda o trabalho para job['next_attempt']"""
+        heapq.heappush(self.heap, (job.get('next_attempt', 0), next(self.counter), job))
+
+    def pop_due(self):
+        """Remove e retorna, em ordem, os trabalhos cujo horário já chegou"""
+        now = self.clock()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
+
+    def pop_all(self):
+        """Remove e retorna todos os trabalhos agendados, em ordem de horário"""
+        return [heapq.heappop(self.heap)[2] for _ in range(len(self.heap))]
+
+    def time_until_due(self):
+        """Segundos até a próxima tentativa (0 se já vencida), ou None se vazio"""
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - self.clock())
+
+    def __len__(self):
+        return len(self.heap)
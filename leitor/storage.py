@@ -0,0 +1,770 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backends de armazenamento do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Operações de banco da baixa de produtos (consulta, baixa
+individual e baixa em lote) atrás de uma interface comum, com
+implementações para MySQL (produção) e SQLite (modo local, testes de carga
+e lojas offline), ambas com o schema tb_produto/tb_produto_removido
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Procedure instalada pelo backend MySQL; a versão fica no COMMENT da rotina
+REMOVAL_PROCEDURE = "sp_stockflow_remover_produto"
+REMOVAL_PROCEDURE_VERSION = 1
+# Erros do MySQL que impedem a procedure neste servidor (privilégios, binlog
+# sem log_bin_trust_function_creators, sintaxe ou recurso não suportado pela
+# versão); qualquer outro erro ao instalá-la é tratado como falha de conexão
+PROCEDURE_UNSUPPORTED_ERRORS = {1044, 1064, 1142, 1227, 1235, 1370, 1419}
+
+# Colunas preenchidas pelo serviço ou pelo banco, nunca copiadas de tb_produto
+EXCLUDED_COLUMNS = {'id_produto', 'data_retirada', 'responsavel_retirada'}
+
+# Schema do modo local, com as mesmas tabelas e colunas do MySQL
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tb_produto (
+    id_produto INTEGER PRIMARY KEY,
+    store_key TEXT NOT NULL,
+    nome TEXT,
+    peso REAL,
+    grupo TEXT,
+    quantidade INTEGER,
+    conservacao TEXT,
+    data_entrada TEXT,
+    validade TEXT,
+    responsavel_entrada TEXT,
+    preco REAL,
+    unidade_medida TEXT,
+    etiquetas INTEGER,
+    status TEXT,
+    fornecedor TEXT,
+    sif_lote TEXT,
+    val_fornecedor TEXT,
+    fab_fornecedor TEXT,
+    status_impressao TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tb_produto_store ON tb_produto (store_key, data_entrada);
+CREATE TABLE IF NOT EXISTS tb_produto_removido (
+    id_removido INTEGER PRIMARY KEY AUTOINCREMENT,
+    store_key TEXT NOT NULL,
+    nome TEXT,
+    peso REAL,
+    grupo TEXT,
+    quantidade INTEGER,
+    conservacao TEXT,
+    data_entrada TEXT,
+    data_retirada TEXT,
+    validade TEXT,
+    responsavel_entrada TEXT,
+    responsavel_retirada TEXT,
+    preco REAL,
+    unidade_medida TEXT,
+    etiquetas INTEGER,
+    status TEXT,
+    fornecedor TEXT,
+    sif_lote TEXT,
+    val_fornecedor TEXT,
+    fab_fornecedor TEXT,
+    status_impressao TEXT
+);
+"""
+
+
+def product_key(value):
+    """Forma canônica de um id_produto para comparar o lido com o devolvido pelo banco
+
+    Em coluna numérica "0123" é encontrado e devolvido como 123; ids
+    numéricos são comparados sem zeros à esquerda.
+    """
+    text = str(value).strip()
+    if text.isdecimal():
+        return str(int(text))
+    return text
+
+
+def is_generated_column(extra):
+    """Indica, pelo EXTRA de information_schema.COLUMNS, se o MySQL gera o valor da coluna"""
+    extra = (extra or '').lower()
+    return 'auto_increment' in extra or 'virtual generated' in extra or 'stored generated' in extra
+
+
+class StorageError(Exception):
+    """Erro de banco em uma operação; a transação foi desfeita"""
+
+
+class StorageUnavailable(StorageError):
+    """Não foi possível conectar ao banco"""
+
+
+class StorageBackend:
+    """Interface dos backends de armazenamento
+
+    - connect(): abre o acesso ao banco (StorageUnavailable se falhar)
+    - prepare(): preparação opcional na inicialização (schema, procedure)
+    - lookup(ids): conjunto dos ids existentes na loja
+    - move(id, ...): baixa de um produto; False se não existe
+    - move_batch(ids, ...): baixa em uma transação; (movidos, inexistentes)
+    - product_rows(since): (id_produto, data_entrada) para o índice local
+
+    A lógica SQL é comum; cada backend fornece a conexão de cada thread
+    (worker), consultas avulsas (fetch_all), o marcador de parâmetro e a
+    descoberta de colunas. Erros do driver viram StorageError.
+    """
+
+    name = None
+    # Marcador de parâmetro do driver e trava das linhas no SELECT do lote
+    param = '%s'
+    lock_clause = ''
+    # Exceções do driver convertidas em StorageError
+    errors = ()
+
+    def __init__(self, store_key):
+        self.store_key = store_key
+        self.removal_columns = None
+        # SQL de baixa de um produto, montado uma vez junto com as colunas;
+        # os mesmos objetos são reutilizados pelos statements preparados
+        self.move_sql = None
+        self.delete_sql = None
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        # Conexões das threads (tempos por statement) e espera para obtê-las: [quantidade, segundos]
+        self.workers = []
+        self.acquire_stats = [0, 0.0]
+        # Cronômetros por etapa do serviço (profiling.StageTimers), se houver
+        self.stage_timers = None
+
+    # Pontos de extensão de cada backend
+
+    def connect(self):
+        raise NotImplementedError
+
+    def prepare(self):
+        """Preparação na inicialização; por padrão descobre as colunas"""
+        with self.checkout() as worker:
+            self.get_removal_columns(worker)
+
+    def new_worker(self):
+        """Cria a conexão persistente de uma thread"""
+        raise NotImplementedError
+
+    def fetch_all(self, sql, params=()):
+        """Executa uma consulta avulsa e retorna as linhas"""
+        raise NotImplementedError
+
+    def discover_columns(self, worker, table):
+        """Retorna [(coluna, gerada_pelo_banco)] da tabela, em ordem"""
+        raise NotImplementedError
+
+    def db_value(self, value):
+        """Converte valores Python para o driver"""
+        return value
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    # Conexões e estatísticas
+
+    def worker(self):
+        """Conexão persistente da thread atual (criada no primeiro uso)"""
+        worker = getattr(self.local, 'worker', None)
+        if worker is None:
+            worker = self.new_worker()
+            worker.stage_timers = self.stage_timers
+            self.local.worker = worker
+            with self.stats_lock:
+                self.workers.append(worker)
+        return worker
+
+    @contextmanager
+    def checkout(self):
+        """Conexão da thread atual, reconectando se preciso, reservada durante o uso
+
+        A reserva (worker.lock) impede que a verificação de saúde pingue a
+        conexão enquanto a thread dona executa uma transação.
+        """
+        worker = self.worker()
+        with worker.lock:
+            started = time.perf_counter()
+            try:
+                worker.ensure_alive()
+            except self.errors as e:
+                worker.close()
+                raise StorageUnavailable(str(e)) from e
+            elapsed = time.perf_counter() - started
+            with self.stats_lock:
+                self.acquire_stats[0] += 1
+                self.acquire_stats[1] += elapsed
+            if self.stage_timers is not None:
+                self.stage_timers.record('db_acquire', elapsed)
+            yield worker
+
+    # Verificação de saúde
+
+    def ping(self):
+        """Verifica se o servidor responde (StorageUnavailable se não); nada a fazer por padrão"""
+
+    def refresh_workers(self, idle_after=0.0):
+        """Pinga as conexões de worker ociosas há idle_after segundos e reabre só as quebradas
+
+        Conexões em uso pela thread dona são puladas. Retorna quantas foram
+        reabertas; StorageUnavailable se alguma não pôde ser reaberta.
+        """
+        with self.stats_lock:
+            workers = list(self.workers)
+        now = time.monotonic()
+        reopened = 0
+        for worker in workers:
+            if not worker.lock.acquire(blocking=False):
+                continue
+            try:
+                if now - worker.last_used < idle_after:
+                    continue
+                if worker.check():
+                    reopened += 1
+            except self.errors as e:
+                worker.close()
+                raise StorageUnavailable(str(e)) from e
+            finally:
+                worker.lock.release()
+        return reopened
+
+    def check_health(self, idle_after=0.0):
+        """Ping do servidor e das conexões ociosas; retorna quantas conexões foram reabertas"""
+        self.ping()
+        return self.refresh_workers(idle_after)
+
+    def statement_stats(self):
+        """Tempos por statement somados entre as conexões: nome -> [execuções, segundos]"""
+        totals = {}
+        with self.stats_lock:
+            workers = list(self.workers)
+        for worker in workers:
+            for name, (count, seconds) in list(worker.stats.items()):
+                entry = totals.setdefault(name, [0, 0.0])
+                entry[0] += count
+                entry[1] += seconds
+        return totals
+
+    # Schema
+
+    def get_removal_columns(self, worker):
+        """Descobre (uma única vez) as colunas copiadas de tb_produto para tb_produto_removido"""
+        if self.removal_columns is not None:
+            return self.removal_columns
+
+        produto_columns = {name for name, _generated in self.discover_columns(worker, 'tb_produto')}
+        removido_columns = self.discover_columns(worker, 'tb_produto_removido')
+        columns = [
+            name for name, generated in removido_columns
+            if name in produto_columns and name not in EXCLUDED_COLUMNS and not generated
+        ]
+        if not columns:
+            raise StorageError("Não foi possível descobrir as colunas de tb_produto_removido")
+
+        self.set_removal_columns(columns)
+        logger.info(f"Colunas de tb_produto_removido descobertas: {len(columns)}")
+        return columns
+
+    def set_removal_columns(self, columns):
+        """Define as colunas copiadas e monta o SQL de baixa de um produto"""
+        p = self.param
+        self.removal_columns = list(columns)
+        self.move_sql = self.build_move_query(f"id_produto = {p}")
+        self.delete_sql = f"DELETE FROM tb_produto WHERE id_produto = {p} AND store_key = {p}"
+
+    def build_move_query(self, condition):
+        """Monta o INSERT ... SELECT que copia produtos de tb_produto para tb_produto_removido
+
+        Parâmetros: data_retirada, responsavel_retirada, parâmetros de condition, store_key.
+        """
+        columns = ', '.join(self.removal_columns)
+        p = self.param
+        return (
+            f"INSERT INTO tb_produto_removido ({columns}, data_retirada, responsavel_retirada) "
+            f"SELECT {columns}, {p}, {p} FROM tb_produto "
+            f"WHERE {condition} AND store_key = {p}"
+        )
+
+    # Operações
+
+    def lookup(self, product_ids):
+        """Conjunto dos product_ids existentes na loja (na forma de product_key)"""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return set()
+        placeholders = ', '.join([self.param] * len(product_ids))
+        rows = self.fetch_all(
+            f"SELECT id_produto FROM tb_produto WHERE id_produto IN ({placeholders}) AND store_key = {self.param}",
+            (*product_ids, self.store_key)
+        )
+        return {product_key(row[0]) for row in rows}
+
+    def product_rows(self, since=None):
+        """(id_produto, data_entrada) da loja, opcionalmente com data_entrada >= since"""
+        sql = f"SELECT id_produto, data_entrada FROM tb_produto WHERE store_key = {self.param}"
+        params = [self.store_key]
+        if since is not None:
+            sql += f" AND data_entrada >= {self.param}"
+            params.append(since)
+        return self.fetch_all(sql, tuple(params))
+
+    def product_ids(self):
+        """Todos os id_produto da loja"""
+        return [row[0] for row in self.fetch_all(
+            f"SELECT id_produto FROM tb_produto WHERE store_key = {self.param}", (self.store_key,)
+        )]
+
+    def move(self, product_id, removed_at, removed_by, store_key=None):
+        """Copia o produto para tb_produto_removido e o remove; False se não existe
+
+        store_key seleciona a loja (padrão: a do backend).
+        """
+        store_key = store_key or self.store_key
+        with self.checkout() as worker:
+            try:
+                self.get_removal_columns(worker)
+                worker.begin()
+                # Copia o produto no próprio servidor, sem trafegar a linha
+                cursor = worker.execute(
+                    'move',
+                    self.move_sql,
+                    (self.db_value(removed_at), removed_by, product_id, store_key)
+                )
+                if cursor.rowcount <= 0:
+                    worker.rollback()
+                    return False
+
+                # Remove da tabela original
+                worker.execute('delete', self.delete_sql, (product_id, store_key))
+                worker.commit()
+                return True
+            except self.errors as e:
+                worker.rollback()
+                raise StorageError(str(e)) from e
+            except Exception:
+                worker.rollback()
+                raise
+
+    def move_batch(self, product_ids, removed_at, removed_by, assume_existing=False, store_key=None):
+        """Move vários produtos em uma única transação; retorna (movidos, inexistentes)
+
+        Com assume_existing (todos constam no índice local) o SELECT de
+        existência é dispensado; se algum produto já não existir, o lote é
+        refeito identificando cada um.
+        """
+        store_key = store_key or self.store_key
+        with self.checkout() as worker:
+            cursor = None
+            try:
+                self.get_removal_columns(worker)
+                # O tamanho do IN varia a cada lote, então o lote usa cursor de texto
+                cursor = worker.cursor()
+                worker.begin()
+
+                if assume_existing:
+                    if self.move_products(cursor, product_ids, removed_at, removed_by, store_key):
+                        worker.commit()
+                        return list(product_ids), []
+                    worker.rollback()
+                    worker.begin()
+
+                # Trava e identifica apenas os ids existentes (sem trafegar as linhas)
+                placeholders = ', '.join([self.param] * len(product_ids))
+                cursor.execute(
+                    f"SELECT id_produto FROM tb_produto WHERE id_produto IN ({placeholders}) "
+                    f"AND store_key = {self.param}{self.lock_clause}",
+                    (*product_ids, store_key)
+                )
+                existing = {product_key(row[0]) for row in cursor.fetchall()}
+                found = [product_id for product_id in product_ids if product_key(product_id) in existing]
+                missing = [product_id for product_id in product_ids if product_key(product_id) not in existing]
+
+                if not found:
+                    worker.rollback()
+                    return [], missing
+
+                self.move_products(cursor, found, removed_at, removed_by, store_key)
+                worker.commit()
+                return found, missing
+            except self.errors as e:
+                worker.rollback()
+                raise StorageError(str(e)) from e
+            except Exception:
+                worker.rollback()
+                raise
+            finally:
+                if cursor:
+                    cursor.close()
+
+    def move_batch_isolating(self, product_ids, removed_at, removed_by, assume_existing=False, store_key=None):
+        """move_batch que divide ao meio os lotes com erro de banco até isolar os ids que falham
+
+        Retorna (movidos, inexistentes, falhas), com falhas: product_id ->
+        exceção. Sem conexão (StorageUnavailable) os ids restantes falham com
+        ela e a divisão é interrompida.
+        """
+        found, missing, failed = [], [], {}
+        # Lotes ainda a mover; um lote com erro volta como duas metades
+        chunks = [list(product_ids)]
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                chunk_found, chunk_missing = self.move_batch(
+                    chunk, removed_at, removed_by, assume_existing=assume_existing, store_key=store_key
+                )
+            except StorageUnavailable as e:
+                for rest in [chunk] + chunks:
+                    failed.update(dict.fromkeys(rest, e))
+                break
+            except Exception as e:
+                if len(chunk) == 1:
+                    logger.error(f"Erro {self.name} ao mover o produto {chunk[0]}: {e}")
+                    failed[chunk[0]] = e
+                    continue
+                logger.warning(f"Erro {self.name} ao processar lote de {len(chunk)} produtos: {e}. "
+                               f"Dividindo o lote para isolar a falha")
+                middle = len(chunk) // 2
+                chunks += [chunk[middle:], chunk[:middle]]
+                continue
+            found += chunk_found
+            missing += chunk_missing
+        return found, missing, failed
+
+    def move_products(self, cursor, product_ids, removed_at, removed_by, store_key):
+        """Copia e remove os produtos com um INSERT ... SELECT e um DELETE ... IN
+
+        Retorna False (sem executar o DELETE) se alguma linha não foi copiada,
+        isto é, algum produto não existe mais.
+        """
+        placeholders = ', '.join([self.param] * len(product_ids))
+        # Copia todos com um único INSERT ... SELECT
+        cursor.execute(
+            self.build_move_query(f"id_produto IN ({placeholders})"),
+            (self.db_value(removed_at), removed_by, *product_ids, store_key)
+        )
+        if cursor.rowcount != len(product_ids):
+            return False
+
+        # Remove todos de uma vez
+        cursor.execute(
+            f"DELETE FROM tb_produto WHERE id_produto IN ({placeholders}) AND store_key = {self.param}",
+            (*product_ids, store_key)
+        )
+        return True
+
+
+class MySQLStorage(StorageBackend):
+    """Backend MySQL: pool para consultas avulsas e uma conexão persistente
+    por thread de processamento, com statements preparados no servidor"""
+
+    name = 'MySQL'
+    lock_clause = ' FOR UPDATE'
+
+    def __init__(self, db_config, store_key, use_procedure=False, liveness_interval=30, keepalive_idle=0):
+        super().__init__(store_key)
+        # Importação tardia: o modo SQLite não exige o mysql-connector
+        from mysql.connector import Error as MySQLError
+        self.errors = (MySQLError,)
+        self.db_config = db_config
+        self.use_procedure = use_procedure
+        self.liveness_interval = liveness_interval
+        self.keepalive_idle = keepalive_idle
+        self.pool = None
+        # Conexão própria da verificação de saúde, para pingar o servidor
+        self.probe = None
+
+    def connect(self):
+        """Cria o pool na primeira conexão; depois apenas verifica o servidor
+
+        O pool reabre sozinho uma conexão quebrada ao entregá-la, então uma
+        queda do banco não exige recriá-lo.
+        """
+        if self.pool is not None:
+            self.ping()
+            return
+        from mysql.connector import pooling
+        try:
+            self.pool = pooling.MySQLConnectionPool(**self.db_config)
+        except self.errors as e:
+            raise StorageUnavailable(str(e)) from e
+
+    def new_worker(self):
+        from worker_connection import WorkerConnection
+        return WorkerConnection(self.db_config, self.liveness_interval, self.keepalive_idle)
+
+    def ping(self):
+        if self.probe is None:
+            self.probe = self.new_worker()
+        try:
+            self.probe.check()
+        except self.errors as e:
+            self.probe.close()
+            raise StorageUnavailable(str(e)) from e
+
+    def pooled_connection(self):
+        """Conexão do pool para consultas avulsas (fechar após o uso)"""
+        if self.pool is None:
+            raise StorageUnavailable("Pool de conexões não configurado")
+        try:
+            return self.pool.get_connection()
+        except self.errors as e:
+            raise StorageUnavailable(str(e)) from e
+
+    def fetch_all(self, sql, params=()):
+        connection = self.pooled_connection()
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        except self.errors as e:
+            raise StorageError(str(e)) from e
+        finally:
+            if cursor:
+                cursor.close()
+            connection.close()
+
+    def discover_columns(self, worker, table):
+        cursor = worker.connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT COLUMN_NAME, EXTRA FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+                (table,)
+            )
+            # Colunas AUTO_INCREMENT (id_removido) e VIRTUAL/STORED GENERATED são geradas pelo banco;
+            # DEFAULT_GENERATED (DEFAULT com expressão) aceita valor no INSERT
+            return [(name, is_generated_column(extra)) for name, extra in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def prepare(self):
+        """Descobre o schema e instala a procedure de baixa, se configurada
+
+        Sem conexão, StorageUnavailable é propagada e a procedure continua
+        habilitada para a próxima tentativa; só erros de privilégio ou de
+        versão do servidor a desativam.
+        """
+        if self.use_procedure and not self.install_removal_procedure():
+            logger.warning("Procedure indisponível. Usando INSERT ... SELECT")
+            self.use_procedure = False
+        if not self.use_procedure:
+            super().prepare()
+
+    def install_removal_procedure(self):
+        """Instala (ou atualiza) a procedure de baixa se a versão no banco for diferente
+
+        Retorna False se o servidor não permite a procedure; outras falhas do
+        banco viram StorageUnavailable.
+        """
+        cursor = None
+        try:
+            with self.checkout() as worker:
+                columns = ', '.join(self.get_removal_columns(worker))
+                # A versão inclui as colunas para reinstalar após mudanças de schema
+                columns_hash = hashlib.sha1(columns.encode('utf-8')).hexdigest()[:8]
+                version = f"stockflow-leitor v{REMOVAL_PROCEDURE_VERSION} {columns_hash}"
+
+                cursor = worker.connection.cursor()
+                cursor.execute(
+                    "SELECT ROUTINE_COMMENT FROM information_schema.ROUTINES "
+                    "WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_NAME = %s",
+                    (REMOVAL_PROCEDURE,)
+                )
+                row = cursor.fetchone()
+                if row and row[0] == version:
+                    logger.info(f"Procedure {REMOVAL_PROCEDURE} já instalada ({version})")
+                    return True
+
+                cursor.execute(f"DROP PROCEDURE IF EXISTS {REMOVAL_PROCEDURE}")
+                cursor.execute(f"""
+                    CREATE PROCEDURE {REMOVAL_PROCEDURE}(
+                        IN p_id_produto VARCHAR(64),
+                        IN p_store_key VARCHAR(255),
+                        IN p_data_retirada DATETIME,
+                        IN p_responsavel VARCHAR(255)
+                    )
+                    COMMENT '{version}'
+                    BEGIN
+                        DECLARE v_moved INT DEFAULT 0;
+                        INSERT INTO tb_produto_removido ({columns}, data_retirada, responsavel_retirada)
+                            SELECT {columns}, p_data_retirada, p_responsavel FROM tb_produto
+                            WHERE id_produto = p_id_produto AND store_key = p_store_key;
+                        SET v_moved = ROW_COUNT();
+                        IF v_moved > 0 THEN
+                            DELETE FROM tb_produto WHERE id_produto = p_id_produto AND store_key = p_store_key;
+                        END IF;
+                        SELECT v_moved;
+                    END
+                """)
+                logger.info(f"Procedure {REMOVAL_PROCEDURE} instalada ({version})")
+                return True
+
+        except self.errors as e:
+            if getattr(e, 'errno', None) in PROCEDURE_UNSUPPORTED_ERRORS:
+                logger.error(f"Erro ao instalar procedure {REMOVAL_PROCEDURE}: {e}")
+                return False
+            raise StorageUnavailable(str(e)) from e
+        finally:
+            if cursor:
+                cursor.close()
+
+    def move(self, product_id, removed_at, removed_by, store_key=None):
+        if not self.use_procedure:
+            return super().move(product_id, removed_at, removed_by, store_key)
+
+        store_key = store_key or self.store_key
+        # Uma única chamada à procedure instalada
+        with self.checkout() as worker:
+            cursor = None
+            started = time.perf_counter()
+            try:
+                worker.begin()
+                cursor = worker.cursor()
+                cursor.callproc(REMOVAL_PROCEDURE, (product_id, store_key, removed_at, removed_by))
+                moved = 0
+                for result in cursor.stored_results():
+                    moved = result.fetchone()[0]
+                if moved > 0:
+                    worker.commit()
+                    return True
+                worker.rollback()
+                return False
+            except self.errors as e:
+                worker.rollback()
+                raise StorageError(str(e)) from e
+            except Exception:
+                worker.rollback()
+                raise
+            finally:
+                worker.record('procedure', time.perf_counter() - started)
+                if cursor:
+                    cursor.close()
+
+    def close(self):
+        super().close()
+        if self.probe is not None:
+            self.probe.close()
+        self.pool = None
+
+
+class SQLiteConnection:
+    """Conexão SQLite de uma thread, com a interface de WorkerConnection"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.stats = {}
+        self.stage_timers = None
+        self.lock = threading.RLock()
+
+    def ensure_alive(self):
+        if self.connection is None:
+            # Transações explícitas (BEGIN IMMEDIATE) em vez das implícitas do módulo
+            self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def execute(self, name, sql, params):
+        cursor = self.connection.cursor()
+        started = time.perf_counter()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            self.record(name, time.perf_counter() - started)
+        return cursor
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def record(self, name, elapsed):
+        entry = self.stats.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        if self.stage_timers is not None:
+            self.stage_timers.record(f"db_{name}", elapsed)
+
+    def begin(self):
+        # Trava de escrita já no início, como o SELECT ... FOR UPDATE do MySQL
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            self.connection.commit()
+        finally:
+            self.record('commit', time.perf_counter() - started)
+
+    def rollback(self):
+        try:
+            if self.connection is not None and self.connection.in_transaction:
+                self.connection.rollback()
+        except sqlite3.Error:
+            self.close()
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+            self.connection = None
+
+
+class SQLiteStorage(StorageBackend):
+    """Backend SQLite local com o mesmo schema do MySQL"""
+
+    name = 'SQLite'
+    param = '?'
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path, store_key):
+        super().__init__(store_key)
+        self.path = path
+
+    def connect(self):
+        """Abre o banco e cria as tabelas se ainda não existirem"""
+        try:
+            connection = sqlite3.connect(self.path, timeout=30)
+            try:
+                connection.executescript(SQLITE_SCHEMA)
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            raise StorageUnavailable(str(e)) from e
+
+    def new_worker(self):
+        return SQLiteConnection(self.path)
+
+    def refresh_workers(self, idle_after=0.0):
+        """Arquivo local: não há conexão de rede a validar (e a conexão SQLite é da thread dona)"""
+        return 0
+
+    def fetch_all(self, sql, params=()):
+        try:
+            with self.checkout() as worker:
+                return worker.connection.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def discover_columns(self, worker, table):
+        rows = worker.connection.execute(f"PRAGMA table_info({table})").fetchall()
+        # (cid, nome, tipo, notnull, padrão, pk): a chave INTEGER de tb_produto_removido é gerada
+        return [(row[1], bool(row[5]) and table == 'tb_produto_removido') for row in rows]
+
+    def db_value(self, value):
+        if isinstance(value, datetime):
+            # Mesmo formato de um DATETIME do MySQL (hora local, sem fuso)
+            return value.replace(tzinfo=None).isoformat(sep=' ', timespec='seconds')
+        return value
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Múltiplas lojas no Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Um único processo atende várias store_keys: cada leitor é
+associado a uma loja, a fila em memória e o journal/outbox são separados
+por loja e os trabalhos são retirados em rodízio entre as lojas,
+compartilhando as mesmas conexões com o banco
+"""
+
+import os
+import re
+from collections import deque
+
+
+def store_path(path, store_key, default_store):
+    """Arquivo da loja: o da loja padrão é o próprio path; o das demais leva a loja antes da extensão
+
+    jobs.json -> jobs.LOJA2.json (segmentos jobs.LOJA2.journal.NNNNNN),
+    outbox.db -> outbox.LOJA2.db.
+    """
+    if store_key == default_store:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{re.sub(r'[^A-Za-z0-9_-]', '_', str(store_key))}{ext}"
+
+
+class StoreQueues:
+    """Filas em memória por loja, com a interface de deque usada pelo serviço
+
+    take_ready() percorre as lojas em rodízio a partir da seguinte à última
+    atendida, para que o acúmulo de uma loja não atrase as leituras das
+    outras. Com uma única loja equivale a um deque. Não é thread-safe: o
+    serviço a usa sob queue_condition.
+    """
+
+    def __init__(self, default_store=None):
+        self.default_store = default_store
+        self.queues = {}
+        # Lojas na ordem do rodízio; a atendida por último vai para o fim
+        self.order = deque()
+        self.length = 0
+
+    def store_of(self, job):
+        return job.get('store_key') or self.default_store
+
+    def queue_for(self, store_key):
+        queue = self.queues.get(store_key)
+        if queue is None:
+            queue = self.queues[store_key] = deque()
+            self.order.append(store_key)
+        return queue
+
+    def append(self, job):
+        self.queue_for(self.store_of(job)).append(job)
+        self.length += 1
+
+    def extend(self, jobs):
+        for job in jobs:
+            self.append(job)
+
+    def popleft(self):
+        """Retira o próximo trabalho no rodízio das lojas"""
+        job = self.take_ready(lambda job: True)
+        if job is None:
+            raise IndexError('pop from an empty StoreQueues')
+        return job
+
+    def take_ready(self, is_ready):
+        """Retira o primeiro trabalho pronto (is_ready) da próxima loja no rodízio, ou None"""
+        for _ in range(len(self.order)):
+            store_key = self.order[0]
+            self.order.rotate(-1)
+            queue = self.queues[store_key]
+            for index, job in enumerate(queue):
+                if is_ready(job):
+                    del queue[index]
+                    self.length -= 1
+                    return job
+        return None
+
+    def lengths(self):
+        """loja -> trabalhos aguardando"""
+        return {store_key: len(queue) for store_key, queue in self.queues.items()}
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __iter__(self):
+        for queue in list(self.queues.values()):
+            yield from queue
+
+
+class ShardedJournal:
+    """Journal (ou outbox) separado por loja, com a interface de JobJournal
+
+    Cada registro vai para o journal da loja do trabalho (job['store_key']);
+    consultas e contagens somam todas as lojas.
+    """
+
+    def __init__(self, shards, default_store):
+        # loja -> JobJournal ou SQLiteOutbox
+        self.shards = dict(shards)
+        self.default_store = default_store
+
+    def shard(self, job):
+        return self.shards.get(job.get('store_key') or self.default_store, self.shards[self.default_store])
+
+    def load(self):
+        jobs = []
+        for store_key, journal in self.shards.items():
+            jobs += tag_store(journal.load(), store_key)
+        return jobs
+
+    def start(self):
+        for journal in self.shards.values():
+            journal.start()
+
+    def close(self):
+        for journal in self.shards.values():
+            journal.close()
+
+    def append_enqueue(self, job, queue_length=0):
+        return self.shard(job).append_enqueue(job, queue_length)
+
+    def append_enqueue_batch(self, jobs, queue_length=0):
+        """Uma gravação por loja presente no lote; a ordem do resultado segue jobs"""
+        by_store = {}
+        for index, job in enumerate(jobs):
+            store_key = job.get('store_key') or self.default_store
+            by_store.setdefault(store_key if store_key in self.shards else self.default_store, []).append(index)
+        in_memory = [True] * len(jobs)
+        for store_key, indexes in by_store.items():
+            flags = self.shards[store_key].append_enqueue_batch([jobs[index] for index in indexes], queue_length)
+            for index, flag in zip(indexes, flags):
+                in_memory[index] = flag
+        return in_memory
+
+    def append_ack(self, job):
+        self.shard(job).append_ack(job)
+
+    def append_retry(self, job):
+        self.shard(job).append_retry(job)
+
+    def load_more(self, limit):
+        """Próximas páginas do disco, repartindo limit entre as lojas"""
+        share = max(1, limit // len(self.shards))
+        jobs = []
+        for store_key, journal in self.shards.items():
+            if len(jobs) >= limit:
+                break
+            jobs += tag_store(journal.load_more(min(share, limit - len(jobs))), store_key)
+        return jobs
+
+    def has_pending_product(self, product_id):
+        return any(journal.has_pending_product(product_id) for journal in self.shards.values())
+
+    def pending_count(self):
+        return sum(journal.pending_count() for journal in self.shards.values())
+
+    def disk_bytes(self):
+        return sum(journal.disk_bytes() for journal in self.shards.values())
+
+
+def tag_store(jobs, store_key):
+    """Marca a loja nos trabalhos gravados antes do modo multi-loja"""
+    for job in jobs:
+        job.setdefault('store_key', store_key)
+    return jobs
+
+
+def device_matches(device, patterns):
+    """Indica se o leitor corresponde a algum padrão da loja
+
+    Um padrão pode ser o caminho (/dev/input/eventN ou um link de
+    /dev/input/by-id), vendor:product em hexadecimal (05e0:1200) ou parte
+    do nome do dispositivo (sem diferenciar maiúsculas).
+    """
+    path = getattr(device, 'path', '')
+    name = (getattr(device, 'name', '') or '').lower()
+    info = getattr(device, 'info', None)
+    vendor_product = f"{info.vendor:04x}:{info.product:04x}" if info is not None else None
+    for pattern in patterns:
+        pattern = str(pattern)
+        if pattern.startswith('/dev/'):
+            if pattern == path or os.path.realpath(pattern) == path:
+                return True
+        elif pattern.lower() == vendor_product or pattern.lower() in name:
+            return True
+    return False
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conexão persistente de worker do Stockflow QR Reader
+Autor: Sistema Stockflow
+Descrição: Conexão MySQL de longa duração com statements preparados no
+servidor e verificação de vida barata no lugar do reset de sessão do pool
+"""
+
+import socket
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error as MySQLError
+
+# Chaves de configuração exclusivas do pool, ignoradas na conexão direta
+POOL_ONLY_KEYS = ('pool_name', 'pool_size', 'pool_reset_session')
+
+
+def enable_keepalive(connection, idle):
+    """Ativa TCP keepalive no socket da conexão; True se aplicado
+
+    Um servidor que sumiu sem fechar a conexão (queda da máquina ou da rede)
+    é detectado em cerca de 2 * idle segundos, em vez das horas do padrão do
+    kernel. Só o conector puro-Python via TCP expõe o socket.
+    """
+    sock = getattr(getattr(connection, '_socket', None), 'sock', None)
+    if not idle or sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return False
+    interval = max(1, int(idle) // 3)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (('TCP_KEEPIDLE', int(idle)), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', 3)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+    except OSError:
+        return False
+    return True
+
+
+class WorkerConnection:
+    """Conexão dedicada a uma thread de processamento
+
+    Cada statement nomeado é preparado uma única vez por conexão (um cursor
+    preparado por statement) e preparado de novo após uma reconexão. O
+    cursor preparado do mysql-connector compara o SQL por identidade e
+    prepara de novo a cada objeto str diferente, então o SQL guardado junto
+    ao cursor é o mesmo objeto passado a todas as execuções.
+    """
+
+    def __init__(self, db_config, liveness_interval=30, keepalive_idle=0):
+        self.db_config = {k: v for k, v in db_config.items() if k not in POOL_ONLY_KEYS}
+        self.liveness_interval = liveness_interval
+        self.keepalive_idle = keepalive_idle
+        self.connection = None
+        # nome -> (sql, cursor preparado)
+        self.statements = {}
+        self.last_used = 0
+        # Estatísticas por statement: nome -> [execuções, tempo total em segundos]
+        self.stats = {}
+        # Cronômetros por etapa do serviço (profiling.StageTimers), se houver
+        self.stage_timers = None
+        # Reservada pela thread dona durante o uso; a verificação de saúde só pinga se livre
+        self.lock = threading.RLock()
+
+    def connect(self):
+        """Abre a conexão e descarta os statements preparados anteriores"""
+        self.close()
+        self.connection = mysql.connector.connect(**self.db_config)
+        enable_keepalive(self.connection, self.keepalive_idle)
+        self.last_used = time.monotonic()
+
+    def ensure_alive(self):
+        """Garante uma conexão utilizável, com ping apenas após inatividade"""
+        if self.connection is not None and time.monotonic() - self.last_used < self.liveness_interval:
+            return
+        self.check()
+
+    def check(self):
+        """Ping imediato, reabrindo a conexão apenas se estiver quebrada; True se reabriu"""
+        if self.connection is None:
+            self.connect()
+            return True
+
+        try:
+            self.connection.ping(reconnect=False)
+            self.last_used = time.monotonic()
+            return False
+        except MySQLError:
+            self.connect()
+            return True
+
+    def prepared(self, name, sql):
+        """Retorna (sql, cursor) do statement, preparando-o se necessário
+
+        O sql retornado é o objeto guardado na primeira preparação; um SQL de
+        texto diferente (ex.: colunas redescobertas) substitui o statement.
+        """
+        entry = self.statements.get(name)
+        if entry is not None and entry[0] is not sql and entry[0] != sql:
+            try:
+                entry[1].close()
+            except Exception:
+                pass
+            entry = None
+        if entry is None:
+            entry = self.statements[name] = (sql, self.connection.cursor(prepared=True))
+        return entry
+
+    def execute(self, name, sql, params):
+        """Executa um statement preparado e contabiliza seu tempo"""
+        sql, cursor = self.prepared(name, sql)
+        started = time.perf_counter()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            self.record(name, time.perf_counter() - started)
+        return cursor
+
+    def cursor(self):
+        """Cursor de texto para statements de forma variável (lotes)"""
+        return self.connection.cursor()
+
+    def record(self, name, elapsed):
+        """Acumula o tempo de um statement"""
+        entry = self.stats.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        self.last_used = time.monotonic()
+        if self.stage_timers is not None:
+            self.stage_timers.record(f"db_{name}", elapsed)
+
+    def begin(self):
+        """Inicia uma transação
+
+        Com autocommit desligado (o padrão do serviço) o primeiro statement já
+        abre a transação, então o START TRANSACTION seria uma ida a mais.
+        """
+        if self.db_config.get('autocommit', False):
+            self.connection.start_transaction()
+
+    def commit(self):
+        """Confirma a transação atual"""
+        started = time.perf_counter()
+        try:
+            self.connection.commit()
+        finally:
+            self.record('commit', time.perf_counter() - started)
+
+    def rollback(self):
+        """Desfaz a transação; se falhar, força reconexão no próximo uso"""
+        try:
+            self.connection.rollback()
+        except Exception:
+            self.close()
+
+    def close(self):
+        """Fecha cursores preparados e a conexão"""
+        for _sql, cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.statements = {}
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None